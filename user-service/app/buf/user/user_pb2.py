@@ -23,10 +23,12 @@ _sym_db = _symbol_database.Default()
 
 
 from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
+from google.protobuf import duration_pb2 as google_dot_protobuf_dot_duration__pb2
 import buf.validate.validate_pb2 as validate__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\x1a\x1fgoogle/protobuf/timestamp.proto\x1a\x0evalidate.proto\"\xb5\x01\n\x0fRegisterRequest\x12\x18\n\x08group_id\x18\x01 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\x12\x19\n\x05\x65mail\x18\x02 \x01(\tB\n\xbaH\x07r\x02`\x01\xc8\x01\x01\x12*\n\x08password\x18\x03 \x01(\tB\x18\xbaH\x15r\x10\x32\x0e^[a-zA-Z0-9]*$\xc8\x01\x01\x12 \n\nfirst_name\x18\x04 \x01(\tB\x0c\xbaH\tr\x04\x10\x01\x18\x64\xc8\x01\x01\x12\x1f\n\tlast_name\x18\x05 \x01(\tB\x0c\xbaH\tr\x04\x10\x01\x18\x64\xc8\x01\x01\"\xba\x01\n\x04User\x12\x10\n\x08group_id\x18\x01 \x01(\t\x12\n\n\x02id\x18\x02 \x01(\t\x12.\n\ncreated_at\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12.\n\nupdated_at\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\r\n\x05\x65mail\x18\x05 \x01(\t\x12\x12\n\nfirst_name\x18\x06 \x01(\t\x12\x11\n\tlast_name\x18\x07 \x01(\t\"]\n\x0cLoginRequest\x12\x18\n\x08group_id\x18\x01 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\x12\x19\n\x05\x65mail\x18\x02 \x01(\tB\n\xbaH\x07r\x02`\x01\xc8\x01\x01\x12\x18\n\x08password\x18\x04 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\"\x1a\n\tUserToken\x12\r\n\x05token\x18\x01 \x01(\t\"\x0c\n\nGetRequest\"W\n\rUpdateRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x12\n\nfirst_name\x18\x03 \x01(\t\x12\x11\n\tlast_name\x18\x04 \x01(\t\"(\n\nErrorField\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04\x63ode\x18\x02 \x01(\t2\xc2\x01\n\x0bUserService\x12/\n\x08Register\x12\x15.user.RegisterRequest\x1a\n.user.User\"\x00\x12.\n\x05Login\x12\x12.user.LoginRequest\x1a\x0f.user.UserToken\"\x00\x12%\n\x03Get\x12\x10.user.GetRequest\x1a\n.user.User\"\x00\x12+\n\x06Update\x12\x13.user.UpdateRequest\x1a\n.user.User\"\x00\x42:Z8github.com/opensourcemicroservice/userservice/proto;userb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\x1a\x1fgoogle/protobuf/timestamp.proto\x1a google/protobuf/field_mask.proto\x1a\x1egoogle/protobuf/duration.proto\x1a\x0evalidate.proto\"\xb5\x01\n\x0fRegisterRequest\x12\x18\n\x08group_id\x18\x01 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\x12\x19\n\x05\x65mail\x18\x02 \x01(\tB\n\xbaH\x07r\x02`\x01\xc8\x01\x01\x12*\n\x08password\x18\x03 \x01(\tB\x18\xbaH\x15r\x10\x32\x0e^[a-zA-Z0-9]*$\xc8\x01\x01\x12 \n\nfirst_name\x18\x04 \x01(\tB\x0c\xbaH\tr\x04\x10\x01\x18\x64\xc8\x01\x01\x12\x1f\n\tlast_name\x18\x05 \x01(\tB\x0c\xbaH\tr\x04\x10\x01\x18\x64\xc8\x01\x01\"\xed\x01\n\x04User\x12\x10\n\x08group_id\x18\x01 \x01(\t\x12\n\n\x02id\x18\x02 \x01(\t\x12.\n\ncreated_at\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12.\n\nupdated_at\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\r\n\x05\x65mail\x18\x05 \x01(\t\x12\x12\n\nfirst_name\x18\x06 \x01(\t\x12\x11\n\tlast_name\x18\x07 \x01(\t\x12\x31\n\rlast_login_at\x18\x08 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\"]\n\x0cLoginRequest\x12\x18\n\x08group_id\x18\x01 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\x12\x19\n\x05\x65mail\x18\x02 \x01(\tB\n\xbaH\x07r\x02`\x01\xc8\x01\x01\x12\x18\n\x08password\x18\x04 \x01(\tB\x06\xbaH\x03\xc8\x01\x01\"\x1a\n\tUserToken\x12\r\n\x05token\x18\x01 \x01(\t\"n\n\nGetRequest\x12.\n\nfield_mask\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\x12\x30\n\rmax_staleness\x18\x02 \x01(\x0b\x32\x19.google.protobuf.Duration\"W\n\rUpdateRequest\x12\r\n\x05\x65mail\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\x12\x12\n\nfirst_name\x18\x03 \x01(\t\x12\x11\n\tlast_name\x18\x04 \x01(\t\"\x10\n\x0eGetKeysRequest\"\\\n\x03Key\x12\x0b\n\x03kid\x18\x01 \x01(\t\x12\x0b\n\x03kty\x18\x02 \x01(\t\x12\x0b\n\x03\x61lg\x18\x03 \x01(\t\x12\x0b\n\x03\x63rv\x18\x04 \x01(\t\x12\t\n\x01x\x18\x05 \x01(\t\x12\t\n\x01y\x18\x06 \x01(\t\x12\x0b\n\x03use\x18\x07 \x01(\t\":\n\x06KeySet\x12\x17\n\x04keys\x18\x01 \x03(\x0b\x32\t.user.Key\x12\x17\n\x0fmax_age_seconds\x18\x02 \x01(\x05\"%\n\rLogoutRequest\x12\x14\n\x0c\x61ll_sessions\x18\x01 \x01(\x08\"\x10\n\x0eLogoutResponse\"&\n\x0cWatchRequest\x12\x16\n\x03ids\x18\x01 \x03(\tB\t\xbaH\x06\x92\x01\x03\x10\xe8\x07\"(\n\nErrorField\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04\x63ode\x18\x02 \x01(\t2\xd7\x02\n\x0bUserService\x12/\n\x08Register\x12\x15.user.RegisterRequest\x1a\n.user.User\"\x00\x12.\n\x05Login\x12\x12.user.LoginRequest\x1a\x0f.user.UserToken\"\x00\x12%\n\x03Get\x12\x10.user.GetRequest\x1a\n.user.User\"\x00\x12+\n\x06Update\x12\x13.user.UpdateRequest\x1a\n.user.User\"\x00\x12/\n\x07GetKeys\x12\x14.user.GetKeysRequest\x1a\x0c.user.KeySet\"\x00\x12\x35\n\x06Logout\x12\x13.user.LogoutRequest\x1a\x14.user.LogoutResponse\"\x00\x12+\n\x05Watch\x12\x12.user.WatchRequest\x1a\n.user.User\"\x00\x30\x01\x42:Z8github.com/opensourcemicroservice/userservice/proto;userb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -50,20 +52,34 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_LOGINREQUEST'].fields_by_name['email']._serialized_options = b'\272H\007r\002`\001\310\001\001'
   _globals['_LOGINREQUEST'].fields_by_name['password']._loaded_options = None
   _globals['_LOGINREQUEST'].fields_by_name['password']._serialized_options = b'\272H\003\310\001\001'
-  _globals['_REGISTERREQUEST']._serialized_start=70
-  _globals['_REGISTERREQUEST']._serialized_end=251
-  _globals['_USER']._serialized_start=254
-  _globals['_USER']._serialized_end=440
-  _globals['_LOGINREQUEST']._serialized_start=442
-  _globals['_LOGINREQUEST']._serialized_end=535
-  _globals['_USERTOKEN']._serialized_start=537
-  _globals['_USERTOKEN']._serialized_end=563
-  _globals['_GETREQUEST']._serialized_start=565
-  _globals['_GETREQUEST']._serialized_end=577
-  _globals['_UPDATEREQUEST']._serialized_start=579
-  _globals['_UPDATEREQUEST']._serialized_end=666
-  _globals['_ERRORFIELD']._serialized_start=668
-  _globals['_ERRORFIELD']._serialized_end=708
-  _globals['_USERSERVICE']._serialized_start=711
-  _globals['_USERSERVICE']._serialized_end=905
+  _globals['_WATCHREQUEST'].fields_by_name['ids']._loaded_options = None
+  _globals['_WATCHREQUEST'].fields_by_name['ids']._serialized_options = b'\272H\006\222\001\003\020\350\007'
+  _globals['_REGISTERREQUEST']._serialized_start=136
+  _globals['_REGISTERREQUEST']._serialized_end=317
+  _globals['_USER']._serialized_start=320
+  _globals['_USER']._serialized_end=557
+  _globals['_LOGINREQUEST']._serialized_start=559
+  _globals['_LOGINREQUEST']._serialized_end=652
+  _globals['_USERTOKEN']._serialized_start=654
+  _globals['_USERTOKEN']._serialized_end=680
+  _globals['_GETREQUEST']._serialized_start=682
+  _globals['_GETREQUEST']._serialized_end=792
+  _globals['_UPDATEREQUEST']._serialized_start=794
+  _globals['_UPDATEREQUEST']._serialized_end=881
+  _globals['_GETKEYSREQUEST']._serialized_start=883
+  _globals['_GETKEYSREQUEST']._serialized_end=899
+  _globals['_KEY']._serialized_start=901
+  _globals['_KEY']._serialized_end=993
+  _globals['_KEYSET']._serialized_start=995
+  _globals['_KEYSET']._serialized_end=1053
+  _globals['_LOGOUTREQUEST']._serialized_start=1055
+  _globals['_LOGOUTREQUEST']._serialized_end=1092
+  _globals['_LOGOUTRESPONSE']._serialized_start=1094
+  _globals['_LOGOUTRESPONSE']._serialized_end=1110
+  _globals['_WATCHREQUEST']._serialized_start=1112
+  _globals['_WATCHREQUEST']._serialized_end=1150
+  _globals['_ERRORFIELD']._serialized_start=1152
+  _globals['_ERRORFIELD']._serialized_end=1192
+  _globals['_USERSERVICE']._serialized_start=1195
+  _globals['_USERSERVICE']._serialized_end=1538
 # @@protoc_insertion_point(module_scope)
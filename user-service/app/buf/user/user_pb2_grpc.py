@@ -55,6 +55,21 @@ class UserServiceStub(object):
                 request_serializer=user__pb2.UpdateRequest.SerializeToString,
                 response_deserializer=user__pb2.User.FromString,
                 _registered_method=True)
+        self.GetKeys = channel.unary_unary(
+                '/user.UserService/GetKeys',
+                request_serializer=user__pb2.GetKeysRequest.SerializeToString,
+                response_deserializer=user__pb2.KeySet.FromString,
+                _registered_method=True)
+        self.Logout = channel.unary_unary(
+                '/user.UserService/Logout',
+                request_serializer=user__pb2.LogoutRequest.SerializeToString,
+                response_deserializer=user__pb2.LogoutResponse.FromString,
+                _registered_method=True)
+        self.Watch = channel.unary_stream(
+                '/user.UserService/Watch',
+                request_serializer=user__pb2.WatchRequest.SerializeToString,
+                response_deserializer=user__pb2.User.FromString,
+                _registered_method=True)
 
 
 class UserServiceServicer(object):
@@ -89,6 +104,27 @@ class UserServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetKeys(self, request, context):
+        """Publishes the public keys that verify the tokens issued by Login.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Logout(self, request, context):
+        """Revokes the token of the request, or every token of the user.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Watch(self, request, context):
+        """Streams the current User, then every change, of the caller or of the given ids.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_UserServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -112,6 +148,21 @@ def add_UserServiceServicer_to_server(servicer, server):
                     request_deserializer=user__pb2.UpdateRequest.FromString,
                     response_serializer=user__pb2.User.SerializeToString,
             ),
+            'GetKeys': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetKeys,
+                    request_deserializer=user__pb2.GetKeysRequest.FromString,
+                    response_serializer=user__pb2.KeySet.SerializeToString,
+            ),
+            'Logout': grpc.unary_unary_rpc_method_handler(
+                    servicer.Logout,
+                    request_deserializer=user__pb2.LogoutRequest.FromString,
+                    response_serializer=user__pb2.LogoutResponse.SerializeToString,
+            ),
+            'Watch': grpc.unary_stream_rpc_method_handler(
+                    servicer.Watch,
+                    request_deserializer=user__pb2.WatchRequest.FromString,
+                    response_serializer=user__pb2.User.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'user.UserService', rpc_method_handlers)
@@ -231,3 +282,84 @@ class UserService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetKeys(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/GetKeys',
+            user__pb2.GetKeysRequest.SerializeToString,
+            user__pb2.KeySet.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Logout(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/user.UserService/Logout',
+            user__pb2.LogoutRequest.SerializeToString,
+            user__pb2.LogoutResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Watch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/user.UserService/Watch',
+            user__pb2.WatchRequest.SerializeToString,
+            user__pb2.User.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
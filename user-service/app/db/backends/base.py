@@ -0,0 +1,138 @@
+# 2024 amicroservice author.
+
+import abc
+import json
+
+import asyncpg
+
+from db.models.user import UserModel
+
+
+def unique_violation(constraint_name: str) -> asyncpg.UniqueViolationError:
+    """
+    The error Postgres raises for the constraint, every backend raises it alike
+    """
+    error = asyncpg.UniqueViolationError(
+        f'duplicate key value violates unique constraint "{constraint_name}"'
+    )
+    error.constraint_name = constraint_name
+    return error
+
+
+class UserStorage(abc.ABC):
+    """
+    Users as UserService reads and writes them, whatever holds them
+    """
+
+    def ready(self):
+        """
+        Check if the storage is usable
+        """
+
+    @abc.abstractmethod
+    async def create(self, user_model: UserModel, context=None) -> UserModel:
+        """
+        Create, returns the new row, raises unique_violation on the email
+        """
+
+    @abc.abstractmethod
+    async def get_by_groud_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> UserModel:
+        """
+        Retrieve by group_id and email, None if missing
+        """
+
+    @abc.abstractmethod
+    async def get(
+        self, id: str, context=None, fields: tuple = None, group_id: str = None
+    ) -> UserModel:
+        """
+        Retrieve, only the given fields if any, None if missing
+        """
+
+    @abc.abstractmethod
+    async def update(self, user_model: UserModel, context=None):
+        """
+        Update, raises unique_violation on the email
+        """
+
+    @abc.abstractmethod
+    async def record_activity(self, activity: dict):
+        """
+        Move last login and seen times forward, by user id
+        """
+
+
+class GroupRecord:
+    """
+    Group as the service reads it, the group service owns the full model
+    """
+
+    __slots__ = ("id", "properties")
+
+    def __init__(self, id: str, properties: str):
+        self.id = id
+        self.properties = properties  # JSON object
+
+
+class GroupuserRecord:
+    """
+    Invitation of an email to a group, user_id is set once registered
+    """
+
+    __slots__ = ("id", "group_id", "email", "user_id")
+
+    def __init__(self, id: str, group_id: str, email: str, user_id: str = None):
+        self.id = id
+        self.group_id = group_id
+        self.email = email
+        self.user_id = user_id
+
+
+class GroupStorage(abc.ABC):
+    @abc.abstractmethod
+    async def get(self, id: str, context=None) -> GroupRecord:
+        """
+        Retrieve, None if missing
+        """
+
+    @abc.abstractmethod
+    async def add(self, id: str, properties: dict):
+        """
+        Create or replace, for seeding
+        """
+
+
+class GroupuserStorage(abc.ABC):
+    @abc.abstractmethod
+    async def get_by_group_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> GroupuserRecord:
+        """
+        Retrieve by group_id and email, None if missing
+        """
+
+    @abc.abstractmethod
+    async def add(self, group_id: str, email: str, user_id: str = None):
+        """
+        Create or replace, for seeding
+        """
+
+
+async def seed(group_table: GroupStorage, groupuser_table: GroupuserStorage, path: str):
+    """
+    Load groups and invitations from a JSON file
+
+        {"groups": [{"id": "...", "properties": {"invitation_only": true}}],
+         "groupusers": [{"group_id": "...", "email": "..."}]}
+    """
+    with open(path) as file:
+        data = json.load(file)
+
+    for group in data.get("groups", ()):
+        await group_table.add(group["id"], group.get("properties", {}))
+    for groupuser in data.get("groupusers", ()):
+        await groupuser_table.add(
+            groupuser["group_id"], groupuser["email"], groupuser.get("user_id")
+        )
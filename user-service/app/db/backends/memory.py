@@ -0,0 +1,127 @@
+# 2024 amicroservice author.
+
+import datetime
+import json
+import uuid
+
+from db.backends.base import (
+    GroupRecord,
+    GroupStorage,
+    GroupuserRecord,
+    GroupuserStorage,
+    UserStorage,
+    unique_violation,
+)
+from db.models.user import UserModel
+
+
+def _copy(user_model: UserModel, fields: tuple = None) -> UserModel:
+    # Callers change the models they get, the stored ones must not follow
+    if fields:
+        return UserModel.from_columns(
+            {
+                column: getattr(user_model, column)
+                for column in UserModel.COLUMNS
+                if column in fields
+            }
+        )
+    return UserModel.from_record(
+        tuple(getattr(user_model, column) for column in UserModel.COLUMNS)
+    )
+
+
+class MemoryUserTable(UserStorage):
+    """
+    Users in dicts indexed like the table, by id and by (group_id, email)
+
+    Nothing is persisted, for benchmarks of the service without a database.
+    """
+
+    def __init__(self):
+        self._by_id = dict()
+        self._by_email = dict()
+
+    async def create(self, user_model: UserModel, context=None) -> UserModel:
+        key = (str(user_model.group_id), user_model.email)
+        if key in self._by_email:
+            raise unique_violation("users_group_id_email_key")
+
+        row = _copy(user_model)
+        row.id = uuid.uuid4()
+        row.created_at = row.updated_at = datetime.datetime.now()
+
+        self._by_id[str(row.id)] = row
+        self._by_email[key] = row
+        return _copy(row)
+
+    async def get_by_groud_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> UserModel:
+        row = self._by_email.get((str(group_id), email))
+        return _copy(row) if row else None
+
+    async def get(
+        self, id: str, context=None, fields: tuple = None, group_id: str = None
+    ) -> UserModel:
+        row = self._by_id.get(str(id))
+        if row is None or (group_id is not None and str(row.group_id) != str(group_id)):
+            return None
+        return _copy(row, fields)
+
+    async def update(self, user_model: UserModel, context=None):
+        # Only the user of the given group, like the Postgres table
+        row = self._by_id.get(str(user_model.id))
+        if row is None or str(row.group_id) != str(user_model.group_id):
+            return
+
+        key = (str(row.group_id), user_model.email)
+        if self._by_email.get(key, row) is not row:
+            raise unique_violation("users_group_id_email_key")
+
+        del self._by_email[(str(row.group_id), row.email)]
+        row.updated_at = user_model.updated_at
+        row.email = user_model.email
+        row.password_hash = user_model.password_hash
+        row.first_name = user_model.first_name
+        row.last_name = user_model.last_name
+        self._by_email[key] = row
+
+    async def record_activity(self, activity: dict):
+        for id, (group_id, last_login_at, last_seen_at) in activity.items():
+            row = self._by_id.get(str(id))
+            if row is None:
+                continue
+            if last_login_at and (
+                row.last_login_at is None or last_login_at > row.last_login_at
+            ):
+                row.last_login_at = last_login_at
+            if last_seen_at and (
+                row.last_seen_at is None or last_seen_at > row.last_seen_at
+            ):
+                row.last_seen_at = last_seen_at
+
+
+class MemoryGroupTable(GroupStorage):
+    def __init__(self):
+        self._by_id = dict()
+
+    async def get(self, id: str, context=None) -> GroupRecord:
+        return self._by_id.get(str(id))
+
+    async def add(self, id: str, properties: dict):
+        self._by_id[str(id)] = GroupRecord(str(id), json.dumps(properties))
+
+
+class MemoryGroupuserTable(GroupuserStorage):
+    def __init__(self):
+        self._by_email = dict()
+
+    async def get_by_group_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> GroupuserRecord:
+        return self._by_email.get((str(group_id), email))
+
+    async def add(self, group_id: str, email: str, user_id: str = None):
+        self._by_email[(str(group_id), email)] = GroupuserRecord(
+            str(uuid.uuid4()), str(group_id), email, user_id
+        )
@@ -0,0 +1,286 @@
+# 2024 amicroservice author.
+
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import sqlite3
+import uuid
+
+from db.backends.base import (
+    GroupRecord,
+    GroupStorage,
+    GroupuserRecord,
+    GroupuserStorage,
+    UserStorage,
+    unique_violation,
+)
+from db.models.user import UserModel
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id text PRIMARY KEY,
+        created_at text NOT NULL,
+        updated_at text NOT NULL,
+        group_id text NOT NULL,
+        email text NOT NULL,
+        password_hash blob NOT NULL,
+        first_name text NOT NULL,
+        last_name text NOT NULL,
+        last_login_at text,
+        last_seen_at text,
+        CONSTRAINT users_group_id_email_key UNIQUE (group_id, email)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS groups (
+        id text PRIMARY KEY,
+        properties text NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS groupusers (
+        id text NOT NULL,
+        group_id text NOT NULL,
+        email text NOT NULL,
+        user_id text,
+        PRIMARY KEY (group_id, email)
+    )
+    """,
+)
+
+# Timestamps are stored as ISO text, ordered like the times
+_TIMESTAMPS = ("created_at", "updated_at", "last_login_at", "last_seen_at")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open the database file and create the tables, ":memory:" for none
+
+    WAL with synchronous=NORMAL keeps a commit from waiting for fsync.
+    """
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+class SqliteDatabase:
+    """
+    One SQLite connection, its statements run in order on a dedicated thread
+
+    sqlite3 blocks, on the event loop a statement waiting for the disk or the
+    lock of another process would stall every call. One thread keeps the
+    connection on the thread that opened it and serializes its statements.
+    """
+
+    def __init__(self, path: str):
+        # Initialize
+        self.path = path
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite"
+        )
+
+        # Opened at startup, before the loop serves any call
+        self.connection: sqlite3.Connection = self._executor.submit(
+            connect, path
+        ).result()
+
+    async def run(self, function, *args):
+        """
+        Result of function(*args) called on the thread of the connection
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    async def fetchone(self, query: str, parameters: tuple = ()):
+        return await self.run(
+            lambda: self.connection.execute(query, parameters).fetchone()
+        )
+
+    async def execute(self, query: str, parameters: tuple = ()):
+        await self.run(self.connection.execute, query, parameters)
+
+    async def close(self):
+        await self.run(self.connection.close)
+        self._executor.shutdown()
+
+
+def _user(record, columns: tuple = UserModel.COLUMNS) -> UserModel:
+    values = dict(zip(columns, record))
+    for column in _TIMESTAMPS:
+        if values.get(column):
+            values[column] = datetime.datetime.fromisoformat(values[column])
+    if "id" in values:
+        values["id"] = uuid.UUID(values["id"])
+    if "group_id" in values:
+        values["group_id"] = uuid.UUID(values["group_id"])
+
+    if columns == UserModel.COLUMNS:
+        return UserModel.from_record(tuple(values[column] for column in columns))
+    return UserModel.from_columns(values)
+
+
+def _text(value: datetime.datetime) -> str:
+    return value.isoformat() if value else None
+
+
+class SqliteUserTable(UserStorage):
+    """
+    Users in an SQLite file, indexed like the Postgres table
+    """
+
+    COLUMNS = ", ".join(UserModel.COLUMNS)
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    async def create(self, user_model: UserModel, context=None) -> UserModel:
+        now = datetime.datetime.now().isoformat()
+        try:
+            record = await self.database.fetchone(
+                f"""
+                INSERT INTO users (id, created_at, updated_at, group_id, email, password_hash, first_name, last_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING {self.COLUMNS}
+                """,
+                (
+                    str(uuid.uuid4()),
+                    now,
+                    now,
+                    str(user_model.group_id),
+                    user_model.email,
+                    user_model.password_hash,
+                    user_model.first_name,
+                    user_model.last_name,
+                ),
+            )
+        except sqlite3.IntegrityError:
+            raise unique_violation("users_group_id_email_key")
+
+        return _user(record)
+
+    async def get_by_groud_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> UserModel:
+        record = await self.database.fetchone(
+            f"SELECT {self.COLUMNS} FROM users WHERE group_id = ? AND email = ?",
+            (str(group_id), email),
+        )
+        return _user(record) if record else None
+
+    async def get(
+        self, id: str, context=None, fields: tuple = None, group_id: str = None
+    ) -> UserModel:
+        columns = UserModel.COLUMNS
+        if fields:
+            columns = tuple(column for column in UserModel.COLUMNS if column in fields)
+
+        record = await self.database.fetchone(
+            f"""
+            SELECT {", ".join(columns)} FROM users
+            WHERE id = ? AND (? IS NULL OR group_id = ?)
+            """,
+            (str(id), group_id and str(group_id), group_id and str(group_id)),
+        )
+        return _user(record, columns) if record else None
+
+    async def update(self, user_model: UserModel, context=None):
+        try:
+            await self.database.execute(
+                """
+                UPDATE users
+                SET updated_at = ?, email = ?, password_hash = ?, first_name = ?, last_name = ?
+                WHERE id = ? AND group_id = ?
+                """,
+                (
+                    _text(user_model.updated_at),
+                    user_model.email,
+                    user_model.password_hash,
+                    user_model.first_name,
+                    user_model.last_name,
+                    str(user_model.id),
+                    str(user_model.group_id),
+                ),
+            )
+        except sqlite3.IntegrityError:
+            raise unique_violation("users_group_id_email_key")
+
+    async def record_activity(self, activity: dict):
+        rows = [
+            (
+                _text(last_login_at),
+                _text(last_login_at),
+                _text(last_seen_at),
+                _text(last_seen_at),
+                str(id),
+            )
+            for id, (group_id, last_login_at, last_seen_at) in activity.items()
+        ]
+        await self.database.run(self._record_activity, rows)
+
+    def _record_activity(self, rows: list):
+        # One transaction. max() is NULL if either time is, coalesce keeps the other
+        connection = self.database.connection
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                """
+                UPDATE users
+                SET last_login_at = coalesce(max(last_login_at, ?), last_login_at, ?),
+                    last_seen_at = coalesce(max(last_seen_at, ?), last_seen_at, ?)
+                WHERE id = ?
+                """,
+                rows,
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+
+class SqliteGroupTable(GroupStorage):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    async def get(self, id: str, context=None) -> GroupRecord:
+        record = await self.database.fetchone(
+            "SELECT id, properties FROM groups WHERE id = ?", (str(id),)
+        )
+        return GroupRecord(*record) if record else None
+
+    async def add(self, id: str, properties: dict):
+        await self.database.execute(
+            "INSERT OR REPLACE INTO groups (id, properties) VALUES (?, ?)",
+            (str(id), json.dumps(properties)),
+        )
+
+
+class SqliteGroupuserTable(GroupuserStorage):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    async def get_by_group_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> GroupuserRecord:
+        record = await self.database.fetchone(
+            """
+            SELECT id, group_id, email, user_id FROM groupusers
+            WHERE group_id = ? AND email = ?
+            """,
+            (str(group_id), email),
+        )
+        return GroupuserRecord(*record) if record else None
+
+    async def add(self, group_id: str, email: str, user_id: str = None):
+        await self.database.execute(
+            """
+            INSERT OR REPLACE INTO groupusers (id, group_id, email, user_id)
+            VALUES (?, ?, ?, ?)
+            """,
+            (str(uuid.uuid4()), str(group_id), email, user_id),
+        )
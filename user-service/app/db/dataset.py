@@ -0,0 +1,327 @@
+# 2024 amicroservice author.
+
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+
+import asyncpg
+import bcrypt
+
+from db.shards import ShardRouter, parse_shards
+from utils.logger import Logger
+
+USER_COLUMNS = ("id", "group_id", "email", "password_hash", "first_name", "last_name")
+GROUP_COLUMNS = ("id", "name", "domain", "properties")
+GROUPUSER_COLUMNS = ("id", "group_id", "email", "user_id")
+
+FIRST_NAMES = (
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Lisa", "Matthew", "Nancy",
+)  # fmt: skip
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
+)  # fmt: skip
+
+
+def passwords(count: int, rounds: int) -> list:
+    """
+    (password, hash) pairs shared by all users
+
+    bcrypt is slow on purpose, one hash per user would take hours. Logins
+    still pay the full cost, the users only share a few passwords.
+    """
+    pairs = []
+    for index in range(count):
+        password = f"Password{index:04d}"
+        pairs.append(
+            (password, bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)))
+        )
+    return pairs
+
+
+def groups(count: int, invitation_only: float, seed: int) -> list:
+    """
+    (id, name, domain, properties) of each group, the same for the same seed
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        properties = {"invitation_only": rng.random() < invitation_only}
+        rows.append(
+            (
+                uuid.UUID(int=rng.getrandbits(128), version=4),
+                f"Group {index}",
+                f"group{index}.example.com",
+                json.dumps(properties),
+            )
+        )
+    return rows
+
+
+def seeded_uuid(seed: int, kind: str, index: int) -> uuid.UUID:
+    """
+    Random looking uuid of the index, the same for the same seed
+
+    Users are generated by several processes, each id is drawn from its own
+    index so the dataset does not depend on --jobs or --batch-size.
+    """
+    digest = hashlib.blake2b(f"{seed}:{kind}:{index}".encode(), digest_size=16)
+    return uuid.UUID(int=int.from_bytes(digest.digest(), "big"), version=4)
+
+
+def invitations(group_rows: list, pending: int, seed: int) -> list:
+    """
+    (id, group_id, email, user_id) of invited emails not registered yet
+    """
+    rows = []
+    for group, row in enumerate(group_rows):
+        if not json.loads(row[3])["invitation_only"]:
+            continue
+        for index in range(pending):
+            rows.append(
+                (
+                    seeded_uuid(seed, "invitation", group * pending + index),
+                    row[0],
+                    f"invite{index}@{row[2]}",
+                    None,
+                )
+            )
+    return rows
+
+
+def _copy_users(job: dict) -> int:
+    # Runs in a worker process, each copies its own range of users
+    return asyncio.run(_copy_range(**job))
+
+
+async def _copy_range(
+    dsns: list,
+    main: int,
+    group_rows: list,
+    group_dsns: list,
+    pairs: list,
+    start: int,
+    stop: int,
+    batch_size: int,
+    credentials: str,
+    groupusers_table: str,
+    seed: int,
+) -> int:
+    # One connection per database, commits do not wait for the disk
+    connections = []
+    try:
+        for dsn in dsns:
+            connection = await asyncpg.connect(dsn)
+            connections.append(connection)
+            await connection.execute("SET synchronous_commit = off")
+
+        invited = [json.loads(row[3])["invitation_only"] for row in group_rows]
+        with open(credentials, "w") as file:
+            for first in range(start, stop, batch_size):
+                users = [[] for _ in dsns]
+                groupusers = []
+                lines = []
+                for index in range(first, min(first + batch_size, stop)):
+                    group = index % len(group_rows)
+                    group_id = group_rows[group][0]
+                    email = f"user{index}@{group_rows[group][2]}"
+                    password, password_hash = pairs[index % len(pairs)]
+                    id = seeded_uuid(seed, "user", index)
+
+                    users[group_dsns[group]].append(
+                        (
+                            id,
+                            group_id,
+                            email,
+                            password_hash,
+                            FIRST_NAMES[index % len(FIRST_NAMES)],
+                            LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)],
+                        )
+                    )
+                    if groupusers_table and invited[group]:
+                        groupusers.append(
+                            (seeded_uuid(seed, "groupuser", index), group_id, email, id)
+                        )
+                    lines.append(f"{group_id},{email},{password},1\n")
+
+                for connection, rows in zip(connections, users):
+                    if rows:
+                        await connection.copy_records_to_table(
+                            "users", records=rows, columns=USER_COLUMNS
+                        )
+                if groupusers:
+                    await connections[main].copy_records_to_table(
+                        groupusers_table, records=groupusers, columns=GROUPUSER_COLUMNS
+                    )
+                file.writelines(lines)
+    finally:
+        for connection in connections:
+            await connection.close()
+
+    return stop - start
+
+
+async def generate(logger: Logger, args) -> int:
+    """
+    Load groups, invitations and users, and write their credentials
+
+    Users are streamed with COPY from several processes, the credentials
+    file lists group_id,email,password,registered for the load generator.
+    Registered users can log in, the others are invited and can register.
+    """
+    if args.seed_file and args.users > 0:
+        # Users only go to Postgres, their credentials would not log in to
+        # a memory or sqlite storage loaded from the seed file
+        raise ValueError("--seed-file holds no users, use it with --users 0")
+
+    dsn = os.getenv("DSN")
+    shards = parse_shards(os.getenv("SHARDS", ""))
+
+    # Users go to the shard of their group, groups stay on the main database
+    dsns = list(dict.fromkeys([dsn, *shards.values()]))
+    main = dsns.index(dsn)
+
+    pairs = passwords(args.passwords, args.rounds)
+    group_rows = groups(args.groups, args.invitation_only, args.seed)
+    if shards:
+        router = ShardRouter(logger, None, shards)
+        group_dsns = [dsns.index(shards[router.shard(row[0])]) for row in group_rows]
+    else:
+        group_dsns = [main] * len(group_rows)
+
+    # Invited emails not registered yet, for load tests of Register
+    pending = invitations(group_rows, args.pending, args.seed)
+
+    if not args.no_groups:
+        connection = await asyncpg.connect(dsn)
+        try:
+            await connection.copy_records_to_table(
+                args.groups_table, records=group_rows, columns=GROUP_COLUMNS
+            )
+            await connection.copy_records_to_table(
+                args.groupusers_table, records=pending, columns=GROUPUSER_COLUMNS
+            )
+        except asyncpg.PostgresError as e:
+            logger.error(f"{__name__}: Error loading groups - {e}")
+            raise e
+        finally:
+            await connection.close()
+
+    if args.seed_file:
+        # Groups and invitations for STORAGE=memory or sqlite:<path>
+        with open(args.seed_file, "w") as file:
+            json.dump(
+                {
+                    "groups": [
+                        {"id": str(row[0]), "properties": json.loads(row[3])}
+                        for row in group_rows
+                    ],
+                    "groupusers": [
+                        {"group_id": str(row[1]), "email": row[2]} for row in pending
+                    ],
+                },
+                file,
+            )
+
+    # Even ranges of users, one per process
+    jobs = min(args.jobs, args.users)
+    parts = [f"{args.credentials}.{job}" for job in range(jobs)]
+    copied = []
+    if jobs:
+        bounds = [args.users * job // jobs for job in range(jobs + 1)]
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            copied = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        executor,
+                        _copy_users,
+                        dict(
+                            dsns=dsns,
+                            main=main,
+                            group_rows=group_rows,
+                            group_dsns=group_dsns,
+                            pairs=pairs,
+                            start=bounds[job],
+                            stop=bounds[job + 1],
+                            batch_size=args.batch_size,
+                            credentials=parts[job],
+                            groupusers_table=(
+                                None if args.no_groups else args.groupusers_table
+                            ),
+                            seed=args.seed,
+                        ),
+                    )
+                    for job in range(jobs)
+                )
+            )
+
+    with open(args.credentials, "w") as file:
+        file.write("group_id,email,password,registered\n")
+        password = pairs[0][0]
+        file.writelines(f"{row[1]},{row[2]},{password},0\n" for row in pending)
+        for part in parts:
+            with open(part) as source:
+                shutil.copyfileobj(source, file)
+            os.remove(part)
+
+    # Fresh statistics, or the first queries plan for empty tables. Nothing
+    # loaded needs no database, for --users 0 --no-groups --seed-file
+    for database_dsn in dsns:
+        tables = ["users"] if args.users else []
+        if database_dsn == dsn and not args.no_groups:
+            tables.append(args.groupusers_table)
+        if not tables:
+            continue
+
+        connection = await asyncpg.connect(database_dsn)
+        try:
+            for table in tables:
+                await connection.execute(f"ANALYZE {table}")
+        finally:
+            await connection.close()
+
+    return sum(copied)
+
+
+async def _main(args):
+    logger = Logger(name="dataset")
+
+    started = time.monotonic()
+    users = await generate(logger, args)
+    elapsed = time.monotonic() - started
+    print(
+        f"{users} users in {args.groups} groups loaded in {elapsed:.1f}s "
+        f"({users / elapsed:.0f} users/s), credentials in {args.credentials}"
+    )
+
+
+# Load test fixture: `python -m db.dataset --users 10000000 --groups 10000`
+# with DSN and SHARDS set, on a migrated database without these users
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--invitation-only", type=float, default=0.3)
+    parser.add_argument("--pending", type=int, default=10)
+    parser.add_argument("--passwords", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--credentials", default="credentials.csv")
+    parser.add_argument("--seed-file")
+    parser.add_argument("--groups-table", default="groups")
+    parser.add_argument("--groupusers-table", default="groupusers")
+    parser.add_argument("--no-groups", action="store_true")
+    asyncio.run(_main(parser.parse_args()))
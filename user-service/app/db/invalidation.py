@@ -0,0 +1,178 @@
+# 2024 amicroservice author.
+
+import asyncio
+import json
+from array import array
+
+import asyncpg
+
+from utils.logger import Logger
+
+
+class InvalidationBus:
+    """
+    Change events between servers over Postgres LISTEN/NOTIFY
+
+    Writers publish within their transaction, so an event is delivered only on
+    commit. Each server listens on a dedicated connection outside the pool, one
+    per database that publishes. Events sent while a connection is down are
+    lost, so after a reconnect the epoch is bumped and every subscriber is
+    told to drop everything.
+
+    Every event also bumps the generation of its key. A cache filled from a
+    read compares the generation taken before the read with the one after,
+    and skips the fill if an event for the key arrived in between.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        dsns: tuple,
+        channel: str = "invalidation",
+        slots: int = 65536,
+        keepalive: float = 30.0,
+        max_reconnect_delay: float = 30.0,
+    ):
+        # Initialize
+        self.logger = logger
+        self.dsns = tuple(dict.fromkeys(dsns))
+        self.channel = channel
+        self.keepalive = keepalive  # Seconds between two liveness checks
+        self.max_reconnect_delay = max_reconnect_delay
+
+        # Kind to the callbacks of (key, data), both None to drop everything
+        self._subscribers = dict()
+
+        # Generations by hashed key, collisions only cost a skipped cache fill
+        self.epoch = 0
+        self._generations = array("Q", bytes(8 * slots))
+
+        # Listening connection, lost event and watch task by DSN
+        self._connections = dict()
+        self._lost = {dsn: asyncio.Event() for dsn in self.dsns}
+        self._tasks = []
+
+    def subscribe(self, kind: str, callback):
+        self._subscribers.setdefault(kind, []).append(callback)
+
+    def generation(self, kind: str, key) -> tuple:
+        """
+        Opaque version of the key, changes with every event and reconnect
+        """
+        return (self.epoch, self._generations[self._slot(kind, key)])
+
+    async def publish(self, connection, kind: str, key, **data):
+        """
+        Send an event on the connection, delivered when its transaction commits
+        """
+        await connection.execute(
+            "SELECT pg_notify($1, $2)",
+            self.channel,
+            json.dumps({"kind": kind, "key": key, **data}),
+        )
+
+    async def publish_many(self, connection, kind: str, keys: list):
+        """
+        Send one event per key with a single statement
+        """
+        await connection.execute(
+            "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+            self.channel,
+            [json.dumps({"kind": kind, "key": key}) for key in keys],
+        )
+
+    async def setup(self):
+        loop = asyncio.get_running_loop()
+        for dsn in self.dsns:
+            await self._connect(dsn)
+            self._tasks.append(loop.create_task(self._watch(dsn)))
+
+        self.logger.info(
+            f"{__name__}: Listening on channel {self.channel} of {len(self.dsns)} databases"
+        )
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+        for connection in self._connections.values():
+            if not connection.is_closed():
+                await connection.close()
+        self._connections = dict()
+
+    async def _connect(self, dsn: str):
+        lost = self._lost[dsn]
+        lost.clear()
+        connection = await asyncpg.connect(dsn=dsn)
+        connection.add_termination_listener(lambda _: lost.set())
+        await connection.add_listener(self.channel, self._notified)
+        self._connections[dsn] = connection
+
+    async def _watch(self, dsn: str):
+        while True:
+            # Wait for a closed connection, or check a silent one is alive
+            try:
+                await asyncio.wait_for(self._lost[dsn].wait(), timeout=self.keepalive)
+            except asyncio.TimeoutError:
+                connection = self._connections[dsn]
+                try:
+                    await connection.execute("SELECT 1", timeout=self.keepalive)
+                    continue
+                except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                    self.logger.error(f"{__name__}: Listener is not responding - {e}")
+                    connection.terminate()
+
+            await self._reconnect(dsn)
+
+    async def _reconnect(self, dsn: str):
+        delay = 0.5
+        while True:
+            try:
+                await self._connect(dsn)
+                break
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                self.logger.error(
+                    f"{__name__}: Error reconnecting the listener, retry in {delay}s - {e}"
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+        # Events may have been missed while disconnected
+        self.epoch += 1
+        for callbacks in self._subscribers.values():
+            for callback in callbacks:
+                self._call(callback, None, None)
+
+        self.logger.info(f"{__name__}: Listener reconnected, caches dropped")
+
+    def _notified(self, connection, pid: int, channel: str, payload: str):
+        try:
+            data = json.loads(payload)
+            kind = data.pop("kind")
+            key = data.pop("key")
+        except (ValueError, KeyError) as e:
+            self.logger.error(f"{__name__}: Invalid event {payload!r} - {e}")
+            return
+
+        # JSON turns tuple keys into lists
+        if isinstance(key, list):
+            key = tuple(key)
+
+        self._generations[self._slot(kind, key)] += 1
+        for callback in self._subscribers.get(kind, ()):
+            self._call(callback, key, data)
+
+    def _call(self, callback, key, data):
+        # A failing subscriber must not stop the others
+        try:
+            callback(key, data)
+        except Exception as e:
+            self.logger.error(f"{__name__}: Error handling event - {e}")
+
+    def _slot(self, kind: str, key) -> int:
+        return hash((kind, key)) % len(self._generations)
@@ -6,11 +6,30 @@ import bcrypt
 
 
 class UserModel:
+    # Columns of a user row, in the order from_record expects them
+    COLUMNS = (
+        "id",
+        "created_at",
+        "updated_at",
+        "group_id",
+        "email",
+        "password_hash",
+        "first_name",
+        "last_name",
+        "last_login_at",
+        "last_seen_at",
+    )
+
+    # No per-instance __dict__, cached users stay small
+    __slots__ = COLUMNS
+
     def __init__(self, group_id: str,  email: str, first_name: str, last_name: str, password=None):
         # Initialize a new User instance with provided details
         self.id = None  # Unique identifier for the user (can be set later)
         self.created_at = None  # Timestamp of when the user was created
         self.updated_at = None  # Timestamp of the last update to the user
+        self.last_login_at = None  # Timestamp of the last successful login
+        self.last_seen_at = None  # Timestamp of the last authorized call
 
         # User's basic information
         self.group_id = group_id
@@ -21,6 +40,34 @@ class UserModel:
         # Store the hashed password if provided, otherwise set to None
         self.password_hash = self._hash_password(password) if password else None
 
+    @classmethod
+    def from_record(cls, record) -> "UserModel":
+        """Build from a row selected in COLUMNS order, without running __init__."""
+        user_model = cls.__new__(cls)
+        (
+            user_model.id,
+            user_model.created_at,
+            user_model.updated_at,
+            user_model.group_id,
+            user_model.email,
+            user_model.password_hash,
+            user_model.first_name,
+            user_model.last_name,
+            user_model.last_login_at,
+            user_model.last_seen_at,
+        ) = record
+        return user_model
+
+    @classmethod
+    def from_columns(cls, record) -> "UserModel":
+        """Build from a row holding a subset of COLUMNS, the rest is None."""
+        user_model = cls.__new__(cls)
+        for column in cls.COLUMNS:
+            setattr(user_model, column, None)
+        for column, value in record.items():
+            setattr(user_model, column, value)
+        return user_model
+
     def _hash_password(self, password):
         """Securely hash the password using bcrypt."""
         if password:
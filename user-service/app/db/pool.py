@@ -1,8 +1,122 @@
 # 2024 amicroservice author.
 
+import asyncio
+import contextlib
+import re
+import time
+from typing import Optional
+
 import asyncpg
 
 from utils.logger import Logger
+from utils.tracing import Tracer
+
+
+class TracedConnection:
+    """
+    Connection wrapper that records every statement in the tracer
+    """
+
+    _VERB = re.compile(r"^\s*(\w+)")
+    _TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|COPY)\s+(\w+)", re.IGNORECASE)
+
+    def __init__(self, connection, tracer: Tracer, pool_wait: float):
+        self._connection = connection
+        self._tracer = tracer
+        self._pool_wait = pool_wait
+
+    def __getattr__(self, name):
+        # Everything else (transaction, copy, ...) goes to the real connection
+        return getattr(self._connection, name)
+
+    async def execute(self, query: str, *args, timeout: float = None) -> str:
+        return await self._traced(
+            lambda: self._connection.execute(query, *args, timeout=timeout),
+            query,
+            args,
+            self._status_rows,
+        )
+
+    async def executemany(self, query: str, args, *, timeout: float = None):
+        args = list(args)
+        return await self._traced(
+            lambda: self._connection.executemany(query, args, timeout=timeout),
+            query,
+            (),
+            lambda result: len(args),
+        )
+
+    async def fetch(self, query: str, *args, timeout: float = None) -> list:
+        return await self._traced(
+            lambda: self._connection.fetch(query, *args, timeout=timeout),
+            query,
+            args,
+            len,
+        )
+
+    async def fetchrow(self, query: str, *args, timeout: float = None):
+        return await self._traced(
+            lambda: self._connection.fetchrow(query, *args, timeout=timeout),
+            query,
+            args,
+            lambda record: 0 if record is None else 1,
+        )
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout=None):
+        return await self._traced(
+            lambda: self._connection.fetchval(
+                query, *args, column=column, timeout=timeout
+            ),
+            query,
+            args,
+            lambda value: 0 if value is None else 1,
+        )
+
+    async def _traced(self, call, query: str, args: tuple, rows):
+        # The pool wait is charged to the first statement on the connection
+        pool_wait, self._pool_wait = self._pool_wait, 0.0
+
+        start_ns = time.time_ns()
+        try:
+            result = await call()
+        except BaseException as e:
+            self._tracer.query(
+                self._name(query),
+                query,
+                args,
+                start_ns,
+                time.time_ns(),
+                pool_wait=pool_wait,
+                error=type(e).__name__,
+            )
+            raise
+
+        self._tracer.query(
+            self._name(query),
+            query,
+            args,
+            start_ns,
+            time.time_ns(),
+            rows=rows(result),
+            pool_wait=pool_wait,
+        )
+        return result
+
+    def _name(self, query: str) -> str:
+        """
+        Short statement name such as "SELECT users"
+        """
+        verb = self._VERB.search(query)
+        table = self._TABLE.search(query)
+        name = verb.group(1).upper() if verb else "QUERY"
+        return f"{name} {table.group(1)}" if table else name
+
+    def _status_rows(self, status: str) -> int:
+        # Command tags look like "INSERT 0 1" or "UPDATE 3"
+        try:
+            return int(status.rsplit(" ", 1)[-1])
+        except (AttributeError, ValueError):
+            return None
 
 
 class Database:
@@ -10,10 +124,11 @@ class Database:
     Implement Pool database
     """
 
-    def __init__(self, logger: Logger, dsn: str):
+    def __init__(self, logger: Logger, dsn: str, tracer: Tracer = None):
         # Initialize
         self.logger = logger
         self.dsn = dsn
+        self.tracer = tracer
         self.pool: asyncpg.pool.Pool = None
 
     async def setup(self):
@@ -26,6 +141,40 @@ class Database:
             self.logger.critical(f"{__name__}: Error connecting to database: {e}")
             raise e
 
+    def timeout(self, context=None) -> Optional[float]:
+        """
+        Remaining gRPC deadline of the context in seconds, None if unbounded
+
+        Raises asyncio.TimeoutError once the deadline has passed, answered
+        with DEADLINE_EXCEEDED by the DeadlineInterceptor.
+        """
+        if context is None:
+            return None
+
+        remaining = context.time_remaining()
+        if remaining is None:
+            return None
+
+        # The caller has already given up, do not touch the pool
+        if remaining <= 0:
+            raise asyncio.TimeoutError("Deadline of the gRPC call is exceeded")
+
+        return remaining
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, context=None):
+        """
+        Acquire a connection within the deadline of the context, traced if enabled
+        """
+        start = time.monotonic()
+        async with self.pool.acquire(timeout=self.timeout(context)) as connection:
+            if self.tracer:
+                yield TracedConnection(
+                    connection, self.tracer, time.monotonic() - start
+                )
+            else:
+                yield connection
+
     async def close(self):
         if self.pool:
             await self.pool.close()
@@ -0,0 +1,351 @@
+# 2024 amicroservice author.
+
+import argparse
+import asyncio
+import datetime
+import os
+import time
+
+import asyncpg
+
+from db.models.user import UserModel
+from db.pool import Database
+from db.shards import parse_shards
+from utils.logger import Logger
+
+# Any constant, taken while migrating so starting servers do not race
+MIGRATION_LOCK = 7_150_044
+
+# Copied by name, a table created by hand may order its columns differently
+USER_COLUMNS = ", ".join(UserModel.COLUMNS)
+
+
+def users_statements(table: str, partitions: int) -> list:
+    """
+    Statements creating a users table hash-partitioned on group_id
+
+    Unique keys of a partitioned table must hold the partition key, so the
+    primary key is (group_id, id). Lookups by id alone use a plain index on
+    every partition, with group_id they are pruned to one partition. Small
+    partitions keep each index and vacuum run small, the fillfactor leaves
+    room for HOT updates that do not touch the indexes.
+    """
+    statements = [
+        f"""
+        CREATE TABLE {table} (
+            id uuid NOT NULL DEFAULT gen_random_uuid(),
+            created_at timestamp NOT NULL DEFAULT localtimestamp,
+            updated_at timestamp NOT NULL DEFAULT localtimestamp,
+            group_id uuid NOT NULL,
+            email text NOT NULL,
+            password_hash bytea NOT NULL,
+            first_name text NOT NULL,
+            last_name text NOT NULL,
+            CONSTRAINT {table}_pkey PRIMARY KEY (group_id, id),
+            CONSTRAINT {table}_group_id_email_key UNIQUE (group_id, email)
+        ) PARTITION BY HASH (group_id)
+        """,
+        f"CREATE INDEX {table}_id_idx ON {table} (id)",
+    ]
+    for remainder in range(partitions):
+        statements.append(
+            f"""
+            CREATE TABLE {table}_p{remainder} PARTITION OF {table}
+            FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})
+            WITH (
+                fillfactor = 90,
+                autovacuum_vacuum_scale_factor = 0.02,
+                autovacuum_analyze_scale_factor = 0.02
+            )
+            """
+        )
+    return statements
+
+
+def activity_statements(table: str) -> list:
+    """
+    Statements adding the activity columns, written behind by ActivityTracker
+
+    Neither column is indexed, so their updates stay HOT.
+    """
+    return [
+        f"""
+        ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS last_login_at timestamp,
+            ADD COLUMN IF NOT EXISTS last_seen_at timestamp
+        """
+    ]
+
+
+def migrations(partitions: int) -> list:
+    """
+    Versioned schema changes in order, never edit one that has shipped
+    """
+    return [
+        (1, "users", users_statements("users", partitions)),
+        (
+            2,
+            "token_revocations",
+            [
+                """
+                CREATE TABLE token_revocations (
+                    seq bigserial PRIMARY KEY,
+                    jti text,
+                    user_id uuid NOT NULL,
+                    not_before timestamptz,
+                    expires_at timestamptz NOT NULL,
+                    revoked_at timestamptz NOT NULL DEFAULT now()
+                )
+                """,
+                "CREATE INDEX token_revocations_revoked_at_idx "
+                "ON token_revocations (revoked_at)",
+            ],
+        ),
+        (
+            3,
+            "group_shards",
+            [
+                """
+                CREATE TABLE group_shards (
+                    group_id uuid PRIMARY KEY,
+                    shard text NOT NULL,
+                    frozen boolean NOT NULL DEFAULT false
+                )
+                """
+            ],
+        ),
+        # Not a table, so never skipped as existing, the statement is idempotent
+        (4, "users_activity", activity_statements("users")),
+        (
+            5,
+            "audit_events",
+            [
+                """
+                CREATE TABLE audit_events (
+                    occurred_at timestamptz NOT NULL,
+                    event text NOT NULL,
+                    outcome text NOT NULL,
+                    detail text,
+                    group_id text,
+                    user_id uuid,
+                    email text,
+                    peer text
+                ) PARTITION BY RANGE (occurred_at)
+                """,
+                "CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT",
+                "CREATE INDEX audit_events_user_id_idx "
+                "ON audit_events (user_id, occurred_at)",
+            ],
+        ),
+    ]
+
+
+async def migrate(logger: Logger, database: Database, partitions: int = 16) -> int:
+    """
+    Apply the migrations the database has not seen, returns how many
+
+    A users table created before the migrations is left as it is and
+    recorded as applied, partition_users converts it.
+    """
+    applied = 0
+    async with database.acquire() as connection:
+        await connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK)
+        try:
+            await connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version integer PRIMARY KEY,
+                    name text NOT NULL,
+                    applied_at timestamptz NOT NULL DEFAULT now()
+                )
+                """
+            )
+            done = {
+                record["version"]
+                for record in await connection.fetch(
+                    "SELECT version FROM schema_migrations"
+                )
+            }
+
+            for version, name, statements in migrations(partitions):
+                if version in done:
+                    continue
+
+                async with connection.transaction():
+                    exists = await connection.fetchval(
+                        "SELECT to_regclass($1) IS NOT NULL", name
+                    )
+                    if exists:
+                        logger.warning(
+                            f"{__name__}: Table {name} already exists, recorded as migration {version}"
+                        )
+                    else:
+                        for statement in statements:
+                            await connection.execute(statement)
+                        applied += 1
+
+                    await connection.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+                        version,
+                        name,
+                    )
+
+        except asyncpg.PostgresError as e:
+            logger.error(f"{__name__}: Error migrating the schema - {e}")
+            raise e
+        finally:
+            await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK)
+
+    if applied:
+        logger.info(f"{__name__}: Applied {applied} migrations")
+    return applied
+
+
+async def partition_users(
+    logger: Logger,
+    database: Database,
+    partitions: int = 16,
+    batch_size: int = 10000,
+):
+    """
+    Convert an unpartitioned users table into the partitioned layout online
+
+    Rows are copied in batches by id while the service keeps running, then
+    the table is locked for the time of recopying the rows changed since and
+    swapping the names. The old table is kept as users_unpartitioned.
+    """
+    async with database.acquire() as connection:
+        kind = await connection.fetchval(
+            "SELECT relkind::text FROM pg_class WHERE oid = to_regclass('users')"
+        )
+        if kind != "r":
+            logger.info(f"{__name__}: Table users is not a plain table, nothing to do")
+            return
+
+        # The servers set updated_at with their own clock, recopy with a margin
+        started = await connection.fetchval(
+            "SELECT localtimestamp"
+        ) - datetime.timedelta(minutes=5)
+
+        if await connection.fetchval("SELECT to_regclass('users_partitioned')"):
+            logger.info(f"{__name__}: Resuming into users_partitioned")
+        else:
+            async with connection.transaction():
+                for statement in users_statements("users_partitioned", partitions):
+                    await connection.execute(statement)
+
+        # Also on a table left by a run before the activity columns
+        for statement in activity_statements("users_partitioned"):
+            await connection.execute(statement)
+
+        copied = 0
+        last_id = None
+        while True:
+            last_id, count = await connection.fetchrow(
+                f"""
+                WITH batch AS (
+                    SELECT * FROM users
+                    WHERE $1::uuid IS NULL OR id > $1
+                    ORDER BY id
+                    LIMIT $2
+                ), inserted AS (
+                    INSERT INTO users_partitioned ({USER_COLUMNS})
+                    SELECT {USER_COLUMNS} FROM batch
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT (SELECT id FROM batch ORDER BY id DESC LIMIT 1), count(*)
+                FROM batch
+                """,
+                last_id,
+                batch_size,
+            )
+            if not count:
+                break
+            copied += count
+            logger.info(f"{__name__}: Copied {copied} users")
+
+        # Short exclusive window: catch up and swap
+        async with connection.transaction():
+            await connection.execute("LOCK TABLE users IN EXCLUSIVE MODE")
+            await connection.execute(
+                f"""
+                INSERT INTO users_partitioned ({USER_COLUMNS})
+                SELECT {USER_COLUMNS} FROM users
+                WHERE updated_at >= $1 OR created_at >= $1
+                ON CONFLICT (group_id, id) DO UPDATE SET
+                    updated_at = EXCLUDED.updated_at,
+                    email = EXCLUDED.email,
+                    password_hash = EXCLUDED.password_hash,
+                    first_name = EXCLUDED.first_name,
+                    last_name = EXCLUDED.last_name,
+                    last_login_at = EXCLUDED.last_login_at,
+                    last_seen_at = EXCLUDED.last_seen_at
+                """,
+                started,
+            )
+            for statement in (
+                "ALTER TABLE users RENAME TO users_unpartitioned",
+                "ALTER TABLE users_partitioned RENAME TO users",
+            ):
+                await connection.execute(statement)
+
+            # Keep the constraint names the service checks for
+            for suffix in ("pkey", "group_id_email_key"):
+                if await connection.fetchval(
+                    "SELECT to_regclass($1)", f"users_{suffix}"
+                ):
+                    await connection.execute(
+                        f"ALTER INDEX users_{suffix} RENAME TO users_unpartitioned_{suffix}"
+                    )
+                await connection.execute(
+                    f"ALTER INDEX users_partitioned_{suffix} RENAME TO users_{suffix}"
+                )
+            await connection.execute(
+                "ALTER INDEX users_partitioned_id_idx RENAME TO users_id_idx"
+            )
+            for remainder in range(partitions):
+                partition = f"users_partitioned_p{remainder}"
+                await connection.execute(
+                    f"ALTER TABLE {partition} RENAME TO users_p{remainder}"
+                )
+                for suffix in ("pkey", "group_id_email_key", "id_idx"):
+                    await connection.execute(
+                        f"ALTER INDEX {partition}_{suffix} RENAME TO users_p{remainder}_{suffix}"
+                    )
+
+        logger.info(
+            f"{__name__}: Users partitioned, the old table is users_unpartitioned"
+        )
+
+
+async def _main(args):
+    logger = Logger(name="schema")
+
+    # The main database and every shard hold the same schema
+    dsns = [os.getenv("DSN"), *parse_shards(os.getenv("SHARDS", "")).values()]
+    for dsn in dict.fromkeys(dsns):
+        database = Database(logger, dsn=dsn)
+        await database.setup()
+        try:
+            started = time.monotonic()
+            if args.command == "migrate":
+                await migrate(logger, database, partitions=args.partitions)
+            else:
+                await partition_users(
+                    logger,
+                    database,
+                    partitions=args.partitions,
+                    batch_size=args.batch_size,
+                )
+            print(f"{args.command} done in {time.monotonic() - started:.1f}s")
+        finally:
+            await database.close()
+
+
+# `python -m db.schema migrate`, then `partition-users` for a table created by hand
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    parser.add_argument("command", choices=("migrate", "partition-users"))
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    asyncio.run(_main(parser.parse_args()))
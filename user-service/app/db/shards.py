@@ -0,0 +1,302 @@
+# 2024 amicroservice author.
+
+import argparse
+import asyncio
+import bisect
+import datetime
+import hashlib
+import os
+import time
+
+import asyncpg
+
+from db.invalidation import InvalidationBus
+from db.models.user import UserModel
+from db.pool import Database
+from utils.logger import Logger
+
+
+def parse_shards(value: str) -> dict:
+    """
+    Shard DSNs from "name=dsn,name=dsn"
+    """
+    shards = dict()
+    for item in value.split(","):
+        if item.strip():
+            name, dsn = item.split("=", 1)
+            shards[name.strip()] = dsn.strip()
+    return shards
+
+
+class ShardRouter:
+    """
+    Route a group to the database holding its users
+
+    Groups are placed on a consistent-hash ring of the shard names, so adding
+    a shard moves only a fair share of them. The group_shards directory on the
+    main database pins a group elsewhere, and freezes its writes while moving:
+
+        CREATE TABLE group_shards (
+            group_id uuid PRIMARY KEY,
+            shard text NOT NULL,
+            frozen boolean NOT NULL DEFAULT false
+        );
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        database: Database,
+        shards: dict,
+        bus: InvalidationBus = None,
+        vnodes: int = 64,
+    ):
+        # Initialize
+        self.logger = logger
+        self.database = database  # Holds the directory
+        self.shards = shards  # Shard name to its Database
+
+        # Sorted ring of (point, shard name), vnodes points per shard
+        self._ring = sorted(
+            (self._point(f"{name}#{i}"), name) for name in shards for i in range(vnodes)
+        )
+        self._points = [point for point, _ in self._ring]
+
+        # Directory entries by group id, as (shard, frozen)
+        self._directory = dict()
+
+        # Set and replaced on every load, frozen writes wait on it
+        self._loaded = asyncio.Event()
+
+        # Reloads in flight, the loop only keeps weak references to tasks
+        self._reloads = set()
+
+        self.bus = bus
+        if bus:
+            bus.subscribe("shard", self._moved)
+
+    async def setup(self):
+        for database in self.shards.values():
+            if database is not self.database:
+                await database.setup()
+        await self.load()
+
+    async def close(self):
+        for task in list(self._reloads):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        for database in self.shards.values():
+            if database is not self.database:
+                await database.close()
+
+    async def load(self):
+        """
+        Read the whole directory, it only holds groups that were moved
+        """
+        try:
+            async with self.database.acquire() as connection:
+                records = await connection.fetch(
+                    "SELECT group_id, shard, frozen FROM group_shards"
+                )
+        except asyncpg.PostgresError as e:
+            self.logger.error(f"{__name__}: Error retrieving group shards - {e}")
+            raise e
+
+        self._directory = {
+            str(record["group_id"]): (record["shard"], record["frozen"])
+            for record in records
+        }
+        self._loaded.set()
+        self._loaded = asyncio.Event()
+
+    def shard(self, group_id) -> str:
+        """
+        Name of the shard holding the group
+        """
+        group_id = str(group_id)
+        entry = self._directory.get(group_id)
+        if entry is not None:
+            return entry[0]
+
+        index = bisect.bisect(self._points, self._point(group_id))
+        return self._ring[index % len(self._ring)][1]
+
+    def get(self, group_id) -> Database:
+        return self.shards[self.shard(group_id)]
+
+    async def writable(self, group_id, context=None) -> Database:
+        """
+        Database of the group for a write, waits while the group is moving
+        """
+        group_id = str(group_id)
+        while self._directory.get(group_id, (None, False))[1]:
+            await asyncio.wait_for(
+                self._loaded.wait(), timeout=self.database.timeout(context)
+            )
+        return self.get(group_id)
+
+    def _moved(self, key, data):
+        # The directory changed on another server, or events may have been lost
+        task = asyncio.get_running_loop().create_task(self._reload())
+        self._reloads.add(task)
+        task.add_done_callback(self._reloads.discard)
+
+    async def _reload(self):
+        try:
+            await self.load()
+        except Exception as e:
+            self.logger.error(f"{__name__}: Error reloading group shards - {e}")
+
+    def _point(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+
+async def move_group(
+    router: ShardRouter,
+    bus: InvalidationBus,
+    group_id: str,
+    target: str,
+    grace: float = 5.0,
+):
+    """
+    Move the users of a group to the target shard while the service runs
+
+    Rows are copied once without blocking, then writes to the group are frozen
+    for the time of copying the rows changed meanwhile and switching the
+    directory. Servers learn of each step on the bus, grace covers its delay.
+    """
+    source = router.shard(group_id)
+    if source == target:
+        return
+
+    source_database = router.shards[source]
+    target_database = router.shards[target]
+
+    async def set_directory(shard: str, frozen: bool):
+        async with router.database.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    """
+                    INSERT INTO group_shards (group_id, shard, frozen)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (group_id) DO UPDATE
+                    SET shard = EXCLUDED.shard, frozen = EXCLUDED.frozen
+                    """,
+                    group_id,
+                    shard,
+                    frozen,
+                )
+                await bus.publish(connection, "shard", group_id)
+        await asyncio.sleep(grace)
+
+    # Every column of the model, logins and activity do not move updated_at
+    # so their times are compared too
+    columns = UserModel.COLUMNS
+
+    async def copy(since):
+        async with source_database.acquire() as connection:
+            records = await connection.fetch(
+                f"""
+                SELECT {", ".join(columns)} FROM users
+                WHERE group_id = $1 AND ($2::timestamp IS NULL
+                    OR GREATEST(updated_at, last_login_at, last_seen_at) >= $2)
+                """,
+                group_id,
+                since,
+            )
+        if not records:
+            return 0
+
+        async with target_database.acquire() as connection:
+            async with connection.transaction():
+                # Upsert through a temporary table, the copy may run again
+                await connection.execute(
+                    "CREATE TEMPORARY TABLE moving_users "
+                    "(LIKE users INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                await connection.copy_records_to_table(
+                    "moving_users", records=records, columns=columns
+                )
+                assignments = ", ".join(
+                    f"{column} = EXCLUDED.{column}"
+                    for column in columns
+                    if column not in ("group_id", "id")
+                )
+                await connection.execute(
+                    f"""
+                    INSERT INTO users ({", ".join(columns)})
+                    SELECT {", ".join(columns)} FROM moving_users
+                    ON CONFLICT (group_id, id) DO UPDATE SET {assignments}
+                    """
+                )
+        return len(records)
+
+    # Bulk copy while the group is still served by the source. The servers
+    # set updated_at with their own clock, so recopy with a margin for skew
+    started = await _database_now(source_database) - datetime.timedelta(minutes=5)
+    copied = await copy(None)
+    router.logger.info(f"{__name__}: Copied {copied} users of group {group_id}")
+
+    # Freeze writes, copy what changed during the bulk copy, then switch
+    await set_directory(source, frozen=True)
+    try:
+        copied = await copy(started)
+    except Exception:
+        await set_directory(source, frozen=False)
+        raise
+    await set_directory(target, frozen=False)
+    router.logger.info(
+        f"{__name__}: Group {group_id} moved to {target}, {copied} users recopied"
+    )
+
+    # Reads have followed the directory, the source rows can go
+    async with source_database.acquire() as connection:
+        await connection.execute("DELETE FROM users WHERE group_id = $1", group_id)
+
+
+async def _database_now(database: Database):
+    async with database.acquire() as connection:
+        return await connection.fetchval("SELECT localtimestamp")
+
+
+async def _main(args):
+    logger = Logger(name="shards")
+    dsn = os.getenv("DSN")
+
+    database = Database(logger, dsn=dsn)
+    await database.setup()
+
+    shards = {
+        name: Database(logger, dsn=shard_dsn)
+        for name, shard_dsn in parse_shards(os.getenv("SHARDS", "")).items()
+    }
+    router = ShardRouter(logger, database, shards)
+    bus = InvalidationBus(
+        logger, dsns=(dsn,), channel=os.getenv("INVALIDATION_CHANNEL", "invalidation")
+    )
+    try:
+        await router.setup()
+        if args.command == "show":
+            print(router.shard(args.group_id))
+        else:
+            started = time.monotonic()
+            await move_group(router, bus, args.group_id, args.target, grace=args.grace)
+            print(f"Moved in {time.monotonic() - started:.1f}s")
+    finally:
+        await router.close()
+        await database.close()
+
+
+# Rebalance: `python -m db.shards move <group_id> <shard>` with DSN and SHARDS set
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Place groups on shards")
+    parser.add_argument("command", choices=("show", "move"))
+    parser.add_argument("group_id")
+    parser.add_argument("target", nargs="?")
+    parser.add_argument("--grace", type=float, default=5.0)
+    asyncio.run(_main(parser.parse_args()))
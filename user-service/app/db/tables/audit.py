@@ -0,0 +1,104 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+
+import asyncpg
+
+from db.pool import Database
+from utils.logger import Logger
+
+
+class AuditTable:
+    """
+    Implement connection to database and record transactions with the audit_events table.
+
+    Append only and partitioned by month, so old months are dropped whole
+    instead of deleted row by row. The default partition catches rows of a
+    month whose partition could not be created:
+
+        CREATE TABLE audit_events (
+            occurred_at timestamptz NOT NULL,
+            event text NOT NULL,
+            outcome text NOT NULL,
+            detail text,
+            group_id text,
+            user_id uuid,
+            email text,
+            peer text
+        ) PARTITION BY RANGE (occurred_at);
+    """
+
+    # Row layout of copy, in order
+    COLUMNS = (
+        "occurred_at",
+        "event",
+        "outcome",
+        "detail",
+        "group_id",
+        "user_id",
+        "email",
+        "peer",
+    )
+
+    def __init__(self, logger: Logger, database: Database, timeout: float = 10.0):
+        """
+        Initialize connection details
+        """
+        self.logger = logger
+        self.database = database
+        self.timeout = timeout  # Seconds a copy may take, there is no caller deadline
+
+        # First days of the months whose partition exists
+        self._months = set()
+
+    async def copy(self, rows: list):
+        """
+        Append rows laid out as COLUMNS, in one COPY
+        """
+        # Each month present, and the next one before the first of its rows
+        months = {self._month(row[0]) for row in rows}
+        months.add(self._next_month(max(months)))
+
+        try:
+            async with self.database.acquire() as connection:
+                for month in sorted(months - self._months):
+                    await self._create_partition(connection, month)
+
+                await connection.copy_records_to_table(
+                    "audit_events",
+                    records=rows,
+                    columns=self.COLUMNS,
+                    timeout=self.timeout,
+                )
+
+        except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            self.logger.error(
+                f"{__name__}: Error copying {len(rows)} audit events - {e}"
+            )
+            raise e
+
+    async def _create_partition(self, connection, month: datetime.datetime):
+        try:
+            await connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS audit_events_{month:%Y%m}
+                PARTITION OF audit_events
+                FOR VALUES FROM ('{month.isoformat()}') TO ('{self._next_month(month).isoformat()}')
+                """
+            )
+        except asyncpg.PostgresError as e:
+            # Rows of the month already in the default partition, they stay there
+            self.logger.warning(
+                f"{__name__}: Partition of {month:%Y-%m} not created - {e}"
+            )
+        self._months.add(month)
+
+    def _month(self, value: datetime.datetime) -> datetime.datetime:
+        value = value.astimezone(datetime.timezone.utc)
+        return datetime.datetime(
+            value.year, value.month, 1, tzinfo=datetime.timezone.utc
+        )
+
+    def _next_month(self, month: datetime.datetime) -> datetime.datetime:
+        return (month + datetime.timedelta(days=32)).replace(day=1)
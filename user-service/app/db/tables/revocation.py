@@ -0,0 +1,118 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+
+import asyncpg
+
+from db.invalidation import InvalidationBus
+from db.pool import Database
+from utils.logger import Logger
+
+
+class RevocationTable:
+    """
+    Implement connection to database and record transactions with the token_revocations table.
+
+    Each row revokes either one token by jti, or every token of a user issued
+    before not_before. Rows are read incrementally by their seq:
+
+        CREATE TABLE token_revocations (
+            seq bigserial PRIMARY KEY,
+            jti text,
+            user_id uuid NOT NULL,
+            not_before timestamptz,
+            expires_at timestamptz NOT NULL,
+            revoked_at timestamptz NOT NULL DEFAULT now()
+        );
+    """
+
+    def __init__(self, logger: Logger, database: Database, bus: InvalidationBus = None):
+        """
+        Initialize connection details
+        """
+        self.logger = logger
+        self.database = database
+
+        # Tells the other servers to refresh without waiting for their poll
+        self.bus = bus
+
+    async def revoke_token(
+        self, jti: str, user_id: str, expires_at: datetime.datetime, context=None
+    ):
+        """
+        Revoke one token until it expires
+        """
+        try:
+            async with self.database.acquire(context) as connection:
+                await connection.execute(
+                    """
+                    INSERT INTO token_revocations (jti, user_id, expires_at)
+                    VALUES ($1, $2, $3)
+                    """,
+                    jti,
+                    user_id,
+                    expires_at,
+                    timeout=self.database.timeout(context),
+                )
+                if self.bus:
+                    await self.bus.publish(connection, "revocation", user_id)
+
+        except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            self.logger.error(f"{__name__}: Error revoking token {jti} - {e}")
+            raise e
+
+    async def revoke_user(
+        self,
+        user_id: str,
+        not_before: datetime.datetime,
+        expires_at: datetime.datetime,
+        context=None,
+    ):
+        """
+        Revoke every token of the user issued before not_before
+        """
+        try:
+            async with self.database.acquire(context) as connection:
+                await connection.execute(
+                    """
+                    INSERT INTO token_revocations (user_id, not_before, expires_at)
+                    VALUES ($1, $2, $3)
+                    """,
+                    user_id,
+                    not_before,
+                    expires_at,
+                    timeout=self.database.timeout(context),
+                )
+                if self.bus:
+                    await self.bus.publish(connection, "revocation", user_id)
+
+        except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            self.logger.error(
+                f"{__name__}: Error revoking tokens of user {user_id} - {e}"
+            )
+            raise e
+
+    async def changes(self, since: int, recent: datetime.datetime) -> list:
+        """
+        Unexpired revocations with a seq above since or revoked after recent
+
+        A seq is taken at insert but becomes visible at commit, so rows of the
+        recent past are read again to catch commits that landed out of order.
+        """
+        try:
+            async with self.database.acquire() as connection:
+                return await connection.fetch(
+                    """
+                    SELECT seq, jti, user_id, not_before, expires_at
+                    FROM token_revocations
+                    WHERE (seq > $1 OR revoked_at > $2) AND expires_at > now()
+                    ORDER BY seq
+                    """,
+                    since,
+                    recent,
+                )
+
+        except asyncpg.PostgresError as e:
+            self.logger.error(f"{__name__}: Error retrieving revocations - {e}")
+            raise e
@@ -1,24 +1,54 @@
 # 2024 amicroservice author.
 
+import asyncio
+
 import asyncpg
 
+from db.backends.base import UserStorage, unique_violation
+from db.invalidation import InvalidationBus
 from db.models.user import UserModel
-from utils.logger import Logger
 from db.pool import Database
+from db.shards import ShardRouter
+from utils.batching import WriteBatcher
+from utils.logger import Logger
 
 
-class UserTable:
+class UserTable(UserStorage):
     """
     Implement connection to database and record transactions with the user table.
     """
 
-    def __init__(self, logger: Logger, database: Database):
+    # Select list matching the positions UserModel.from_record reads
+    COLUMNS = ", ".join(UserModel.COLUMNS)
+
+    def __init__(
+        self,
+        logger: Logger,
+        database: Database,
+        bus: InvalidationBus = None,
+        shards: ShardRouter = None,
+        batch_window: float = 0,
+        batch_size: int = 100,
+    ):
         """
         Initialize connection details
         """
         self.logger = logger
         self.database = database
 
+        # Concurrent creates share one INSERT and commit, per database
+        self.batcher = None
+        if batch_window > 0:
+            self.batcher = WriteBatcher(
+                self._insert_batch, window=batch_window, max_size=batch_size
+            )
+
+        # Tells the other servers about created and updated users
+        self.bus = bus
+
+        # Users by group on several databases, all on database if None
+        self.shards = shards
+
     def ready(self):
         """
         Check if pool already setup
@@ -27,72 +57,187 @@ class UserTable:
             self.logger.critical(f"{__name__}: Not connected to the database.")
             return None
 
-    async def create(self, user_model: UserModel):
+    def _database(self, group_id) -> Database:
+        if self.shards is None:
+            return self.database
+        return self.shards.get(group_id)
+
+    async def _writable(self, group_id, context=None) -> Database:
+        if self.shards is None:
+            return self.database
+        return await self.shards.writable(group_id, context)
+
+    async def create(self, user_model: UserModel, context=None) -> UserModel:
         """
-        Create
+        Create, returns the new row
         """
         self.ready()
 
         try:
-            async with self.database.pool.acquire() as connection:
-                async with connection.transaction():
-                    await connection.execute(
-                        """
-                        INSERT INTO users (group_id, email, password_hash, first_name, last_name )
-                        VALUES ($1, $2, $3, $4, $5)
-                        """,
-                        user_model.group_id,
-                        user_model.email,
-                        user_model.password_hash,
-                        user_model.first_name,
-                        user_model.last_name,
-                    )
+            database = await self._writable(user_model.group_id, context)
+            if self.batcher:
+                return await self.batcher.submit(database, (user_model, context))
+
+            return await self._insert(database, user_model, context)
 
         except asyncpg.PostgresError as e:
             self.logger.error(
                 f"{__name__}: Error inserting superuser {user_model.email} - {e}"
             )
             raise e
+        except asyncio.TimeoutError as e:
+            self.logger.error(
+                f"{__name__}: Timeout inserting user {user_model.email} - {e}"
+            )
+            raise e
+
+    async def _insert(
+        self, database: Database, user_model: UserModel, context=None
+    ) -> UserModel:
+        """
+        Insert one user with its own statement and commit
+        """
+        async with database.acquire(context) as connection:
+            async with connection.transaction():
+                record: asyncpg.Record = await connection.fetchrow(
+                    f"""
+                    INSERT INTO users (group_id, email, password_hash, first_name, last_name )
+                    VALUES ($1, $2, $3, $4, $5)
+                    RETURNING {self.COLUMNS}
+                    """,
+                    user_model.group_id,
+                    user_model.email,
+                    user_model.password_hash,
+                    user_model.first_name,
+                    user_model.last_name,
+                    timeout=self.database.timeout(context),
+                )
+                if self.bus:
+                    await self.bus.publish(
+                        connection,
+                        "user",
+                        [str(user_model.group_id), user_model.email],
+                    )
+
+        return UserModel.from_record(record)
 
-    async def get_by_groud_id_and_email(self, group_id: str, email: str) -> UserModel:
+    async def _insert_batch(self, database: Database, items: list) -> list:
+        """
+        Insert (user, context) items with one statement and commit, a created
+        row or error per user
+
+        The statement runs within the earliest deadline of the batch. If it
+        fails, each user is inserted on its own within its own deadline, so a
+        bad row or a short deadline does not fail the others.
+        """
+        results = [None] * len(items)
+
+        # The first of the same group and email is inserted, the rest conflict.
+        # Callers already out of time are answered at once
+        first = dict()
+        deadline = remaining = None
+        for index, (user_model, context) in enumerate(items):
+            try:
+                timeout = self.database.timeout(context)
+            except asyncio.TimeoutError as e:
+                results[index] = e
+                continue
+
+            key = (str(user_model.group_id), user_model.email)
+            if key in first:
+                results[index] = self._duplicate(user_model)
+                continue
+
+            first[key] = index
+            if timeout is not None and (remaining is None or timeout < remaining):
+                deadline, remaining = context, timeout
+
+        if not first:
+            return results
+
+        rows = [items[index][0] for index in first.values()]
+        try:
+            records = await self._insert_rows(database, rows, deadline)
+        except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            self.logger.error(
+                f"{__name__}: Error inserting a batch of {len(rows)} users, inserting one by one - {e}"
+            )
+            inserted = await asyncio.gather(
+                *(self._insert(database, *items[index]) for index in first.values()),
+                return_exceptions=True,
+            )
+            for index, result in zip(first.values(), inserted):
+                results[index] = result
+            return results
+
+        # Rows not returned hit an existing user
+        created = {
+            (str(record["group_id"]), record["email"]): record for record in records
+        }
+        for key, index in first.items():
+            record = created.get(key)
+            if record:
+                results[index] = UserModel.from_record(record)
+            else:
+                results[index] = self._duplicate(items[index][0])
+
+        return results
+
+    async def _insert_rows(self, database: Database, rows: list, context) -> list:
+        # One statement for every row, rows of existing users are skipped
+        async with database.acquire(context) as connection:
+            async with connection.transaction():
+                records = await connection.fetch(
+                    f"""
+                    INSERT INTO users (group_id, email, password_hash, first_name, last_name)
+                    SELECT * FROM unnest($1::uuid[], $2::text[], $3::bytea[], $4::text[], $5::text[])
+                    ON CONFLICT DO NOTHING
+                    RETURNING {self.COLUMNS}
+                    """,
+                    [user_model.group_id for user_model in rows],
+                    [user_model.email for user_model in rows],
+                    [user_model.password_hash for user_model in rows],
+                    [user_model.first_name for user_model in rows],
+                    [user_model.last_name for user_model in rows],
+                    timeout=self.database.timeout(context),
+                )
+                if self.bus and records:
+                    await self.bus.publish_many(
+                        connection,
+                        "user",
+                        [
+                            [str(record["group_id"]), record["email"]]
+                            for record in records
+                        ],
+                    )
+        return records
+
+    def _duplicate(self, user_model: UserModel) -> asyncpg.UniqueViolationError:
+        # Same error as a single INSERT, callers check the constraint name
+        return unique_violation("users_group_id_email_key")
+
+    async def get_by_groud_id_and_email(
+        self, group_id: str, email: str, context=None
+    ) -> UserModel:
         """
         Retrieve by group_id and email
         """
 
         try:
-            async with self.database.pool.acquire() as connection:
+            async with self._database(group_id).acquire(context) as connection:
                 record: asyncpg.Record = await connection.fetchrow(
-                    """
-                    SELECT 
-                        id, 
-                        created_at, 
-                        updated_at, 
-                        group_id,
-                        email, 
-                        password_hash, 
-                        first_name, 
-                        last_name 
+                    f"""
+                    SELECT {self.COLUMNS}
                     FROM users 
                     WHERE group_id = $1 AND email = $2 LIMIT 1
                     """,
                     group_id,
                     email,
+                    timeout=self.database.timeout(context),
                 )
 
                 if record:
-                    user_model = UserModel(
-                        group_id=record["group_id"],
-                        email=record["email"],
-                        first_name=record["first_name"],
-                        last_name=record["last_name"],
-                    )
-
-                    user_model.id = record["id"]
-                    user_model.created_at = record["created_at"]
-                    user_model.updated_at = record["updated_at"]
-                    user_model.password_hash = record["password_hash"]
-
-                    return user_model
+                    return UserModel.from_record(record)
                 else:
                     return None
 
@@ -101,71 +246,111 @@ class UserTable:
                 f"{__name__}: Error retrieving user by group_id {group_id} and email {email} - {e}"
             )
             raise e
+        except asyncio.TimeoutError as e:
+            self.logger.error(
+                f"{__name__}: Timeout retrieving user by group_id {group_id} and email {email} - {e}"
+            )
+            raise e
 
-    async def get(self, id: str) -> UserModel:
+    async def get(
+        self, id: str, context=None, fields: tuple = None, group_id: str = None
+    ) -> UserModel:
         """
-        Retrieve
+        Retrieve, only the given fields if any
+
+        The group_id routes to its shard, without it every shard is asked.
         """
         self.ready()
 
-        try:
-            async with self.database.pool.acquire() as connection:
-                record: asyncpg.Record = await connection.fetchrow(
-                    """
-                    SELECT 
-                        id, 
-                        created_at, 
-                        updated_at, 
-                        group_id,
-                        email, 
-                        password_hash, 
-                        first_name, 
-                        last_name 
-                    FROM users 
-                    WHERE id = $1 LIMIT 1
-                    """,
-                    id,
+        # Keep the column order stable so each projection is one prepared statement
+        columns = self.COLUMNS
+        if fields:
+            columns = ", ".join(
+                column for column in UserModel.COLUMNS if column in fields
+            )
+
+        if self.shards is not None and group_id is None:
+            for user_model in await asyncio.gather(
+                *(
+                    self._get(database, id, context, columns, fields)
+                    for database in self.shards.shards.values()
                 )
+            ):
+                if user_model:
+                    return user_model
+            return None
 
-                if record:
-                    user_model = UserModel(
-                        group_id=record["group_id"],
-                        email=record["email"],
-                        first_name=record["first_name"],
-                        last_name=record["last_name"],
-                    )
+        return await self._get(
+            self._database(group_id), id, context, columns, fields, group_id
+        )
 
-                    user_model.id = record["id"]
-                    user_model.created_at = record["created_at"]
-                    user_model.updated_at = record["updated_at"]
-                    user_model.password_hash = record["password_hash"]
+    async def _get(
+        self,
+        database: Database,
+        id: str,
+        context,
+        columns: str,
+        fields: tuple,
+        group_id: str = None,
+    ) -> UserModel:
+        # With the group only its partition is searched
+        try:
+            async with database.acquire(context) as connection:
+                if group_id is None:
+                    record: asyncpg.Record = await connection.fetchrow(
+                        f"""
+                        SELECT {columns}
+                        FROM users 
+                        WHERE id = $1 LIMIT 1
+                        """,
+                        id,
+                        timeout=self.database.timeout(context),
+                    )
+                else:
+                    record: asyncpg.Record = await connection.fetchrow(
+                        f"""
+                        SELECT {columns}
+                        FROM users 
+                        WHERE id = $1 AND group_id = $2 LIMIT 1
+                        """,
+                        id,
+                        group_id,
+                        timeout=self.database.timeout(context),
+                    )
 
-                    return user_model
+                if record and fields:
+                    return UserModel.from_columns(record)
+                elif record:
+                    return UserModel.from_record(record)
                 else:
                     return None
 
         except asyncpg.PostgresError as e:
             self.logger.error(f"{__name__}: Error retrieving user by ID {id} - {e}")
             raise e
+        except asyncio.TimeoutError as e:
+            self.logger.error(f"{__name__}: Timeout retrieving user by ID {id} - {e}")
+            raise e
 
-    async def update(self, user_model: UserModel):
+    async def update(self, user_model: UserModel, context=None):
         """
         Update
         """
         self.ready()
 
         try:
-            async with self.database.pool.acquire() as connection:
+            database = await self._writable(user_model.group_id, context)
+            async with database.acquire(context) as connection:
                 async with connection.transaction():
                     await connection.execute(
                         """
-                        UPDATE superusers
+                        UPDATE users
                         SET updated_at = $1,
                             email = $2,
                             password_hash = $3,
                             first_name = $4,
                             last_name = $5  
-                        WHERE id = $6
+                        WHERE id = $6 AND group_id = $7
                         """,
                         user_model.updated_at,
                         user_model.email,
@@ -173,10 +358,67 @@ class UserTable:
                         user_model.first_name,
                         user_model.last_name,
                         user_model.id,
+                        user_model.group_id,
+                        timeout=self.database.timeout(context),
                     )
+                    if self.bus:
+                        await self.bus.publish(
+                            connection,
+                            "user",
+                            [str(user_model.group_id), user_model.email],
+                            id=str(user_model.id),
+                            updated_at=user_model.updated_at.isoformat(),
+                        )
 
         except asyncpg.PostgresError as e:
             self.logger.error(
                 f"{__name__}: Error updating superuser {user_model.id} - {e}"
             )
             raise e
+        except asyncio.TimeoutError as e:
+            self.logger.error(
+                f"{__name__}: Timeout updating user {user_model.id} - {e}"
+            )
+            raise e
+
+    async def record_activity(self, activity: dict):
+        """
+        Write last login and seen times, one UPDATE per database
+
+        activity maps a user id to (group_id, last_login_at, last_seen_at), a
+        None time is left as it is. Only ever moves the times forward and does
+        not touch updated_at, so cached users and tokens stay valid.
+        """
+        self.ready()
+
+        by_database = dict()
+        for id, (group_id, last_login_at, last_seen_at) in activity.items():
+            by_database.setdefault(self._database(group_id), []).append(
+                (group_id, id, last_login_at, last_seen_at)
+            )
+
+        for database, rows in by_database.items():
+            # Same row order on every server, so two flushes cannot deadlock
+            rows.sort(key=lambda row: str(row[1]))
+            try:
+                async with database.acquire() as connection:
+                    await connection.execute(
+                        """
+                        UPDATE users
+                        SET last_login_at = GREATEST(users.last_login_at, activity.last_login_at),
+                            last_seen_at = GREATEST(users.last_seen_at, activity.last_seen_at)
+                        FROM unnest($1::uuid[], $2::uuid[], $3::timestamp[], $4::timestamp[])
+                            AS activity (group_id, id, last_login_at, last_seen_at)
+                        WHERE users.group_id = activity.group_id AND users.id = activity.id
+                        """,
+                        [row[0] for row in rows],
+                        [row[1] for row in rows],
+                        [row[2] for row in rows],
+                        [row[3] for row in rows],
+                    )
+
+            except asyncpg.PostgresError as e:
+                self.logger.error(
+                    f"{__name__}: Error recording activity of {len(rows)} users - {e}"
+                )
+                raise e
@@ -0,0 +1,358 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import itertools
+import json
+import time
+import uuid
+
+import grpc
+import jwt
+from google.protobuf import field_mask_pb2
+
+import buf.user.user_pb2 as user_pb2
+import buf.user.user_pb2_grpc as user_pb2_grpc
+from utils.cache import LRUCache
+
+# Retried by the channel on UNAVAILABLE, the call never reached a handler or
+# is safe to run twice. Register is sent with an idempotency key.
+RETRY_POLICY = {
+    "maxAttempts": 3,
+    "initialBackoff": "0.05s",
+    "maxBackoff": "1s",
+    "backoffMultiplier": 2,
+    "retryableStatusCodes": ["UNAVAILABLE"],
+}
+
+SERVICE_CONFIG = {
+    "methodConfig": [
+        {
+            "name": [
+                {"service": "user.UserService", "method": method}
+                for method in ("Register", "Login", "Get", "GetKeys", "Logout")
+            ],
+            "retryPolicy": RETRY_POLICY,
+        }
+    ],
+    # Stop retrying once more than a tenth of the calls fail, no retry storms
+    "retryThrottling": {"maxTokens": 10, "tokenRatio": 0.1},
+}
+
+
+class ChannelPool:
+    """
+    Channels to one target used in turn, each is its own HTTP/2 connection
+
+    One connection caps the concurrent streams and serializes on one socket,
+    a few spread the load. Idle connections are kept alive with pings, so a
+    load balancer does not drop them silently.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        size: int = 4,
+        credentials: grpc.ChannelCredentials = None,
+        keepalive: float = 60.0,
+        options: tuple = (),
+    ):
+        # Initialize
+        self.target = target
+        options = (
+            ("grpc.service_config", json.dumps(SERVICE_CONFIG)),
+            ("grpc.enable_retries", 1),
+            ("grpc.keepalive_time_ms", int(keepalive * 1000)),
+            ("grpc.keepalive_timeout_ms", 10000),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+            *options,
+        )
+
+        # Distinct channel args, otherwise the channels share one connection
+        self.channels = [
+            (
+                grpc.aio.secure_channel(
+                    target, credentials, options=(*options, ("pool.index", index))
+                )
+                if credentials
+                else grpc.aio.insecure_channel(
+                    target, options=(*options, ("pool.index", index))
+                )
+            )
+            for index in range(size)
+        ]
+        self.stubs = [
+            user_pb2_grpc.UserServiceStub(channel) for channel in self.channels
+        ]
+        self._next = itertools.cycle(range(size))
+
+    def stub(self) -> user_pb2_grpc.UserServiceStub:
+        return self.stubs[next(self._next)]
+
+    async def close(self, grace: float = None):
+        for channel in self.channels:
+            await channel.close(grace)
+
+
+class TokenVerifier:
+    """
+    Verify tokens with the published keys, without a call per token
+
+    Verified claims are cached by token for at most max_age seconds, the
+    longest a revoked token is still accepted. HS256 tokens carry no kid and
+    can only be verified by the service.
+    """
+
+    def __init__(
+        self,
+        fetch_keys,
+        maxsize: int = 10000,
+        max_age: float = 60.0,
+        min_refresh_interval: float = 5.0,
+    ):
+        # Initialize
+        self.fetch_keys = fetch_keys  # Coroutine function returning a KeySet
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+
+        # Token to (expiry, claims)
+        self._cache = LRUCache(maxsize=maxsize)
+
+        # Kid to (key, algorithm), and when the set was fetched and expires
+        self._keys = dict()
+        self._fetched = 0.0
+        self._expires = 0.0
+        self._refresh: asyncio.Task = None
+
+    async def verify(self, token: str) -> dict:
+        """
+        Verified claims, raises jwt.InvalidTokenError
+        """
+        now = time.time()
+        cached = self._cache.get(token)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            raise jwt.InvalidTokenError("Token has no kid")
+
+        # Fetch the set when it has expired, or for a kid rotated in since
+        if now >= self._expires or (
+            kid not in self._keys and now - self._fetched >= self.min_refresh_interval
+        ):
+            await self.refresh()
+
+        entry = self._keys.get(kid)
+        if entry is None:
+            raise jwt.InvalidTokenError(f"Unknown kid {kid}")
+
+        claims = jwt.decode(token, entry[0], algorithms=[entry[1]])
+        self._cache.set(
+            token, (min(now + self.max_age, claims.get("exp", now)), claims)
+        )
+        return claims
+
+    def forget(self, token: str):
+        self._cache.pop(token)
+
+    async def refresh(self):
+        # One fetch at a time, concurrent callers wait for it
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._fetch())
+        await asyncio.shield(self._refresh)
+
+    async def _fetch(self):
+        key_set = await self.fetch_keys()
+
+        keys = dict()
+        for key in key_set.keys:
+            jwk = {"kty": key.kty, "crv": key.crv, "x": key.x, "alg": key.alg}
+            if key.y:
+                jwk["y"] = key.y
+            keys[key.kid] = (jwt.PyJWK(jwk).key, key.alg)
+
+        self._keys = keys
+        self._fetched = time.time()
+        self._expires = self._fetched + (key_set.max_age_seconds or 300)
+
+
+class UserClient:
+    """
+    Asyncio client of the User Service
+
+        async with UserClient("user-service:50053") as client:
+            token = await client.login(group_id, email, password)
+            user = await client.get(token)
+
+    Errors are raised as grpc.aio.AioRpcError, use rpc_status.from_call for
+    the ErrorField details. With hedge_delay set, a Get still unanswered
+    after that many seconds is sent again on another channel and the first
+    response wins, which cuts the tail latency for a few extra calls.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        pool_size: int = 4,
+        timeout: float = 5.0,
+        hedge_delay: float = None,
+        credentials: grpc.ChannelCredentials = None,
+        token_cache_size: int = 10000,
+        token_max_age: float = 60.0,
+    ):
+        # Initialize
+        self.target = target
+        self.pool_size = pool_size
+        self.timeout = timeout  # Deadline of each call in seconds
+        self.hedge_delay = hedge_delay
+        self.credentials = credentials
+
+        self.pool: ChannelPool = None
+        self.verifier = TokenVerifier(
+            self.get_keys, maxsize=token_cache_size, max_age=token_max_age
+        )
+
+    async def __aenter__(self):
+        self.setup()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def setup(self):
+        # Channels bind to the running loop
+        self.pool = ChannelPool(
+            self.target, size=self.pool_size, credentials=self.credentials
+        )
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def register(
+        self,
+        group_id: str,
+        email: str,
+        password: str,
+        first_name: str,
+        last_name: str,
+        idempotency_key: str = None,
+    ) -> user_pb2.User:
+        # The key makes a retried Register return the first outcome
+        return await self.pool.stub().Register(
+            user_pb2.RegisterRequest(
+                group_id=group_id,
+                email=email,
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+            ),
+            metadata=(("idempotency-key", idempotency_key or str(uuid.uuid4())),),
+            timeout=self.timeout,
+        )
+
+    async def login(self, group_id: str, email: str, password: str) -> str:
+        response = await self.pool.stub().Login(
+            user_pb2.LoginRequest(group_id=group_id, email=email, password=password),
+            timeout=self.timeout,
+        )
+        return response.token
+
+    async def get(
+        self, token: str, fields: tuple = None, max_staleness: float = None
+    ) -> user_pb2.User:
+        request = user_pb2.GetRequest()
+        if fields:
+            request.field_mask.CopyFrom(field_mask_pb2.FieldMask(paths=fields))
+        if max_staleness is not None:
+            request.max_staleness.FromTimedelta(
+                datetime.timedelta(seconds=max_staleness)
+            )
+
+        metadata = (("authorization", token),)
+        if self.hedge_delay is None:
+            return await self.pool.stub().Get(
+                request, metadata=metadata, timeout=self.timeout
+            )
+        return await self._hedged(request, metadata)
+
+    async def update(
+        self,
+        token: str,
+        email: str = "",
+        password: str = "",
+        first_name: str = "",
+        last_name: str = "",
+    ) -> user_pb2.User:
+        return await self.pool.stub().Update(
+            user_pb2.UpdateRequest(
+                email=email,
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+            ),
+            metadata=(("authorization", token),),
+            timeout=self.timeout,
+        )
+
+    async def logout(self, token: str, all_sessions: bool = False):
+        await self.pool.stub().Logout(
+            user_pb2.LogoutRequest(all_sessions=all_sessions),
+            metadata=(("authorization", token),),
+            timeout=self.timeout,
+        )
+        self.verifier.forget(token)
+
+    async def watch(self, token: str, ids: tuple = ()):
+        """
+        Users as they change, the caller or the given ids with a service token
+        """
+        call = self.pool.stub().Watch(
+            user_pb2.WatchRequest(ids=ids), metadata=(("authorization", token),)
+        )
+        try:
+            async for user in call:
+                yield user
+        finally:
+            call.cancel()
+
+    async def get_keys(self) -> user_pb2.KeySet:
+        return await self.pool.stub().GetKeys(
+            user_pb2.GetKeysRequest(), timeout=self.timeout
+        )
+
+    async def verify(self, token: str) -> dict:
+        """
+        Claims of a token verified locally, raises jwt.InvalidTokenError
+        """
+        return await self.verifier.verify(token)
+
+    async def _hedged(self, request, metadata) -> user_pb2.User:
+        # Each attempt on the next channel, the slower one is cancelled
+        def attempt():
+            return asyncio.ensure_future(
+                self.pool.stub().Get(request, metadata=metadata, timeout=self.timeout)
+            )
+
+        tasks = {attempt()}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if not done:
+                tasks.add(attempt())
+
+            while True:
+                done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not pending:
+                    raise done.pop().exception()
+                tasks = pending
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -2,16 +2,72 @@
 
 import asyncio
 import os
+import signal
 
+import asyncpg
 import grpc
+from google.protobuf import message
 
-import buf.user.user_pb2_grpc as user_pb2_grpc
+from db.backends.base import seed
+from db.backends.memory import (
+    MemoryGroupTable,
+    MemoryGroupuserTable,
+    MemoryUserTable,
+)
+from db.backends.sqlite import (
+    SqliteDatabase,
+    SqliteGroupTable,
+    SqliteGroupuserTable,
+    SqliteUserTable,
+)
+from db.invalidation import InvalidationBus
+from db.models.user import UserModel
 from db.pool import Database
-from db.tables.group import GroupTable
-from db.tables.groupuser import GroupuserTable
+from db.schema import migrate
+from db.shards import ShardRouter, parse_shards
+from db.tables.audit import AuditTable
+from db.tables.revocation import RevocationTable
 from db.tables.user import UserTable
-from services.user import UserService
+from services.activity import ActivityTracker
+from services.audit import AuditLog
+from services.deadline import DeadlineInterceptor
+from services.keys import KeyRing
+from services.revocation import RevocationList
+from services.user import UserService, add_user_service_to_server
+from services.watch import WatchHub
+from utils.cache import BloomNegativeCache, LRUCache, NegativeCache
+from utils.idempotency import IdempotencyStore
 from utils.logger import Logger
+from utils.loop_monitor import LoopMonitor
+from utils.memory import MemoryProfiler
+from utils.profiler import SamplingProfiler
+from utils.ratelimit import TokenBucketLimiter
+from utils.tracing import (
+    FileSpanExporter,
+    OtlpSpanExporter,
+    Tracer,
+    TracingInterceptor,
+)
+
+
+def open_storage(storage: str) -> tuple:
+    """
+    Group, groupuser and user tables of the "memory" or "sqlite:<path>" storage,
+    and the SQLite database to close or None
+    """
+    if storage == "memory":
+        return MemoryGroupTable(), MemoryGroupuserTable(), MemoryUserTable(), None
+
+    if storage.startswith("sqlite:"):
+        sqlite_database = SqliteDatabase(storage[len("sqlite:") :])
+        return (
+            SqliteGroupTable(sqlite_database),
+            SqliteGroupuserTable(sqlite_database),
+            SqliteUserTable(sqlite_database),
+            sqlite_database,
+        )
+
+    raise ValueError(f"Unknown storage {storage}")
 
 
 # Function to start and run the gRPC server
@@ -21,36 +77,285 @@ async def serve():
     port = os.getenv("GRPC_PORT")
     jwt_secret = os.getenv("JWT_SECRET")
     dsn = os.getenv("DSN")
+    loop_lag_threshold = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+    profile_dir = os.getenv("PROFILE_DIR", ".")
+    profile_seconds = float(os.getenv("PROFILE_SECONDS", "30"))
+    trace_export = os.getenv("TRACE_EXPORT", "")  # "file:<path>" or "otlp:<url>"
+    slow_query_threshold = float(os.getenv("SLOW_QUERY_THRESHOLD", "0.2"))
+    response_cache_size = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+    negative_cache_ttl = os.getenv("NEGATIVE_CACHE_TTL", "")  # 30 with the bus
+    negative_cache_size = int(os.getenv("NEGATIVE_CACHE_SIZE", "100000"))
+    negative_cache_bloom = os.getenv("NEGATIVE_CACHE_BLOOM", "") == "1"
+    negative_cache_error_rate = float(os.getenv("NEGATIVE_CACHE_ERROR_RATE", "1e-6"))
+    login_account_rate = float(os.getenv("LOGIN_ACCOUNT_RATE", "0.1"))
+    login_account_burst = int(os.getenv("LOGIN_ACCOUNT_BURST", "10"))
+    login_peer_rate = float(os.getenv("LOGIN_PEER_RATE", "0"))  # Direct clients only
+    login_peer_burst = int(os.getenv("LOGIN_PEER_BURST", "50"))
+    login_limiter_keys = int(os.getenv("LOGIN_LIMITER_KEYS", "1000000"))
+    idempotency_ttl = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+    idempotency_size = int(os.getenv("IDEMPOTENCY_SIZE", "100000"))
+    jwt_embed_profile = os.getenv("JWT_EMBED_PROFILE", "") == "1"
+    user_versions_size = int(os.getenv("USER_VERSIONS_SIZE", "1000000"))
+    jwt_keys_dir = os.getenv("JWT_KEYS_DIR")
+    jwt_active_kid = os.getenv("JWT_ACTIVE_KID")
+    jwt_keys_max_age = int(os.getenv("JWT_KEYS_MAX_AGE", "3600"))
+    jwt_accept_hs256 = os.getenv("JWT_ACCEPT_HS256", "") == "1"
+    revocation_poll_interval = float(os.getenv("REVOCATION_POLL_INTERVAL", "2"))
+    invalidation_channel = os.getenv("INVALIDATION_CHANNEL", "invalidation")
+    watch_buffer = int(os.getenv("WATCH_BUFFER", "16"))
+    shard_dsns = parse_shards(os.getenv("SHARDS", ""))  # "name=dsn,name=dsn"
+    schema_migrate = os.getenv("SCHEMA_MIGRATE", "1") == "1"
+    schema_partitions = int(os.getenv("SCHEMA_PARTITIONS", "16"))
+    insert_batch_window = float(os.getenv("INSERT_BATCH_WINDOW", "0"))
+    insert_batch_size = int(os.getenv("INSERT_BATCH_SIZE", "100"))
+    storage = os.getenv("STORAGE", "postgres")  # "memory" or "sqlite:<path>"
+    storage_seed = os.getenv("STORAGE_SEED", "")  # Groups and invitations JSON
+    activity_flush_interval = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))
+    activity_max_pending = int(os.getenv("ACTIVITY_MAX_PENDING", "100000"))
+    audit_queue_size = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+    audit_batch_size = int(os.getenv("AUDIT_BATCH_SIZE", "1000"))
+    audit_spill_path = os.getenv("AUDIT_SPILL_PATH", "")
+    audit_spill_max_bytes = int(os.getenv("AUDIT_SPILL_MAX_BYTES", "67108864"))
 
     # Setting logging
     logger = Logger(name=app_name)
 
-    # Create a database object
-    database = Database(logger, dsn=dsn)
+    # Monitor scheduling lag of the event loop
+    loop_monitor = LoopMonitor(logger=logger, threshold=loop_lag_threshold)
+    loop_monitor.start()
+
+    # Start a time-bounded profile with `kill -USR1 <pid>`
+    profiler = SamplingProfiler(logger=logger, output_dir=profile_dir)
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGUSR1, profiler.start, profile_seconds
+    )
+
+    # Arm memory tracing, then report allocation growth with `kill -USR2 <pid>`
+    memory_profiler = MemoryProfiler(
+        logger=logger,
+        types={
+            "UserModel": UserModel,
+            "Message": message.Message,
+            "Record": asyncpg.Record,
+        },
+    )
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGUSR2, memory_profiler.trigger
+    )
+
+    # Export spans of RPCs and their queries
+    span_exporter = None
+    if trace_export.startswith("file:"):
+        span_exporter = FileSpanExporter(logger, path=trace_export[len("file:") :])
+    elif trace_export.startswith("otlp:"):
+        span_exporter = OtlpSpanExporter(
+            logger, endpoint=trace_export[len("otlp:") :], service_name=app_name
+        )
+
+    # Trace queries and log the slow ones
+    tracer = Tracer(
+        logger, exporter=span_exporter, slow_query_threshold=slow_query_threshold
+    )
+
+    # Users in Postgres, or in memory or SQLite to profile the service alone
+    database = bus = shards = sqlite_database = None
+    if storage == "postgres":
+        # Group tables come with the group service package, only needed here
+        from db.tables.group import GroupTable
+        from db.tables.groupuser import GroupuserTable
+
+        # Create a database object
+        database = Database(logger, dsn=dsn, tracer=tracer)
+
+        # Connect to the database
+        await database.setup()
+
+        # Create or upgrade the tables
+        if schema_migrate:
+            await migrate(logger, database, partitions=schema_partitions)
+
+        # Share changes with the other servers, an empty channel disables
+        if invalidation_channel:
+            bus = InvalidationBus(
+                logger, dsns=(dsn, *shard_dsns.values()), channel=invalidation_channel
+            )
+            await bus.setup()
 
-    # Connect to the database
-    await database.setup()
+        # Spread the users by group over the shards, the main database keeps the rest
+        if shard_dsns:
+            shards = ShardRouter(
+                logger,
+                database=database,
+                shards={
+                    name: (
+                        database
+                        if shard_dsn == dsn
+                        else Database(logger, dsn=shard_dsn, tracer=tracer)
+                    )
+                    for name, shard_dsn in shard_dsns.items()
+                },
+                bus=bus,
+            )
+            await shards.setup()
+            if schema_migrate:
+                for shard in shards.shards.values():
+                    if shard is not database:
+                        await migrate(logger, shard, partitions=schema_partitions)
 
-    # Initial Table Group
-    group_table = GroupTable(logger=logger, database=database)
+        # Initial Table Group
+        group_table = GroupTable(logger=logger, database=database)
 
-    # Initial Table Groupuser
-    groupuser_table = GroupuserTable(logger=logger, database=database)
+        # Initial Table Groupuser
+        groupuser_table = GroupuserTable(logger=logger, database=database)
 
-    # Initial Table User
-    user_table = UserTable(logger=logger, database=database)
+        # Initial Table User
+        # Group commit of concurrent Register inserts when a window is set
+        user_table = UserTable(
+            logger=logger,
+            database=database,
+            bus=bus,
+            shards=shards,
+            batch_window=insert_batch_window,
+            batch_size=insert_batch_size,
+        )
+    else:
+        group_table, groupuser_table, user_table, sqlite_database = open_storage(
+            storage
+        )
+        if storage_seed:
+            await seed(group_table, groupuser_table, storage_seed)
+
+    # Stream user changes to Watch calls, fed by the bus
+    watch_hub = None
+    if bus:
+        watch_hub = WatchHub(
+            logger, user_table=user_table, bus=bus, buffer=watch_buffer
+        )
+
+    # Load revoked tokens and poll for the ones revoked by other servers
+    revocations = None
+    if database:
+        revocations = RevocationList(
+            logger=logger,
+            revocation_table=RevocationTable(logger=logger, database=database, bus=bus),
+            poll_interval=revocation_poll_interval,
+            bus=bus,
+        )
+        await revocations.setup()
+
+    # Write last login and seen times behind in batches, an interval of 0 disables
+    activity = None
+    if activity_flush_interval > 0:
+        activity = ActivityTracker(
+            logger,
+            user_table=user_table,
+            interval=activity_flush_interval,
+            max_pending=activity_max_pending,
+        )
+        await activity.setup()
+
+    # Audit Register, Login and Update off the request path, a queue of 0 disables
+    audit_log = None
+    if database and audit_queue_size > 0:
+        audit_log = AuditLog(
+            logger,
+            audit_table=AuditTable(logger=logger, database=database),
+            max_queue=audit_queue_size,
+            batch=audit_batch_size,
+            spill_path=audit_spill_path or None,
+            spill_max_bytes=audit_spill_max_bytes,
+        )
+        await audit_log.setup()
+
+    # Remember missing users and groups for a short time, 0 disables. Without
+    # the bus a user registered on another server is missing here until the
+    # ttl ends, so by default only users are remembered and only with the bus.
+    # The group service sends no events, a set ttl also remembers missing
+    # groups and a new group is found once it ends
+    missing_users = missing_groups = None
+    ttl = float(negative_cache_ttl) if negative_cache_ttl else (30.0 if bus else 0)
+    if ttl > 0:
+
+        def negative_cache():
+            if negative_cache_bloom:
+                return BloomNegativeCache(
+                    negative_cache_size, ttl=ttl, error_rate=negative_cache_error_rate
+                )
+            return NegativeCache(negative_cache_size, ttl=ttl)
+
+        missing_users = negative_cache()
+        if negative_cache_ttl:
+            missing_groups = negative_cache()
+
+    # Throttle Login attempts per account and per peer, a rate of 0 disables.
+    # Behind a proxy every client shares its address, so the peer limiter is opt-in
+    account_limiter = peer_limiter = None
+    if login_account_rate > 0:
+        account_limiter = TokenBucketLimiter(
+            login_account_rate, login_account_burst, max_keys=login_limiter_keys
+        )
+    if login_peer_rate > 0:
+        peer_limiter = TokenBucketLimiter(
+            login_peer_rate, login_peer_burst, max_keys=login_limiter_keys
+        )
+
+    # Token keys, EdDSA/ES256 from the key directory or HS256 with the secret.
+    # JWT_ACCEPT_HS256=1 still verifies the tokens of the secret while moving
+    # to the key directory, to unset once they have expired
+    key_ring = KeyRing(
+        secret=jwt_secret,
+        keys_dir=jwt_keys_dir,
+        active_kid=jwt_active_kid,
+        max_age=jwt_keys_max_age,
+        accept_hs256=jwt_accept_hs256,
+    )
+    if jwt_keys_dir:
+        if jwt_accept_hs256:
+            logger.warning(f"{__name__}: HS256 tokens are accepted, JWT_ACCEPT_HS256")
+        # Pick up a rotated key directory with `kill -HUP <pid>`
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, key_ring.load)
 
     # Start the async gRPC server
-    server = grpc.aio.server()
+    # Accept the keepalive pings of idle sdk clients, sent every minute
+    # Queries out of deadline are answered DEADLINE_EXCEEDED, inside the span
+    server = grpc.aio.server(
+        interceptors=[TracingInterceptor(tracer), DeadlineInterceptor()],
+        options=(
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.min_ping_interval_without_data_ms", 30000),
+        ),
+    )
 
     # Register the User service implementation with the gRPC server
-    user_pb2_grpc.add_UserServiceServicer_to_server(
+    add_user_service_to_server(
         UserService(
             logger=logger,
             group_table=group_table,
             groupuser_table=groupuser_table,
             user_table=user_table,
             jwt_secret=jwt_secret,
+            response_cache=(
+                LRUCache(maxsize=response_cache_size)
+                if response_cache_size > 0
+                else None
+            ),
+            missing_users=missing_users,
+            missing_groups=missing_groups,
+            account_limiter=account_limiter,
+            peer_limiter=peer_limiter,
+            idempotency=(
+                IdempotencyStore(ttl=idempotency_ttl, maxsize=idempotency_size)
+                if idempotency_ttl > 0
+                else None
+            ),
+            embed_profile=jwt_embed_profile,
+            user_versions=LRUCache(maxsize=user_versions_size),
+            key_ring=key_ring,
+            revocations=revocations,
+            bus=bus,
+            watch_hub=watch_hub,
+            activity=activity,
+            audit_log=audit_log,
         ),
         server,
     )
@@ -73,8 +378,29 @@ async def serve():
     # Shutdown gracefully
     await server.stop(grace=5)  # Graceful shutdown (in seconds)
 
-    # Close the database connection
-    await database.close()
+    # Write the buffered activity and audit events, stop polling revocations
+    # and listening, then close the database connection
+    if activity:
+        await activity.close()
+    if audit_log:
+        await audit_log.close()
+    if revocations:
+        await revocations.close()
+    if bus:
+        await watch_hub.close()
+        await bus.close()
+    if shards:
+        await shards.close()
+    if database:
+        await database.close()
+    if sqlite_database:
+        await sqlite_database.close()
+
+    # Flush the remaining spans
+    tracer.close()
+
+    # Stop the loop monitor and log the final lag histogram
+    await loop_monitor.stop()
 
 
 # Entry point of the script
@@ -0,0 +1,121 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+
+from db.tables.user import UserTable
+from utils.logger import Logger
+
+
+class ActivityTracker:
+    """
+    Last login and seen times buffered in memory, written behind in batches
+
+    Each user keeps only its latest times until the next flush, so a busy
+    user costs one row per interval whatever its request rate. Times not yet
+    flushed are lost if the process dies, that is the price of no write per
+    request.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        user_table: UserTable,
+        interval: float = 5.0,
+        max_pending: int = 100000,
+    ):
+        # Initialize
+        self.logger = logger
+        self.user_table = user_table
+        self.interval = interval  # Seconds between two flushes
+        self.max_pending = max_pending  # Users buffered at most between flushes
+
+        # User id to [group_id, last_login_at, last_seen_at]
+        self._pending = dict()
+
+        # Users not recorded since the last flush, the buffer was full
+        self.dropped = 0
+
+        self._task: asyncio.Task = None
+
+    async def setup(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Stop the periodic flush and write what is left
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        await self._flush_once()
+
+    def login(self, user_id: str, group_id: str):
+        now = datetime.datetime.now()
+        self._record(user_id, group_id, now, now)
+
+    def seen(self, user_id: str, group_id: str):
+        self._record(user_id, group_id, None, datetime.datetime.now())
+
+    def _record(self, user_id, group_id, last_login_at, last_seen_at):
+        if not user_id or not group_id:
+            return
+
+        user_id = str(user_id)
+        entry = self._pending.get(user_id)
+        if entry is None:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending[user_id] = [str(group_id), last_login_at, last_seen_at]
+            return
+
+        if last_login_at is not None:
+            entry[1] = last_login_at
+        entry[2] = last_seen_at
+
+    async def flush(self):
+        """
+        Write the buffered times, one UPDATE per database
+        """
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, dict()
+        try:
+            await self.user_table.record_activity(
+                {user_id: tuple(entry) for user_id, entry in pending.items()}
+            )
+        except Exception:
+            # Keep them for the next flush, the times recorded meanwhile win
+            for user_id, entry in pending.items():
+                if user_id in self._pending:
+                    current = self._pending[user_id]
+                    current[1] = current[1] or entry[1]
+                elif len(self._pending) < self.max_pending:
+                    self._pending[user_id] = entry
+                else:
+                    self.dropped += 1
+            raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_once()
+
+    async def _flush_once(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            self.logger.error(f"{__name__}: Error flushing user activity - {e}")
+
+        if self.dropped:
+            self.logger.warning(
+                f"{__name__}: Activity of {self.dropped} users dropped, the buffer was full"
+            )
+            self.dropped = 0
@@ -0,0 +1,163 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import json
+import os
+
+from db.tables.audit import AuditTable
+from utils.logger import Logger
+
+
+class AuditLog:
+    """
+    Audit events queued in memory and written in batches by a background task
+
+    Recording never waits: a full queue drops the event and counts it. While
+    the database fails, batches are appended to the spill file as JSON lines
+    and copied back in one COPY once a write succeeds again.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        audit_table: AuditTable,
+        max_queue: int = 10000,
+        batch: int = 1000,
+        spill_path: str = None,
+        spill_max_bytes: int = 64 * 1024 * 1024,
+    ):
+        # Initialize
+        self.logger = logger
+        self.audit_table = audit_table
+        self.batch = batch  # Events written at most by one COPY
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+
+        # Events dropped with the queue full, and lost with no room to spill
+        self.dropped = 0
+        self.lost = 0
+        self._reported = (0, 0)
+
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task = None
+
+    async def setup(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        Write the queued events and stop the task
+        """
+        if self._task:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+        self._report()
+
+    def record(
+        self,
+        event: str,
+        outcome: str = "ok",
+        detail: str = None,
+        group_id: str = None,
+        user_id: str = None,
+        email: str = None,
+        peer: str = None,
+    ):
+        """
+        Queue an event, never blocks the caller
+        """
+        try:
+            self._queue.put_nowait(
+                (
+                    datetime.datetime.now(tz=datetime.timezone.utc),
+                    event,
+                    outcome,
+                    detail,
+                    group_id,
+                    str(user_id) if user_id else None,
+                    email,
+                    peer,
+                )
+            )
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            rows = [await self._queue.get()]
+            while len(rows) < self.batch and not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+
+            stop = None in rows
+            rows = [row for row in rows if row is not None]
+            if rows:
+                await self._write(rows)
+            self._report()
+
+            if stop:
+                return
+
+    async def _write(self, rows: list):
+        try:
+            # Spilled events first, they are older
+            if self.spill_path and os.path.exists(self.spill_path):
+                await self._replay()
+            await self.audit_table.copy(rows)
+        except Exception as e:
+            self.logger.error(f"{__name__}: Error writing audit events - {e}")
+            await self._spill(rows)
+
+    async def _spill(self, rows: list):
+        if not self.spill_path:
+            self.lost += len(rows)
+            return
+
+        try:
+            self.lost += await asyncio.to_thread(self._append, rows)
+        except OSError as e:
+            self.logger.error(f"{__name__}: Error spilling audit events - {e}")
+            self.lost += len(rows)
+
+    def _append(self, rows: list) -> int:
+        # Returns how many rows did not fit
+        size = (
+            os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+        )
+        with open(self.spill_path, "a") as file:
+            for index, row in enumerate(rows):
+                line = json.dumps([row[0].isoformat(), *row[1:]]) + "\n"
+                if size + len(line) > self.spill_max_bytes:
+                    return len(rows) - index
+                file.write(line)
+                size += len(line)
+        return 0
+
+    async def _replay(self):
+        rows = await asyncio.to_thread(self._read)
+        if rows:
+            await self.audit_table.copy(rows)
+        os.remove(self.spill_path)
+        self.logger.info(f"{__name__}: Replayed {len(rows)} spilled audit events")
+
+    def _read(self) -> list:
+        rows = list()
+        with open(self.spill_path) as file:
+            for line in file:
+                try:
+                    values = json.loads(line)
+                except ValueError:
+                    # Torn by a crash while appending
+                    self.lost += 1
+                    continue
+                rows.append((datetime.datetime.fromisoformat(values[0]), *values[1:]))
+        return rows
+
+    def _report(self):
+        if (self.dropped, self.lost) != self._reported:
+            self._reported = (self.dropped, self.lost)
+            self.logger.warning(
+                f"{__name__}: Audit events dropped {self.dropped} with the queue full, lost {self.lost} without the database"
+            )
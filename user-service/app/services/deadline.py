@@ -0,0 +1,56 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+import grpc
+
+import services.errors as errors
+
+
+class DeadlineInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Answer DEADLINE_EXCEEDED when the deadline of the call runs out in a query
+
+    The tables raise asyncio.TimeoutError once the remaining deadline is spent,
+    which grpc would otherwise send as UNKNOWN.
+    """
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return handler
+
+        if handler.unary_stream is not None:
+            return self._bounded_stream(handler)
+        if handler.unary_unary is None:
+            return handler
+
+        behavior = handler.unary_unary
+
+        async def bounded(request, context):
+            try:
+                return await behavior(request, context)
+            except asyncio.TimeoutError:
+                await context.abort_with_status(errors.DEADLINE_EXCEEDED)
+
+        return grpc.unary_unary_rpc_method_handler(
+            bounded,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+    def _bounded_stream(self, handler):
+        behavior = handler.unary_stream
+
+        async def bounded(request, context):
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            except asyncio.TimeoutError:
+                await context.abort_with_status(errors.DEADLINE_EXCEEDED)
+
+        return grpc.unary_stream_rpc_method_handler(
+            bounded,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
@@ -0,0 +1,145 @@
+# 2024 amicroservice author.
+
+import collections
+import functools
+
+import grpc
+from google.protobuf import any_pb2
+from google.rpc import status_pb2
+
+import buf.user.user_pb2 as user_pb2
+
+# Trailing metadata key of the rich status, as used by grpc_status
+GRPC_DETAILS_METADATA_KEY = "grpc-status-details-bin"
+
+
+class _Status(
+    collections.namedtuple("_Status", ("code", "details", "trailing_metadata")),
+    grpc.Status,
+):
+    """
+    Immutable status accepted by context.abort_with_status
+    """
+
+
+@functools.lru_cache(maxsize=1024)
+def error_detail(name: str, code: str) -> bytes:
+    """
+    Serialized Status fragment holding one packed ErrorField
+    """
+    detail = any_pb2.Any()
+    detail.Pack(user_pb2.ErrorField(name=name, code=code))
+    return status_pb2.Status(details=[detail]).SerializeToString()
+
+
+def build_status(code: grpc.StatusCode, message: str, details: bytes) -> _Status:
+    """
+    Build a status from prebuilt details, concatenated fragments merge as repeated
+    """
+    status = status_pb2.Status(code=code.value[0], message=message)
+    return _Status(
+        code,
+        message,
+        ((GRPC_DETAILS_METADATA_KEY, status.SerializeToString() + details),),
+    )
+
+
+# Static errors, built once
+TOKEN_REQUIRED = build_status(
+    grpc.StatusCode.UNAUTHENTICATED,
+    "Authorization token is required",
+    error_detail("token", "required"),
+)
+TOKEN_INVALID = build_status(
+    grpc.StatusCode.PERMISSION_DENIED,
+    "Authorization token is invalid or expired",
+    error_detail("authorization", "invalid"),
+)
+GROUP_NOT_FOUND = build_status(
+    grpc.StatusCode.NOT_FOUND,
+    "Group is not found",
+    error_detail("group_id", "not_found"),
+)
+GROUP_INVITATION_ONLY = build_status(
+    grpc.StatusCode.PERMISSION_DENIED,
+    "This group is for invitation only",
+    error_detail("group_id", "forbidden"),
+)
+PASSWORD_INVALID = build_status(
+    grpc.StatusCode.UNAUTHENTICATED,
+    "Password is invalid or not correct",
+    error_detail("password", "invalid"),
+)
+FIELD_MASK_INVALID = build_status(
+    grpc.StatusCode.INVALID_ARGUMENT,
+    "Field mask has unknown User fields",
+    error_detail("field_mask", "invalid"),
+)
+LOGIN_THROTTLED = build_status(
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    "Too many login attempts, try again later",
+    error_detail("login", "throttled"),
+)
+USER_TOKEN_REQUIRED = build_status(
+    grpc.StatusCode.PERMISSION_DENIED,
+    "A user token is required, service tokens may only watch",
+    error_detail("authorization", "forbidden"),
+)
+WATCH_FORBIDDEN = build_status(
+    grpc.StatusCode.PERMISSION_DENIED,
+    "Only service tokens may watch other users",
+    error_detail("ids", "forbidden"),
+)
+WATCH_IDS_REQUIRED = build_status(
+    grpc.StatusCode.INVALID_ARGUMENT,
+    "Service tokens must give the ids to watch",
+    error_detail("ids", "required"),
+)
+WATCH_TOO_SLOW = build_status(
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    "Watch fell too far behind the changes, watch again",
+    error_detail("watch", "too_slow"),
+)
+DEADLINE_EXCEEDED = build_status(
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    "Deadline of the call is exceeded",
+    error_detail("deadline", "exceeded"),
+)
+WATCH_UNAVAILABLE = build_status(
+    grpc.StatusCode.UNIMPLEMENTED,
+    "Watch is not enabled on this server",
+    error_detail("watch", "unavailable"),
+)
+LOGOUT_UNAVAILABLE = build_status(
+    grpc.StatusCode.UNIMPLEMENTED,
+    "Logout is not enabled on this server, tokens cannot be revoked",
+    error_detail("logout", "unavailable"),
+)
+
+
+# Parameterized errors, only the message is built per call
+def email_already_exists(message: str) -> _Status:
+    return build_status(
+        grpc.StatusCode.ALREADY_EXISTS,
+        message,
+        error_detail("email", "already_exists"),
+    )
+
+
+def email_not_found(email: str, group_id: str) -> _Status:
+    return build_status(
+        grpc.StatusCode.NOT_FOUND,
+        f"Email {email} in group {group_id} is not found",
+        error_detail("email", "not_found"),
+    )
+
+
+def validation_failed(errors) -> _Status:
+    """
+    INVALID_ARGUMENT with one ErrorField per protovalidate violation
+    """
+    return build_status(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        "Validation field is error",
+        b"".join(error_detail(err.field_path, err.constraint_id) for err in errors),
+    )
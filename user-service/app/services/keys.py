@@ -0,0 +1,240 @@
+# 2024 amicroservice author.
+
+import argparse
+import datetime
+import os
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+
+import buf.user.user_pb2 as user_pb2
+
+
+class SigningKey:
+    """
+    Token key tagged by kid, the private part is None for a retiring key
+    """
+
+    def __init__(self, kid: str, public_key, private_key=None):
+        self.kid = kid
+        self.public_key = public_key
+        self.private_key = private_key
+
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            self.algorithm = "EdDSA"
+        elif isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(
+            public_key.curve, ec.SECP256R1
+        ):
+            self.algorithm = "ES256"
+        else:
+            raise ValueError(f"Key {kid} is neither Ed25519 nor P-256")
+
+    def jwk(self) -> user_pb2.Key:
+        if self.algorithm == "EdDSA":
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            jwk = ECAlgorithm.to_jwk(self.public_key, as_dict=True)
+
+        return user_pb2.Key(
+            kid=self.kid,
+            kty=jwk["kty"],
+            alg=self.algorithm,
+            crv=jwk["crv"],
+            x=jwk["x"],
+            y=jwk.get("y", ""),
+            use="sig",
+        )
+
+
+class KeyRing:
+    """
+    Sign tokens with the active key and verify them by kid
+
+    Keys live in a directory as "<kid>.pem" private keys, "<kid>.next.pem"
+    keys published but not signing yet, and "<kid>.pub.pem" public keys of
+    retiring signers. The active key is the given kid or the last private
+    key by name. Without a directory tokens are HS256 with the
+    secret. With one, tokens without kid are rejected unless accept_hs256 is
+    set, for the migration from the secret until its last token expires.
+    """
+
+    def __init__(
+        self,
+        secret: str = None,
+        keys_dir: str = None,
+        active_kid: str = None,
+        max_age: int = 3600,
+        accept_hs256: bool = False,
+    ):
+        # Initialize
+        self.secret = secret
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.max_age = max_age  # Seconds the published key set may be cached
+        self.accept_hs256 = accept_hs256 or not keys_dir
+
+        self.keys = dict()
+        self.active: SigningKey = None
+        self.key_set = user_pb2.KeySet(max_age_seconds=max_age)
+
+        if keys_dir:
+            self.load()
+
+    def load(self):
+        """
+        Read the key directory, call again to pick up a rotation
+        """
+        keys = dict()
+        for name in sorted(os.listdir(self.keys_dir)):
+            path = os.path.join(self.keys_dir, name)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            if name.endswith(".pub.pem"):
+                kid = name[: -len(".pub.pem")]
+                keys.setdefault(
+                    kid, SigningKey(kid, serialization.load_pem_public_key(data))
+                )
+            elif name.endswith(".next.pem"):
+                # Verifies, signs once activated on every server
+                kid = name[: -len(".next.pem")]
+                private_key = serialization.load_pem_private_key(data, password=None)
+                keys.setdefault(kid, SigningKey(kid, private_key.public_key()))
+            elif name.endswith(".pem"):
+                kid = name[: -len(".pem")]
+                private_key = serialization.load_pem_private_key(data, password=None)
+                keys[kid] = SigningKey(kid, private_key.public_key(), private_key)
+
+        signers = [key for key in keys.values() if key.private_key is not None]
+        if self.active_kid:
+            active = keys.get(self.active_kid)
+            if active is None or active.private_key is None:
+                raise ValueError(f"Active key {self.active_kid} has no private key")
+        elif signers:
+            active = signers[-1]
+        else:
+            # Signing with the secret instead would go unnoticed
+            raise ValueError(f"Key directory {self.keys_dir} has no private key")
+
+        self.keys = keys
+        self.active = active
+        self.key_set = user_pb2.KeySet(
+            keys=[key.jwk() for key in keys.values()], max_age_seconds=self.max_age
+        )
+
+    def encode(self, payload: dict) -> str:
+        if self.active is None:
+            return jwt.encode(payload, self.secret, algorithm="HS256")
+
+        return jwt.encode(
+            payload,
+            self.active.private_key,
+            algorithm=self.active.algorithm,
+            headers={"kid": self.active.kid},
+        )
+
+    def decode(self, token: str) -> dict:
+        """
+        Verified claims, raises jwt.InvalidTokenError
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if not self.secret or not self.accept_hs256:
+                raise jwt.InvalidTokenError("Token has no kid")
+            return jwt.decode(token, self.secret, algorithms=["HS256"])
+
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown kid {kid}")
+
+        return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+
+def generate(keys_dir: str, algorithm: str = "EdDSA") -> str:
+    """
+    Write a new key named by the current time, published but not signing
+
+    Servers that reloaded verify its tokens before any server signs with it,
+    activate makes it the next active signer.
+    """
+    if algorithm == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+
+    kid = time.strftime("%Y%m%d%H%M%S")
+    path = os.path.join(keys_dir, f"{kid}.next.pem")
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+        file.write(
+            private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return kid
+
+
+def activate(keys_dir: str, kid: str):
+    """
+    Sign with a generated key from the next reload
+    """
+    os.rename(
+        os.path.join(keys_dir, f"{kid}.next.pem"), os.path.join(keys_dir, f"{kid}.pem")
+    )
+
+
+def retire(keys_dir: str, kid: str):
+    """
+    Keep only the public part of a key, tokens it signed still verify
+    """
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    with open(path, "rb") as file:
+        private_key = serialization.load_pem_private_key(file.read(), password=None)
+
+    with open(os.path.join(keys_dir, f"{kid}.pub.pem"), "wb") as file:
+        file.write(
+            private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+        )
+    os.remove(path)
+
+
+def service_token(key_ring: KeyRing, service: str, days: int = 365) -> str:
+    """
+    Token of a service caller, which may Watch any user
+    """
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return key_ring.encode(
+        {"exp": now + datetime.timedelta(days=days), "iat": now, "service": service}
+    )
+
+
+# Rotate: generate a key and SIGHUP the servers, wait for JWT_KEYS_MAX_AGE so
+# verifiers hold it, then activate it, SIGHUP again and retire the previous kid.
+# Service callers get a long-lived token with `token <keys_dir> --service <name>`
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage token signing keys")
+    parser.add_argument("command", choices=("generate", "activate", "retire", "token"))
+    parser.add_argument("keys_dir")
+    parser.add_argument("--algorithm", choices=("EdDSA", "ES256"), default="EdDSA")
+    parser.add_argument("--kid")
+    parser.add_argument("--service", help="Name of the service for a token")
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print(generate(args.keys_dir, algorithm=args.algorithm))
+    elif args.command == "activate":
+        activate(args.keys_dir, args.kid)
+    elif args.command == "retire":
+        retire(args.keys_dir, args.kid)
+    else:
+        # HS256 with JWT_SECRET when the key directory is ""
+        key_ring = KeyRing(secret=os.getenv("JWT_SECRET"), keys_dir=args.keys_dir)
+        print(service_token(key_ring, args.service, days=args.days))
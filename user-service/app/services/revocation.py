@@ -0,0 +1,160 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import time
+import uuid
+
+from db.invalidation import InvalidationBus
+from db.tables.revocation import RevocationTable
+from utils.logger import Logger
+
+
+class RevocationList:
+    """
+    Revoked token ids and per-user cutoffs held in memory, refreshed from the table
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        revocation_table: RevocationTable,
+        poll_interval: float = 2.0,
+        lookback: float = 60.0,
+        bus: InvalidationBus = None,
+    ):
+        # Initialize
+        self.logger = logger
+        self.revocation_table = revocation_table
+        self.poll_interval = poll_interval  # Seconds between two refreshes
+        self.lookback = lookback  # Seconds of rows read again on each refresh
+
+        # Revoked jti, as the integer of the uuid, to its expiry
+        self._tokens = dict()
+
+        # User id to (not_before, expiry), tokens issued before are revoked
+        self._users = dict()
+
+        self._seq = 0
+        self._pruned = time.time()
+        self._task: asyncio.Task = None
+
+        # Refresh as soon as another server revokes, the poll is the fallback
+        self._refresh: asyncio.Task = None
+        if bus:
+            bus.subscribe("revocation", self._revoked_elsewhere)
+
+    async def setup(self):
+        """
+        Load the unexpired revocations and start polling for new ones
+        """
+        await self.refresh()
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+        self.logger.info(
+            f"{__name__}: Loaded {len(self._tokens)} revoked tokens and {len(self._users)} user cutoffs"
+        )
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_revoked(self, pay_load: dict) -> bool:
+        """
+        Check token claims against the revocations, memory only
+        """
+        jti = pay_load.get("jti")
+        if jti is not None and self._token_key(jti) in self._tokens:
+            return True
+
+        cutoff = self._users.get(pay_load.get("user_id"))
+        return cutoff is not None and pay_load.get("iat", 0) < cutoff[0]
+
+    async def revoke_token(
+        self, jti: str, user_id: str, expires_at: datetime.datetime, context=None
+    ):
+        await self.revocation_table.revoke_token(
+            jti=jti, user_id=user_id, expires_at=expires_at, context=context
+        )
+        self._revoke_token(jti, expires_at.timestamp())
+
+    async def revoke_user(
+        self,
+        user_id: str,
+        not_before: datetime.datetime,
+        expires_at: datetime.datetime,
+        context=None,
+    ):
+        await self.revocation_table.revoke_user(
+            user_id=user_id,
+            not_before=not_before,
+            expires_at=expires_at,
+            context=context,
+        )
+        self._revoke_user(user_id, not_before.timestamp(), expires_at.timestamp())
+
+    async def refresh(self):
+        """
+        Apply the rows added since the last refresh
+        """
+        recent = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(
+            seconds=self.lookback
+        )
+        records = await self.revocation_table.changes(since=self._seq, recent=recent)
+
+        for record in records:
+            expiry = record["expires_at"].timestamp()
+            if record["jti"] is not None:
+                self._revoke_token(record["jti"], expiry)
+            else:
+                self._revoke_user(
+                    str(record["user_id"]), record["not_before"].timestamp(), expiry
+                )
+            self._seq = max(self._seq, record["seq"])
+
+        # Forget revocations of tokens that have expired anyway
+        now = time.time()
+        if now - self._pruned >= self.lookback:
+            self._tokens = {k: v for k, v in self._tokens.items() if v > now}
+            self._users = {k: v for k, v in self._users.items() if v[1] > now}
+            self._pruned = now
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self._poll_once()
+
+    def _revoked_elsewhere(self, key, data):
+        # One refresh at a time, it reads every row added meanwhile
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.get_running_loop().create_task(self._poll_once())
+
+    async def _poll_once(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.logger.error(f"{__name__}: Error refreshing revocations - {e}")
+
+    def _revoke_token(self, jti: str, expiry: float):
+        self._tokens[self._token_key(jti)] = expiry
+
+    def _revoke_user(self, user_id: str, not_before: float, expiry: float):
+        # Keep the latest cutoff, a user may log out everywhere more than once
+        current = self._users.get(user_id)
+        if current is None or not_before >= current[0]:
+            self._users[user_id] = (
+                not_before,
+                max(expiry, current[1] if current else 0),
+            )
+
+    def _token_key(self, jti: str):
+        # A uuid as an int is far smaller than its text
+        try:
+            return uuid.UUID(jti).int
+        except ValueError:
+            return jti
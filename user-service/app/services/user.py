@@ -2,23 +2,247 @@
 
 import datetime
 import json
+import time
+import uuid
 from logging import Logger
 
 import asyncpg
+import grpc
 import jwt
 import protovalidate
-from google.protobuf import any_pb2
-from google.rpc import code_pb2, status_pb2
-from grpc_status import rpc_status
+from google.protobuf import message_factory
 
 import buf.user.user_pb2 as user_pb2
 import buf.user.user_pb2_grpc as user_pb2_grpc
-from db.models.group import GroupModel
-from db.models.groupuser import GroupuserModel
+import services.errors as errors
+from db.backends.base import (
+    GroupRecord,
+    GroupStorage,
+    GroupuserRecord,
+    GroupuserStorage,
+)
+from db.invalidation import InvalidationBus
 from db.models.user import UserModel
-from db.tables.group import GroupTable
-from db.tables.groupuser import GroupuserTable
 from db.tables.user import UserTable
+from services.activity import ActivityTracker
+from services.audit import AuditLog
+from services.keys import KeyRing
+from services.revocation import RevocationList
+from services.watch import WatchHub
+from utils.cache import LRUCache, NegativeCache
+from utils.idempotency import IdempotencyStore
+from utils.ratelimit import TokenBucketLimiter
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Lifetime of the tokens issued by Login
+TOKEN_LIFETIME = datetime.timedelta(days=30)
+
+
+def set_timestamp(timestamp, value: datetime.datetime):
+    """
+    Fill a Timestamp field in place, naive values are taken as UTC
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+
+    delta = value - _EPOCH
+    timestamp.seconds = delta.days * 86400 + delta.seconds
+    timestamp.nanos = delta.microseconds * 1000
+
+
+def user_message(user_model: UserModel, fields: tuple = None) -> user_pb2.User:
+    """
+    Convert a user model into the User message, only the given fields if any
+    """
+    if fields:
+        return _partial_user_message(user_model, fields)
+
+    message = user_pb2.User(
+        id=str(user_model.id),
+        group_id=str(user_model.group_id),
+        email=user_model.email,
+        first_name=user_model.first_name,
+        last_name=user_model.last_name,
+    )
+
+    if user_model.created_at:
+        set_timestamp(message.created_at, user_model.created_at)
+    if user_model.updated_at:
+        set_timestamp(message.updated_at, user_model.updated_at)
+    if user_model.last_login_at:
+        set_timestamp(message.last_login_at, user_model.last_login_at)
+
+    return message
+
+
+def _partial_user_message(user_model: UserModel, fields: tuple) -> user_pb2.User:
+    message = user_pb2.User()
+    for field in fields:
+        value = getattr(user_model, field)
+        if value is None:
+            continue
+
+        if field in ("created_at", "updated_at", "last_login_at"):
+            set_timestamp(getattr(message, field), value)
+        elif field in ("id", "group_id"):
+            setattr(message, field, str(value))
+        else:
+            setattr(message, field, value)
+
+    return message
+
+
+def timestamp_micros(value: datetime.datetime) -> int:
+    """
+    Microseconds since the epoch, naive values are taken as UTC
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def profile_claims(user_model: UserModel) -> dict:
+    """
+    Versioned profile snapshot embedded in a token
+    """
+    profile = {
+        "v": timestamp_micros(user_model.updated_at) if user_model.updated_at else 0,
+        "group_id": str(user_model.group_id),
+        "email": user_model.email,
+        "first_name": user_model.first_name,
+        "last_name": user_model.last_name,
+    }
+
+    # A row without its times leaves them out of the snapshot
+    for column in ("created_at", "updated_at"):
+        value = getattr(user_model, column)
+        if value is not None:
+            profile[column] = timestamp_micros(value)
+
+    return profile
+
+
+def _claims_time(profile: dict, name: str) -> datetime.datetime:
+    micros = profile.get(name)
+    if micros is None:
+        return None
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def claims_user(user_id: str, profile: dict) -> UserModel:
+    """
+    User model rebuilt from a token profile snapshot
+    """
+    return UserModel.from_columns(
+        {
+            "id": user_id,
+            "group_id": profile.get("group_id"),
+            "email": profile.get("email"),
+            "first_name": profile.get("first_name"),
+            "last_name": profile.get("last_name"),
+            "created_at": _claims_time(profile, "created_at"),
+            "updated_at": _claims_time(profile, "updated_at"),
+        }
+    )
+
+
+def metadata_value(context, name: str) -> str:
+    """
+    Last value of the invocation metadata key, None if absent
+    """
+    value = None
+    for key, item in context.invocation_metadata():
+        if key == name:
+            value = item
+    return value
+
+
+class AbortRecorder:
+    """
+    Context proxy that records the abort status instead of aborting the RPC
+    """
+
+    class Aborted(Exception):
+        pass
+
+    def __init__(self, context, timeout: float = None):
+        self.context = context
+        self.status = None
+
+        # Own deadline for a call that outlives the RPC, the RPC's if None
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def time_remaining(self):
+        if self.deadline is None:
+            return self.context.time_remaining()
+        return self.deadline - time.monotonic()
+
+    async def abort_with_status(self, status):
+        self.status = status
+        raise AbortRecorder.Aborted()
+
+
+def peer_address(context) -> str:
+    """
+    Address of the peer without the port, e.g. "ipv4:10.0.0.1"
+    """
+    peer = context.peer() or ""
+    return peer.rsplit(":", 1)[0] if peer.count(":") > 1 else peer
+
+
+def serialize_user(response) -> bytes:
+    """
+    Serialize a User message, pre-serialized bytes are sent as they are
+    """
+    if isinstance(response, bytes):
+        return response
+    return response.SerializeToString()
+
+
+# Handler factory by (client streaming, server streaming)
+_METHOD_HANDLERS = {
+    (False, False): grpc.unary_unary_rpc_method_handler,
+    (False, True): grpc.unary_stream_rpc_method_handler,
+    (True, False): grpc.stream_unary_rpc_method_handler,
+    (True, True): grpc.stream_stream_rpc_method_handler,
+}
+
+
+def add_user_service_to_server(servicer, server):
+    """
+    Register the service like the generated helper, with the raw-bytes User path
+
+    The handlers are built from the service descriptor, so they follow
+    user.proto like the generated helper does.
+    """
+    service = user_pb2.DESCRIPTOR.services_by_name["UserService"]
+
+    rpc_method_handlers = dict()
+    for method in service.methods:
+        request_class = message_factory.GetMessageClass(method.input_type)
+        response_class = message_factory.GetMessageClass(method.output_type)
+        handler = _METHOD_HANDLERS[(method.client_streaming, method.server_streaming)]
+        rpc_method_handlers[method.name] = handler(
+            getattr(servicer, method.name),
+            request_deserializer=request_class.FromString,
+            response_serializer=(
+                serialize_user
+                if response_class is user_pb2.User
+                else response_class.SerializeToString
+            ),
+        )
+
+    generic_handler = grpc.method_handlers_generic_handler(
+        service.full_name, rpc_method_handlers
+    )
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers(service.full_name, rpc_method_handlers)
 
 
 class UserService(user_pb2_grpc.UserService):
@@ -29,10 +253,24 @@ class UserService(user_pb2_grpc.UserService):
     def __init__(
         self,
         logger: Logger,
-        group_table: GroupTable,
-        groupuser_table: GroupuserTable,
+        group_table: GroupStorage,
+        groupuser_table: GroupuserStorage,
         user_table: UserTable,
         jwt_secret: str,
+        response_cache: LRUCache = None,
+        missing_users: NegativeCache = None,
+        missing_groups: NegativeCache = None,
+        account_limiter: TokenBucketLimiter = None,
+        peer_limiter: TokenBucketLimiter = None,
+        idempotency: IdempotencyStore = None,
+        embed_profile: bool = False,
+        user_versions: LRUCache = None,
+        key_ring: KeyRing = None,
+        revocations: RevocationList = None,
+        bus: InvalidationBus = None,
+        watch_hub: WatchHub = None,
+        activity: ActivityTracker = None,
+        audit_log: AuditLog = None,
     ) -> None:
         super().__init__()
 
@@ -42,139 +280,278 @@ class UserService(user_pb2_grpc.UserService):
         self.groupuser_table = groupuser_table
         self.jwt_secret = jwt_secret
 
-    async def user_authorization_context(self, context) -> UserModel:
-        token = None
-        for key, value in context.invocation_metadata():
-            if key == "authorization":
-                token = value
+        # Signs tokens and verifies them by kid, HS256 with the secret by default
+        self.key_ring = key_ring or KeyRing(secret=jwt_secret)
+
+        # Serialized User by user id, with the updated_at it was built from.
+        # Saves the serialization only, Get still reads the row
+        self.response_cache = response_cache
+
+        # Recently missing (group_id, email) and group_id, answered without the DB
+        self.missing_users = missing_users
+        self.missing_groups = missing_groups
+
+        # Login attempts by (group_id, email) and by peer address
+        self.account_limiter = account_limiter
+        self.peer_limiter = peer_limiter
+
+        # Outcomes of Register by idempotency key
+        self.idempotency = idempotency
+
+        # Tokens carry a profile snapshot, checked against the latest known version
+        self.embed_profile = embed_profile
+        self.user_versions = user_versions
+
+        # Revoked tokens, checked on every authorized call
+        self.revocations = revocations
+
+        # Changes made by other servers, so the caches above can live long
+        self.bus = bus
+        if bus:
+            bus.subscribe("user", self.user_changed)
+
+        # Streams user changes to the Watch calls
+        self.watch_hub = watch_hub
+
+        # Last login and seen times, written behind in batches
+        self.activity = activity
+
+        # Register, Login and Update outcomes, written behind in batches
+        self.audit_log = audit_log
+
+    async def token_payload(self, context, service: bool = False) -> dict:
+        """
+        Claims of the authorization token, aborts if missing or invalid
+
+        Service tokens have no user, they are refused unless service is set.
+        """
+        token = metadata_value(context, "authorization")
 
         if token:
             try:
-                pay_load = jwt.decode(token, self.jwt_secret, algorithms=["HS256"])
-            except jwt.InvalidSignatureError:
-                detail = any_pb2.Any()
-                detail.Pack(user_pb2.ErrorField(name="authorization", code="invalid"))
-                await context.abort_with_status(
-                    rpc_status.to_status(
-                        status_pb2.Status(
-                            code=code_pb2.PERMISSION_DENIED,
-                            message="Authorization token is invalid or expired",
-                            details=[detail],
-                        )
-                    )
-                )
+                pay_load = self.key_ring.decode(token)
+            except jwt.InvalidTokenError:
+                await context.abort_with_status(errors.TOKEN_INVALID)
+
+            if self.revocations is not None and self.revocations.is_revoked(pay_load):
+                await context.abort_with_status(errors.TOKEN_INVALID)
+
+            if pay_load and not service and not pay_load.get("user_id"):
+                await context.abort_with_status(errors.USER_TOKEN_REQUIRED)
 
             if pay_load:
-                user = await self.user_table.get(id=pay_load.get("user_id"))
-                return user
-
-        detail = any_pb2.Any()
-        detail.Pack(user_pb2.ErrorField(name="token", code="required"))
-        await context.abort_with_status(
-            rpc_status.to_status(
-                status_pb2.Status(
-                    code=code_pb2.UNAUTHENTICATED,
-                    message="Authorization token is required",
-                    details=[detail],
+                return pay_load
+
+        await context.abort_with_status(errors.TOKEN_REQUIRED)
+
+    async def user_authorization_context(
+        self, context, fields: tuple = None, pay_load: dict = None
+    ) -> UserModel:
+        # Callers that already checked the token pass its claims
+        if pay_load is None:
+            pay_load = await self.token_payload(context)
+
+        # The group_id claim routes to the shard of the user
+        user = await self.user_table.get(
+            id=pay_load.get("user_id"),
+            context=context,
+            fields=fields,
+            group_id=pay_load.get("group_id"),
+        )
+        self.note_version(user)
+        self.seen(pay_load)
+
+        return user
+
+    def seen(self, pay_load: dict):
+        """
+        Record the activity of the token user, a no-op without a tracker
+        """
+        if self.activity is not None:
+            self.activity.seen(pay_load.get("user_id"), pay_load.get("group_id"))
+
+    def note_version(self, user_model: UserModel):
+        """
+        Remember the newest version seen for the user
+        """
+        if self.user_versions is None or not user_model:
+            return
+        if not user_model.id or not user_model.updated_at:
+            return
+
+        # Keyed like the user_id claim of the token
+        user_id = str(user_model.id)
+        version = timestamp_micros(user_model.updated_at)
+        if version > self.user_versions.get(user_id, 0):
+            self.user_versions.set(user_id, version)
+
+    def user_changed(self, key: tuple, data: dict):
+        """
+        Drop what a change of the user made stale, everything if key is None
+        """
+        if key is None:
+            if self.response_cache is not None:
+                self.response_cache.clear()
+            if self.missing_users is not None:
+                self.missing_users.clear()
+            return
+
+        if self.missing_users is not None:
+            self.missing_users.invalidate(key)
+
+        if data.get("id"):
+            if self.response_cache is not None:
+                self.response_cache.pop(data["id"])
+            if self.user_versions is not None and data.get("updated_at"):
+                version = timestamp_micros(
+                    datetime.datetime.fromisoformat(data["updated_at"])
                 )
+                if version > self.user_versions.get(data["id"], 0):
+                    self.user_versions.set(data["id"], version)
+
+    def generation(self, key: tuple):
+        """
+        Version of the user key on the bus, None without a bus
+        """
+        if self.bus is None:
+            return None
+        return self.bus.generation("user", key)
+
+    def token_user(self, pay_load: dict, max_staleness: float) -> UserModel:
+        """
+        User from the profile snapshot of the token, None if absent or too stale
+        """
+        profile = pay_load.get("profile")
+        if not profile or time.time() - pay_load.get("iat", 0) > max_staleness:
+            return None
+
+        # A newer version seen here means the snapshot is outdated
+        user_model = claims_user(pay_load["user_id"], profile)
+        if self.user_versions is not None and self.user_versions.get(
+            user_model.id, 0
+        ) > profile.get("v", 0):
+            return None
+
+        return user_model
+
+    def audit(self, event: str, context, outcome: str = "ok", **fields):
+        """
+        Record an audit event, a no-op without an audit log
+        """
+        if self.audit_log is not None:
+            self.audit_log.record(
+                event, outcome=outcome, peer=peer_address(context), **fields
             )
-        )
+
+    async def audited(self, event: str, context, call, **fields):
+        """
+        Run call(context), record its abort or error as a failed event
+        """
+        if self.audit_log is None:
+            return await call(context)
+
+        recorder = AbortRecorder(context)
+        try:
+            return await call(recorder)
+        except AbortRecorder.Aborted:
+            status = recorder.status
+            self.audit(
+                event,
+                context,
+                outcome=status.code.name.lower(),
+                detail=status.details,
+                **fields,
+            )
+            await context.abort_with_status(status)
+        except Exception as e:
+            self.audit(event, context, outcome="error", detail=str(e), **fields)
+            raise e
 
     async def duplicate_email(
         self, email: str, context, err: asyncpg.UniqueViolationError
     ):
-        if "users_group_id_email_key" in str(err.constraint_name):
-            detail = any_pb2.Any()
-            detail.Pack(user_pb2.ErrorField(name="email", code="already_exists"))
+        # users_group_id_email_key, or users_p<n>_... on a partition
+        if "group_id_email_key" in str(err.constraint_name):
             await context.abort_with_status(
-                rpc_status.to_status(
-                    status_pb2.Status(
-                        code=code_pb2.ALREADY_EXISTS,
-                        message=f"Email {email} is already exists",
-                        details=[detail],
-                    )
-                )
+                errors.email_already_exists(f"Email {email} is already exists")
             )
 
     async def Register(self, request, context):
         """
-        Register
+        Register, once per "idempotency-key" metadata when the client sends one
         """
-        register_request = user_pb2.RegisterRequest(
+        return await self.audited(
+            "register",
+            context,
+            lambda context: self._register_once(request, context),
             group_id=request.group_id,
             email=request.email,
-            password=request.password,
-            first_name=request.first_name,
-            last_name=request.last_name,
         )
 
+    async def _register_once(self, request, context):
+        idempotency_key = metadata_value(context, "idempotency-key")
+        if self.idempotency is None or not idempotency_key:
+            return await self._register(request, context)
+
+        # Scoped to the account so a key can never replay another user
+        kind, value = await self.idempotency.run(
+            (request.group_id, request.email, idempotency_key),
+            lambda: self._idempotent_register(request, context),
+        )
+        if kind == "status":
+            await context.abort_with_status(value)
+
+        return value
+
+    async def _idempotent_register(self, request, context) -> tuple:
+        """
+        Outcome of Register as ("user", serialized User) or ("status", grpc.Status)
+
+        Runs on after a client timeout so the retry finds it, within the
+        ttl of the store rather than the deadline of the first call.
+        """
+        recorder = AbortRecorder(context, timeout=self.idempotency.ttl)
         try:
-            protovalidate.validate(register_request)
-        except protovalidate.ValidationError as e:
-            details = list()
-            for err in e.errors():
-                detail = any_pb2.Any()
-                detail.Pack(
-                    user_pb2.ErrorField(name=err.field_path, code=err.constraint_id)
-                )
-                details.append(detail)
+            response = await self._register(request, recorder)
+        except AbortRecorder.Aborted:
+            return ("status", recorder.status)
 
-            if len(details) > 0:
-                await context.abort_with_status(
-                    rpc_status.to_status(
-                        status_pb2.Status(
-                            code=code_pb2.INVALID_ARGUMENT,
-                            message="Validation field is error",
-                            details=details,
-                        )
-                    )
-                )
+        return ("user", serialize_user(response))
+
+    async def _register(self, request, context):
+        try:
+            protovalidate.validate(request)
+        except protovalidate.ValidationError as e:
+            violations = e.errors()
+            if len(violations) > 0:
+                await context.abort_with_status(errors.validation_failed(violations))
 
         # Check if allowed register by Group
-        group_model: GroupModel = await self.group_table.get(request.group_id)
+        if self.missing_groups is not None and self.missing_groups.contains(
+            request.group_id
+        ):
+            await context.abort_with_status(errors.GROUP_NOT_FOUND)
+
+        group_model: GroupRecord = await self.group_table.get(request.group_id)
         if not group_model:
-            detail = any_pb2.Any()
-            detail.Pack(user_pb2.ErrorField(name="group_id", code="not_found"))
-            await context.abort_with_status(
-                rpc_status.to_status(
-                    status_pb2.Status(
-                        code=code_pb2.NOT_FOUND,
-                        message="Group is not found",
-                        details=[detail],
-                    )
-                )
-            )
+            if self.missing_groups is not None:
+                self.missing_groups.add(request.group_id)
+            await context.abort_with_status(errors.GROUP_NOT_FOUND)
 
         # Check allowed register by the group
         properties = json.loads(group_model.properties)
         if properties.get("invitation_only"):
-            groupuser_model: GroupuserModel = (
+            groupuser_model: GroupuserRecord = (
                 await self.groupuser_table.get_by_group_id_and_email(
                     group_id=request.group_id, email=request.email
                 )
             )
             if not groupuser_model:
-                detail = any_pb2.Any()
-                detail.Pack(user_pb2.ErrorField(name="group_id", code="forbidden"))
-                await context.abort_with_status(
-                    rpc_status.to_status(
-                        status_pb2.Status(
-                            code=code_pb2.PERMISSION_DENIED,
-                            message="This group is for invitation only",
-                            details=[detail],
-                        )
-                    )
-                )
+                await context.abort_with_status(errors.GROUP_INVITATION_ONLY)
             elif groupuser_model.user_id:
-                detail = any_pb2.Any()
-                detail.Pack(user_pb2.ErrorField(name="email", code="already_exists"))
                 await context.abort_with_status(
-                    rpc_status.to_status(
-                        status_pb2.Status(
-                            code=code_pb2.ALREADY_EXISTS,
-                            message=f"Email {groupuser_model.email} in group {groupuser_model.group_id} is already exists",
-                            details=[detail],
-                        )
+                    errors.email_already_exists(
+                        f"Email {groupuser_model.email} in group {groupuser_model.group_id} is already exists"
                     )
                 )
 
@@ -187,123 +564,271 @@ class UserService(user_pb2_grpc.UserService):
             password=request.password,
         )
 
+        user_model = None
         try:
-            await self.user_table.create(
-                new_user_model
+            user_model = await self.user_table.create(
+                new_user_model, context=context
             )  # Create a new user to the database
         except asyncpg.UniqueViolationError as err:
             await self.duplicate_email(email=request.email, context=context, err=err)
 
-        # Get a new User by email
-        user_model = await self.user_table.get_by_groud_id_and_email(
-            group_id=new_user_model.group_id, email=new_user_model.email
+        # The email is no longer missing in this group
+        if self.missing_users is not None:
+            self.missing_users.invalidate((request.group_id, request.email))
+
+        # Get a new User by email, unless the insert returned it
+        if user_model is None:
+            user_model = await self.user_table.get_by_groud_id_and_email(
+                group_id=new_user_model.group_id,
+                email=new_user_model.email,
+                context=context,
+            )
+
+        self.audit(
+            "register",
+            context,
+            group_id=request.group_id,
+            user_id=user_model.id,
+            email=request.email,
         )
 
         # Response endpoint
-        return user_pb2.User(
-            id=str(user_model.id),
-            created_at=user_model.created_at,
-            updated_at=user_model.updated_at,
-            group_id=str(user_model.group_id),
-            email=user_model.email,
-            first_name=user_model.first_name,
-            last_name=user_model.last_name,
-        )
+        return user_message(user_model)
 
     async def Login(self, request, context):
         """
         Login User
         """
-        login_request = user_pb2.LoginRequest(
+        return await self.audited(
+            "login",
+            context,
+            lambda context: self._login(request, context),
             group_id=request.group_id,
             email=request.email,
-            password=request.password,
         )
 
+    async def _login(self, request, context):
         try:
-            protovalidate.validate(login_request)
+            protovalidate.validate(request)
         except protovalidate.ValidationError as e:
-            details = list()
-            for err in e.errors():
-                detail = any_pb2.Any()
-                detail.Pack(
-                    user_pb2.ErrorField(name=err.field_path, code=err.constraint_id)
-                )
-                details.append(detail)
-
-            if len(details) > 0:
-                await context.abort_with_status(
-                    rpc_status.to_status(
-                        status_pb2.Status(
-                            code=code_pb2.INVALID_ARGUMENT,
-                            message="Validation field is error",
-                            details=details,
-                        )
-                    )
-                )
+            violations = e.errors()
+            if len(violations) > 0:
+                await context.abort_with_status(errors.validation_failed(violations))
+
+        # Throttle before any DB or bcrypt work
+        if self.peer_limiter is not None and not self.peer_limiter.allow(
+            peer_address(context)
+        ):
+            await context.abort_with_status(errors.LOGIN_THROTTLED)
+        if self.account_limiter is not None and not self.account_limiter.allow(
+            (request.group_id, request.email)
+        ):
+            await context.abort_with_status(errors.LOGIN_THROTTLED)
+
+        # Answer recent misses without the DB
+        missing_key = (request.group_id, request.email)
+        if self.missing_users is not None and self.missing_users.contains(missing_key):
+            await context.abort_with_status(
+                errors.email_not_found(email=request.email, group_id=request.group_id)
+            )
 
         # Get user by group and email
+        generation = self.generation(missing_key)
         user_model = await self.user_table.get_by_groud_id_and_email(
-            group_id=request.group_id, email=request.email
+            group_id=request.group_id, email=request.email, context=context
         )
         if not user_model:
-            detail = any_pb2.Any()
-            detail.Pack(user_pb2.ErrorField(name="email", code="not_found"))
+            # Unless the user was created elsewhere during the lookup
+            if self.missing_users is not None and generation == self.generation(
+                missing_key
+            ):
+                self.missing_users.add(missing_key)
             await context.abort_with_status(
-                rpc_status.to_status(
-                    status_pb2.Status(
-                        code=code_pb2.NOT_FOUND,
-                        message=f"Email {request.email} in group {request.group_id} is not found",
-                        details=[detail],
-                    )
-                )
+                errors.email_not_found(email=request.email, group_id=request.group_id)
             )
 
         if user_model.valid_password(password=request.password):
             # Add expire time
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            # iat to the microsecond, a datetime would be encoded in whole
+            # seconds and fall before a Logout earlier in the same second
             payload = {
-                "exp": datetime.datetime.now(tz=datetime.timezone.utc)
-                + datetime.timedelta(days=30),
+                "exp": now + TOKEN_LIFETIME,
+                "iat": now.timestamp(),
+                "jti": str(uuid.uuid4()),
                 "user_id": str(user_model.id),
+                "group_id": str(user_model.group_id),
             }
 
+            # Snapshot of the profile for Get without a lookup
+            if self.embed_profile:
+                payload["profile"] = profile_claims(user_model)
+
             # Encode token
-            token = jwt.encode(payload, self.jwt_secret, algorithm="HS256")
+            token = self.key_ring.encode(payload)
+
+            if self.activity is not None:
+                self.activity.login(user_model.id, user_model.group_id)
+
+            self.audit(
+                "login",
+                context,
+                group_id=request.group_id,
+                user_id=user_model.id,
+                email=request.email,
+            )
 
             return user_pb2.UserToken(token=token)
         else:
-            detail = any_pb2.Any()
-            detail.Pack(user_pb2.ErrorField(name="password", code="invalid"))
-            await context.abort_with_status(
-                rpc_status.to_status(
-                    status_pb2.Status(
-                        code=code_pb2.UNAUTHENTICATED,
-                        message="Password is invalid or not correct",
-                        details=[detail],
-                    )
-                )
-            )
+            await context.abort_with_status(errors.PASSWORD_INVALID)
 
     async def Get(self, request, context):
         """
         Get User
+
+        Reads the row on every call, the response cache only saves
+        serializing it again. A caller accepting max_staleness is answered
+        from the token without a read.
         """
-        user_model = await self.user_authorization_context(context=context)
+        # Only the fields of the mask are selected and returned. Nested paths
+        # such as "created_at.seconds" are valid for the descriptor but name
+        # no column
+        fields = None
+        if request.field_mask.paths:
+            fields = tuple(request.field_mask.paths)
+            if (
+                not request.field_mask.IsValidForDescriptor(user_pb2.User.DESCRIPTOR)
+                or any("." in field for field in fields)
+                or not any(field in UserModel.COLUMNS for field in fields)
+            ):
+                await context.abort_with_status(errors.FIELD_MASK_INVALID)
+
+        # Answer from the token when the caller accepts its age
+        pay_load = None
+        if request.HasField("max_staleness"):
+            pay_load = await self.token_payload(context)
+            user_model = self.token_user(
+                pay_load, request.max_staleness.ToTimedelta().total_seconds()
+            )
+            if user_model is not None:
+                self.seen(pay_load)
+                return user_message(user_model, fields=fields)
 
-        return user_pb2.User(
-            id=str(user_model.id),
-            created_at=user_model.created_at,
-            updated_at=user_model.updated_at,
-            group_id=str(user_model.group_id),
-            email=user_model.email,
-            first_name=user_model.first_name,
-            last_name=user_model.last_name,
+        user_model = await self.user_authorization_context(
+            context=context, fields=fields, pay_load=pay_load
+        )
+
+        if fields or self.response_cache is None:
+            return user_message(user_model, fields=fields)
+
+        # Reuse the serialized User while the row is unchanged, logins do
+        # not move updated_at
+        version = (user_model.updated_at, user_model.last_login_at)
+        cached = self.response_cache.get(str(user_model.id))
+        if cached and cached[0] == version:
+            return cached[1]
+
+        data = user_message(user_model).SerializeToString()
+        self.response_cache.set(str(user_model.id), (version, data))
+
+        return data
+
+    async def GetKeys(self, request, context):
+        """
+        Get the public token verification keys
+        """
+        await context.send_initial_metadata(
+            (("cache-control", f"public, max-age={self.key_ring.max_age}"),)
         )
 
+        return self.key_ring.key_set
+
+    async def Logout(self, request, context):
+        """
+        Logout User, revoke the token or every token of the user
+        """
+        pay_load = await self.token_payload(context)
+
+        # Without a revocation list the token would stay valid
+        if self.revocations is None:
+            await context.abort_with_status(errors.LOGOUT_UNAVAILABLE)
+
+        user_id = pay_load.get("user_id")
+        jti = pay_load.get("jti")
+        if jti and not request.all_sessions:
+            await self.revocations.revoke_token(
+                jti=jti,
+                user_id=user_id,
+                expires_at=datetime.datetime.fromtimestamp(
+                    pay_load["exp"], tz=datetime.timezone.utc
+                ),
+                context=context,
+            )
+        else:
+            # Tokens carry iat to the microsecond, so logins after this
+            # one, even in the same second, are kept
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+            await self.revocations.revoke_user(
+                user_id=user_id,
+                not_before=now,
+                expires_at=now + TOKEN_LIFETIME,
+                context=context,
+            )
+
+        return user_pb2.LogoutResponse()
+
+    async def Watch(self, request, context):
+        """
+        Watch Users, the caller or the given ids for a service token
+        """
+        try:
+            protovalidate.validate(request)
+        except protovalidate.ValidationError as e:
+            violations = e.errors()
+            if len(violations) > 0:
+                await context.abort_with_status(errors.validation_failed(violations))
+
+        if self.watch_hub is None:
+            await context.abort_with_status(errors.WATCH_UNAVAILABLE)
+
+        pay_load = await self.token_payload(context, service=True)
+        user_id = pay_load.get("user_id")
+        ids = tuple(dict.fromkeys(request.ids)) or (user_id,)
+        if pay_load.get("service"):
+            if ids == (None,):
+                await context.abort_with_status(errors.WATCH_IDS_REQUIRED)
+        elif ids != (user_id,):
+            await context.abort_with_status(errors.WATCH_FORBIDDEN)
+
+        # Subscribe first so no change between the reads and the stream is lost
+        watcher = self.watch_hub.subscribe(ids)
+        try:
+            for id in ids:
+                user_model = await self.user_table.get(
+                    id=id,
+                    context=context,
+                    group_id=pay_load.get("group_id") if id == user_id else None,
+                )
+                if user_model:
+                    yield user_message(user_model)
+
+            while True:
+                user_model = await watcher.queue.get()
+                if user_model is None:
+                    await context.abort_with_status(errors.WATCH_TOO_SLOW)
+                yield user_message(user_model)
+        finally:
+            self.watch_hub.unsubscribe(watcher)
+
     async def Update(self, request, context):
         """
         Update User
         """
+        return await self.audited(
+            "update", context, lambda context: self._update(request, context)
+        )
+
+    async def _update(self, request, context):
         update_user_model = await self.user_authorization_context(context=context)
 
         update_user_model.update(
@@ -314,18 +839,38 @@ class UserService(user_pb2_grpc.UserService):
         )
 
         try:
-            await self.user_table.update(user_model=update_user_model)
+            await self.user_table.update(user_model=update_user_model, context=context)
         except asyncpg.UniqueViolationError as err:
             await self.duplicate_email(email=request.email, context=context, err=err)
 
-        user_model = await self.user_table.get(id=update_user_model.id)
+        if self.response_cache is not None:
+            self.response_cache.pop(str(update_user_model.id))
+
+        # A changed email is no longer missing in the group
+        if self.missing_users is not None:
+            self.missing_users.invalidate(
+                (str(update_user_model.group_id), update_user_model.email)
+            )
 
-        return user_pb2.User(
-            id=str(user_model.id),
-            created_at=user_model.created_at,
-            updated_at=user_model.updated_at,
+        user_model = await self.user_table.get(
+            id=update_user_model.id,
+            context=context,
+            group_id=update_user_model.group_id,
+        )
+        self.note_version(user_model)
+
+        # Which fields changed, never their values
+        self.audit(
+            "update",
+            context,
+            detail=",".join(
+                field
+                for field in ("email", "first_name", "last_name", "password")
+                if getattr(request, field)
+            ),
             group_id=str(user_model.group_id),
+            user_id=user_model.id,
             email=user_model.email,
-            first_name=user_model.email,
-            last_name=user_model.last_name,
         )
+
+        return user_message(user_model)
@@ -0,0 +1,128 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+from db.invalidation import InvalidationBus
+from db.models.user import UserModel
+from db.tables.user import UserTable
+from utils.logger import Logger
+
+
+class Watcher:
+    """
+    Subscription of one Watch call, a bounded buffer of changed users
+    """
+
+    def __init__(self, ids: tuple, buffer: int):
+        self.ids = ids
+        self.queue = asyncio.Queue(maxsize=buffer)
+        self.evicted = False
+
+    def offer(self, user_model: UserModel) -> bool:
+        """
+        Buffer the update, False if the watcher has fallen too far behind
+        """
+        try:
+            self.queue.put_nowait(user_model)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def evict(self):
+        # Replace what is buffered by the end of stream marker
+        self.evicted = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class WatchHub:
+    """
+    Fan the user changes of the invalidation bus out to the Watch calls
+
+    Each change is read once, whatever the number of watchers.
+    A watcher whose buffer is full is evicted rather than slowing the others.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        user_table: UserTable,
+        bus: InvalidationBus,
+        buffer: int = 16,
+    ):
+        # Initialize
+        self.logger = logger
+        self.user_table = user_table
+        self.buffer = buffer  # Updates buffered per watcher
+
+        # User id to its watchers
+        self._watchers = dict()
+
+        # User ids changed and not yet published to their group id, or None
+        # if unknown, read by a single task
+        self._pending = dict()
+        self._task: asyncio.Task = None
+
+        bus.subscribe("user", self._changed)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def __len__(self) -> int:
+        return sum(len(watchers) for watchers in self._watchers.values())
+
+    def subscribe(self, ids: tuple) -> Watcher:
+        watcher = Watcher(ids, self.buffer)
+        for id in ids:
+            self._watchers.setdefault(id, set()).add(watcher)
+        return watcher
+
+    def unsubscribe(self, watcher: Watcher):
+        for id in watcher.ids:
+            watchers = self._watchers.get(id)
+            if watchers is None:
+                continue
+            watchers.discard(watcher)
+            if not watchers:
+                del self._watchers[id]
+
+    def _changed(self, key, data):
+        if key is None:
+            # Changes may have been missed, send every watched user again
+            self._pending.update(dict.fromkeys(self._watchers))
+        elif data.get("id") in self._watchers:
+            self._pending[data["id"]] = key[0]
+        else:
+            return
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._publish())
+
+    async def _publish(self):
+        while self._pending:
+            id, group_id = self._pending.popitem()
+            if id not in self._watchers:
+                continue
+
+            try:
+                user_model = await self.user_table.get(id=id, group_id=group_id)
+            except Exception as e:
+                self.logger.error(f"{__name__}: Error reading user {id} - {e}")
+                continue
+            if not user_model:
+                continue
+
+            for watcher in list(self._watchers.get(id, ())):
+                if not watcher.offer(user_model):
+                    self.logger.warning(
+                        f"{__name__}: Evicting a slow watcher of {len(watcher.ids)} users"
+                    )
+                    self.unsubscribe(watcher)
+                    watcher.evict()
@@ -0,0 +1,57 @@
+# 2024 amicroservice author.
+
+import contextlib
+import os
+import urllib.parse
+import uuid
+
+import asyncpg
+import pytest
+
+from tests.fakes import run
+
+
+@contextlib.contextmanager
+def _schema(base: str):
+    # Extra query parameters of the DSN are sent as server settings
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+
+    async def execute(query):
+        connection = await asyncpg.connect(base)
+        try:
+            await connection.execute(query)
+        finally:
+            await connection.close()
+
+    run(execute(f"CREATE SCHEMA {schema}"))
+    separator = "&" if urllib.parse.urlsplit(base).query else "?"
+    try:
+        yield f"{base}{separator}search_path={schema}"
+    finally:
+        run(execute(f"DROP SCHEMA {schema} CASCADE"))
+
+
+@pytest.fixture
+def test_dsn() -> str:
+    base = os.getenv("TEST_DSN")
+    if not base:
+        pytest.skip("TEST_DSN is not set")
+    return base
+
+
+@pytest.fixture
+def dsn(test_dsn):
+    """
+    DSN of an empty schema on the TEST_DSN database, skipped without it
+    """
+    with _schema(test_dsn) as schema_dsn:
+        yield schema_dsn
+
+
+@pytest.fixture
+def shard_dsn(test_dsn):
+    """
+    DSN of a second empty schema, standing for another shard
+    """
+    with _schema(test_dsn) as schema_dsn:
+        yield schema_dsn
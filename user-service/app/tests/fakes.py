@@ -0,0 +1,100 @@
+# 2024 amicroservice author.
+
+import asyncio
+import os
+
+from cryptography.hazmat.primitives import serialization
+
+
+class FakeLogger:
+    """
+    Logger keeping the messages by level instead of writing a file
+    """
+
+    def __init__(self):
+        self.messages = dict()
+
+    def __getattr__(self, level):
+        return lambda msg: self.messages.setdefault(level, []).append(msg)
+
+
+class Aborted(Exception):
+    """
+    Raised by FakeContext.abort_with_status, holds the status
+    """
+
+    def __init__(self, status):
+        super().__init__(status.details)
+        self.status = status
+
+
+class FakeContext:
+    """
+    Servicer context of a call, metadata as (key, value) pairs
+    """
+
+    def __init__(self, metadata=(), time_remaining=None, peer="ipv4:10.0.0.1:5000"):
+        self.metadata = tuple(metadata)
+        self.remaining = time_remaining
+        self._peer = peer
+        self.initial_metadata = None
+
+    def invocation_metadata(self):
+        return self.metadata
+
+    def time_remaining(self):
+        return self.remaining
+
+    def peer(self):
+        return self._peer
+
+    async def abort_with_status(self, status):
+        raise Aborted(status)
+
+    async def send_initial_metadata(self, metadata):
+        self.initial_metadata = metadata
+
+
+def run(coroutine):
+    """
+    Run a coroutine on a new event loop
+    """
+    return asyncio.run(coroutine)
+
+
+class FakeRevocationTable:
+    """
+    Revocation rows in a list, shared by the lists of several servers
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    async def revoke_token(self, jti, user_id, expires_at, context=None):
+        self._insert(jti=jti, user_id=user_id, not_before=None, expires_at=expires_at)
+
+    async def revoke_user(self, user_id, not_before, expires_at, context=None):
+        self._insert(
+            jti=None, user_id=user_id, not_before=not_before, expires_at=expires_at
+        )
+
+    async def changes(self, since: int, recent) -> list:
+        return [row for row in self.rows if row["seq"] > since]
+
+    def _insert(self, **row):
+        row["seq"] = len(self.rows) + 1
+        self.rows.append(row)
+
+
+def write_key(keys_dir, kid: str, private_key):
+    """
+    Store a private key in a key directory as KeyRing reads it
+    """
+    with open(os.path.join(keys_dir, f"{kid}.pem"), "wb") as file:
+        file.write(
+            private_key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
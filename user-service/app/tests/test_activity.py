@@ -0,0 +1,109 @@
+# 2024 amicroservice author.
+
+import datetime
+import uuid
+
+import pytest
+
+from db.backends.memory import MemoryUserTable
+from db.models.user import UserModel
+from services.activity import ActivityTracker
+from tests.fakes import FakeLogger, run
+
+
+class RecordingTable:
+    """
+    User table keeping the activity it is given, failing while error is set
+    """
+
+    def __init__(self):
+        self.recorded = []
+        self.error = None
+
+    async def record_activity(self, activity: dict):
+        if self.error is not None:
+            raise self.error
+        self.recorded.append(activity)
+
+
+def test_keeps_the_latest_times_per_user():
+    table = RecordingTable()
+    tracker = ActivityTracker(FakeLogger(), table)
+
+    tracker.login("1", "group")
+    tracker.seen("1", "group")
+    tracker.seen("2", "group")
+    tracker.seen(None, None)
+    run(tracker.flush())
+
+    (activity,) = table.recorded
+    assert set(activity) == {"1", "2"}
+    group_id, last_login_at, last_seen_at = activity["1"]
+    assert group_id == "group"
+    assert last_login_at <= last_seen_at
+    assert activity["2"][1] is None
+
+
+def test_drops_new_users_when_full():
+    tracker = ActivityTracker(FakeLogger(), RecordingTable(), max_pending=1)
+
+    tracker.seen("1", "group")
+    tracker.seen("2", "group")
+    tracker.seen("1", "group")
+
+    assert list(tracker._pending) == ["1"]
+    assert tracker.dropped == 1
+
+
+def test_failed_flush_keeps_the_times_for_the_next():
+    table = RecordingTable()
+    tracker = ActivityTracker(FakeLogger(), table)
+    tracker.login("1", "group")
+
+    table.error = RuntimeError("down")
+    with pytest.raises(RuntimeError):
+        run(tracker.flush())
+    login = tracker._pending["1"][1]
+
+    # Seen meanwhile, the login of the failed flush is kept
+    tracker.seen("1", "group")
+    table.error = None
+    run(tracker.flush())
+
+    assert table.recorded[0]["1"][1] == login
+
+
+def test_close_writes_what_is_left():
+    table = RecordingTable()
+    logger = FakeLogger()
+
+    async def scenario():
+        tracker = ActivityTracker(logger, table, interval=60)
+        await tracker.setup()
+        tracker.seen("1", "group")
+        await tracker.close()
+
+    run(scenario())
+
+    assert list(table.recorded[0]) == ["1"]
+    assert "error" not in logger.messages
+
+
+def test_times_only_move_forward():
+    table = MemoryUserTable()
+    id, group_id = uuid.uuid4(), uuid.uuid4()
+    later = datetime.datetime(2024, 5, 2, 12, 0)
+    row = UserModel.from_columns(
+        {"id": id, "group_id": group_id, "email": "ada@example.com"}
+    )
+    row.last_seen_at = later
+    table._by_id[str(id)] = row
+
+    run(
+        table.record_activity(
+            {id: (group_id, datetime.datetime(2024, 5, 1), later.replace(hour=8))}
+        )
+    )
+
+    assert row.last_login_at == datetime.datetime(2024, 5, 1)
+    assert row.last_seen_at == later
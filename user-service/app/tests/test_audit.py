@@ -0,0 +1,151 @@
+# 2024 amicroservice author.
+
+import datetime
+import os
+
+from db.pool import Database
+from db.schema import migrate
+from db.tables.audit import AuditTable
+from services.audit import AuditLog
+from tests.fakes import FakeLogger, run
+
+
+class RecordingAuditTable:
+    """
+    Audit table keeping the copied batches, failing while error is set
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.error = None
+
+    async def copy(self, rows: list):
+        if self.error is not None:
+            raise self.error
+        self.batches.append(list(rows))
+
+    @property
+    def rows(self) -> list:
+        return [row for batch in self.batches for row in batch]
+
+
+def record_all(audit_log: AuditLog, events: list):
+    async def scenario():
+        await audit_log.setup()
+        for event in events:
+            audit_log.record(event, user_id="1", peer="ipv4:10.0.0.1")
+        await audit_log.close()
+
+    run(scenario())
+
+
+def test_events_are_written_in_batches():
+    table = RecordingAuditTable()
+    audit_log = AuditLog(FakeLogger(), table, batch=2)
+
+    record_all(audit_log, ["login", "logout", "register"])
+
+    assert [len(batch) for batch in table.batches] == [2, 1]
+    assert [row[1] for row in table.rows] == ["login", "logout", "register"]
+    assert table.rows[0][5] == "1"
+
+
+def test_full_queue_drops_events():
+    logger = FakeLogger()
+    table = RecordingAuditTable()
+    audit_log = AuditLog(logger, table, max_queue=2)
+
+    async def scenario():
+        for event in ("login", "logout", "register"):
+            audit_log.record(event)
+        await audit_log.setup()
+        await audit_log.close()
+
+    run(scenario())
+
+    assert len(table.rows) == 2
+    assert audit_log.dropped == 1
+    assert "dropped 1" in logger.messages["warning"][0]
+
+
+def test_failed_writes_are_spilled_then_replayed(tmp_path):
+    table = RecordingAuditTable()
+    spill_path = str(tmp_path / "audit.jsonl")
+    audit_log = AuditLog(FakeLogger(), table, spill_path=spill_path)
+
+    table.error = RuntimeError("down")
+    record_all(audit_log, ["login", "logout"])
+    assert os.path.exists(spill_path) and not table.rows
+
+    table.error = None
+    record_all(audit_log, ["register"])
+
+    assert [row[1] for row in table.rows] == ["login", "logout", "register"]
+    assert isinstance(table.rows[0][0], datetime.datetime)
+    assert not os.path.exists(spill_path)
+    assert audit_log.lost == 0
+
+
+def test_events_without_room_to_spill_are_lost(tmp_path):
+    table = RecordingAuditTable()
+    table.error = RuntimeError("down")
+    audit_log = AuditLog(
+        FakeLogger(), table, spill_path=str(tmp_path / "audit.jsonl"), spill_max_bytes=1
+    )
+
+    record_all(audit_log, ["login", "logout"])
+
+    assert audit_log.lost == 2
+
+
+def test_torn_spilled_lines_are_skipped(tmp_path):
+    table = RecordingAuditTable()
+    spill_path = tmp_path / "audit.jsonl"
+    audit_log = AuditLog(FakeLogger(), table, spill_path=str(spill_path))
+
+    table.error = RuntimeError("down")
+    record_all(audit_log, ["login"])
+    with open(spill_path, "a") as file:
+        file.write('["2024-05-01')
+    table.error = None
+    record_all(audit_log, ["logout"])
+
+    assert [row[1] for row in table.rows] == ["login", "logout"]
+    assert audit_log.lost == 1
+
+
+def test_copy_creates_the_month_partitions(dsn):
+    occurred_at = datetime.datetime(2024, 5, 31, 23, 0, tzinfo=datetime.timezone.utc)
+
+    async def scenario():
+        database = Database(FakeLogger(), dsn=dsn)
+        await database.setup()
+        try:
+            await migrate(FakeLogger(), database, partitions=2)
+            table = AuditTable(FakeLogger(), database)
+            await table.copy(
+                [
+                    (
+                        occurred_at,
+                        "login",
+                        "ok",
+                        None,
+                        None,
+                        None,
+                        "ada@example.com",
+                        None,
+                    )
+                ]
+            )
+            async with database.acquire() as connection:
+                return await connection.fetch(
+                    "SELECT tableoid::regclass::text AS partition, email"
+                    " FROM audit_events"
+                )
+        finally:
+            await database.close()
+
+    (record,) = run(scenario())
+
+    assert record["partition"] == "audit_events_202405"
+    assert record["email"] == "ada@example.com"
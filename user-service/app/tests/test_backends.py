@@ -0,0 +1,202 @@
+# 2024 amicroservice author.
+
+import datetime
+import json
+import threading
+import uuid
+
+import asyncpg
+import pytest
+
+from db.backends.base import seed
+from db.backends.memory import (
+    MemoryGroupTable,
+    MemoryGroupuserTable,
+    MemoryUserTable,
+)
+from db.backends.sqlite import (
+    SqliteDatabase,
+    SqliteGroupTable,
+    SqliteGroupuserTable,
+    SqliteUserTable,
+)
+from db.models.user import UserModel
+from tests.fakes import run
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def tables(request, tmp_path):
+    """
+    Group, groupuser and user tables of each storage
+    """
+    if request.param == "memory":
+        yield MemoryGroupTable(), MemoryGroupuserTable(), MemoryUserTable()
+        return
+
+    database = SqliteDatabase(str(tmp_path / "users.db"))
+    try:
+        yield (
+            SqliteGroupTable(database),
+            SqliteGroupuserTable(database),
+            SqliteUserTable(database),
+        )
+    finally:
+        run(database.close())
+
+
+def new_user(group_id, email: str = "ada@example.com") -> UserModel:
+    return UserModel.from_columns(
+        {
+            "group_id": group_id,
+            "email": email,
+            "password_hash": b"hash",
+            "first_name": "Ada",
+            "last_name": "Lovelace",
+        }
+    )
+
+
+def test_create_and_get(tables):
+    _, _, user_table = tables
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        created = await user_table.create(new_user(group_id))
+        return (
+            created,
+            await user_table.get(id=created.id),
+            await user_table.get(id=created.id, group_id=group_id),
+            await user_table.get(id=created.id, group_id=uuid.uuid4()),
+            await user_table.get_by_groud_id_and_email(group_id, "ada@example.com"),
+            await user_table.get(id=created.id, fields=("email",)),
+        )
+
+    created, by_id, in_group, other_group, by_email, partial = run(scenario())
+
+    assert isinstance(created.id, uuid.UUID)
+    assert created.created_at is not None
+    assert by_id.email == in_group.email == by_email.email == "ada@example.com"
+    assert by_email.group_id == group_id
+    assert other_group is None
+    assert partial.email == "ada@example.com" and partial.first_name is None
+
+
+def test_duplicate_email_in_a_group(tables):
+    _, _, user_table = tables
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        await user_table.create(new_user(group_id))
+        await user_table.create(new_user(uuid.uuid4()))
+        with pytest.raises(asyncpg.UniqueViolationError) as error:
+            await user_table.create(new_user(group_id))
+        return error.value
+
+    assert "group_id_email_key" in run(scenario()).constraint_name
+
+
+def test_update(tables):
+    _, _, user_table = tables
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        ada = await user_table.create(new_user(group_id))
+        bob = await user_table.create(new_user(group_id, "bob@example.com"))
+
+        ada.email = "augusta@example.com"
+        ada.updated_at = datetime.datetime.now()
+        await user_table.update(ada)
+
+        bob.email = "augusta@example.com"
+        with pytest.raises(asyncpg.UniqueViolationError):
+            await user_table.update(bob)
+
+        return (
+            await user_table.get(id=ada.id),
+            await user_table.get_by_groud_id_and_email(group_id, "ada@example.com"),
+        )
+
+    updated, old_email = run(scenario())
+
+    assert updated.email == "augusta@example.com"
+    assert old_email is None
+
+
+def test_update_of_another_group_changes_nothing(tables):
+    _, _, user_table = tables
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        ada = await user_table.create(new_user(group_id))
+
+        ada.group_id = uuid.uuid4()
+        ada.first_name = "Augusta"
+        ada.updated_at = datetime.datetime.now()
+        await user_table.update(ada)
+
+        return await user_table.get(id=ada.id, group_id=group_id)
+
+    assert run(scenario()).first_name == "Ada"
+
+
+def test_record_activity_only_moves_times_forward(tables):
+    _, _, user_table = tables
+    group_id = uuid.uuid4()
+    login = datetime.datetime(2024, 5, 1, 8, 0)
+    seen = datetime.datetime(2024, 5, 2, 9, 30)
+
+    async def scenario():
+        created = await user_table.create(new_user(group_id))
+        await user_table.record_activity({created.id: (group_id, login, seen)})
+        await user_table.record_activity(
+            {created.id: (group_id, None, seen - datetime.timedelta(days=1))}
+        )
+        return await user_table.get(id=created.id)
+
+    user_model = run(scenario())
+
+    assert user_model.last_login_at == login
+    assert user_model.last_seen_at == seen
+
+
+def test_seed_groups_and_invitations(tables, tmp_path):
+    group_table, groupuser_table, _ = tables
+    group_id = str(uuid.uuid4())
+    path = tmp_path / "groups.json"
+    path.write_text(
+        json.dumps(
+            {
+                "groups": [{"id": group_id, "properties": {"invitation_only": True}}],
+                "groupusers": [{"group_id": group_id, "email": "ada@example.com"}],
+            }
+        )
+    )
+
+    async def scenario():
+        await seed(group_table, groupuser_table, str(path))
+        return (
+            await group_table.get(group_id),
+            await groupuser_table.get_by_group_id_and_email(
+                group_id, "ada@example.com"
+            ),
+            await groupuser_table.get_by_group_id_and_email(
+                group_id, "bob@example.com"
+            ),
+        )
+
+    group, invited, not_invited = run(scenario())
+
+    assert json.loads(group.properties) == {"invitation_only": True}
+    assert invited.email == "ada@example.com" and invited.user_id is None
+    assert not_invited is None
+
+
+def test_sqlite_statements_run_off_the_event_loop(tmp_path):
+    database = SqliteDatabase(str(tmp_path / "users.db"))
+    try:
+        thread = run(database.run(threading.current_thread))
+    finally:
+        run(database.close())
+
+    assert thread is not threading.main_thread()
+    assert thread.name.startswith("sqlite")
@@ -0,0 +1,88 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+from tests.fakes import run
+from utils.batching import WriteBatcher
+
+
+class Flush:
+    """
+    Flush recording its batches, results from the items
+    """
+
+    def __init__(self, error: Exception = None):
+        self.batches = []
+        self.error = error
+
+    async def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+        if self.error is not None:
+            raise self.error
+        return [
+            ValueError(item) if item.startswith("bad") else item.upper()
+            for item in items
+        ]
+
+
+def submit_all(batcher, calls) -> list:
+    async def scenario():
+        return await asyncio.gather(
+            *(batcher.submit(key, item) for key, item in calls),
+            return_exceptions=True,
+        )
+
+    return run(scenario())
+
+
+def test_concurrent_calls_share_a_flush_per_key():
+    flush = Flush()
+    batcher = WriteBatcher(flush, window=0.01)
+
+    results = submit_all(batcher, [("a", "x"), ("b", "y"), ("a", "z")])
+
+    assert results == ["X", "Y", "Z"]
+    assert sorted(flush.batches) == [("a", ["x", "z"]), ("b", ["y"])]
+
+
+def test_full_batches_flush_at_once():
+    flush = Flush()
+    batcher = WriteBatcher(flush, window=60, max_size=2)
+
+    results = submit_all(batcher, [("a", "x"), ("a", "y")])
+
+    assert results == ["X", "Y"]
+
+
+def test_item_errors_go_to_their_caller_only():
+    batcher = WriteBatcher(Flush(), window=0.01)
+
+    results = submit_all(batcher, [("a", "x"), ("a", "bad")])
+
+    assert results[0] == "X"
+    assert isinstance(results[1], ValueError)
+
+
+def test_a_failed_flush_gives_each_caller_its_own_error():
+    batcher = WriteBatcher(Flush(error=RuntimeError("down")), window=0.01)
+
+    first, second = submit_all(batcher, [("a", "x"), ("a", "y")])
+
+    assert isinstance(first, RuntimeError) and isinstance(second, RuntimeError)
+    assert first is not second
+    assert first.args == second.args == ("down",)
+
+
+def test_a_cancelled_caller_does_not_stop_the_batch():
+    flush = Flush()
+    batcher = WriteBatcher(flush, window=0.01)
+
+    async def scenario():
+        gone = asyncio.create_task(batcher.submit("a", "x"))
+        kept = asyncio.create_task(batcher.submit("a", "y"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        return await kept, gone.cancelled()
+
+    assert run(scenario()) == ("Y", True)
+    assert flush.batches == [("a", ["x", "y"])]
@@ -0,0 +1,139 @@
+# 2024 amicroservice author.
+
+import pytest
+
+import utils.cache as cache
+from utils.cache import (
+    BloomFilter,
+    BloomNegativeCache,
+    LRUCache,
+    NegativeCache,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+    assert lru.pop("a") == 1
+    assert lru.get("a", "default") == "default"
+
+
+def test_negative_cache_expires_after_ttl(clock):
+    missing = NegativeCache(maxsize=10, ttl=30)
+    missing.add("user")
+    assert missing.contains("user")
+
+    clock.now += 29.9
+    assert missing.contains("user")
+    clock.now += 0.1
+    assert not missing.contains("user")
+    assert len(missing) == 0
+
+
+def test_negative_cache_invalidate_and_bound(clock):
+    missing = NegativeCache(maxsize=2, ttl=30)
+    for key in ("a", "b", "c"):
+        missing.add(key)
+    assert not missing.contains("a")
+    assert missing.contains("b") and missing.contains("c")
+
+    missing.invalidate("b")
+    assert not missing.contains("b")
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [f"key{index}" for index in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for index in range(10000):
+        bloom.add(f"key{index}")
+
+    false_positives = sum(f"other{index}" in bloom for index in range(100000))
+    assert false_positives / 100000 < 0.02
+
+
+def test_bloom_negative_cache_rotates(clock):
+    missing = BloomNegativeCache(capacity=100, ttl=30)
+    missing.add("user")
+
+    # Kept in the previous generation for one more ttl
+    clock.now += 30
+    assert missing.contains("user")
+    clock.now += 30
+    assert not missing.contains("user")
+
+
+def test_bloom_negative_cache_rotates_when_full(clock):
+    missing = BloomNegativeCache(capacity=2, ttl=30)
+    for key in ("a", "b", "c", "d"):
+        missing.add(key)
+    assert missing.contains("c") and missing.contains("d")
+    assert not missing.contains("a")
+
+
+def test_bloom_negative_cache_invalidate(clock):
+    missing = BloomNegativeCache(capacity=100, ttl=30)
+    missing.add("user")
+    missing.invalidate("user")
+    assert not missing.contains("user")
+
+    # Added again once missing again
+    missing.add("user")
+    assert missing.contains("user")
+
+    missing.clear()
+    assert not missing.contains("user")
+
+
+def test_bloom_negative_cache_keeps_every_invalidation(clock):
+    missing = BloomNegativeCache(capacity=100000, ttl=30)
+    missing.add("user")
+    missing.invalidate("user")
+
+    for index in range(10001):
+        missing.invalidate(f"other{index}")
+
+    assert not missing.contains("user")
+
+
+def test_bloom_negative_cache_clears_past_capacity_invalidations(clock):
+    missing = BloomNegativeCache(capacity=10, ttl=30)
+    missing.add("user")
+    missing.add("group")
+    missing.invalidate("user")
+
+    for index in range(10):
+        missing.invalidate(f"other{index}")
+
+    assert not missing.contains("user")
+    assert not missing.contains("group")
@@ -0,0 +1,110 @@
+# 2024 amicroservice author.
+
+import argparse
+import json
+
+import asyncpg
+import pytest
+
+from db.dataset import generate, groups, invitations, seeded_uuid
+from db.pool import Database
+from db.schema import migrate
+from tests.fakes import FakeLogger, run
+
+
+def arguments(**overrides) -> argparse.Namespace:
+    args = dict(
+        users=20,
+        groups=4,
+        invitation_only=0.5,
+        pending=2,
+        passwords=1,
+        rounds=4,
+        seed=7,
+        jobs=1,
+        batch_size=50000,
+        credentials="credentials.csv",
+        seed_file=None,
+        groups_table="groups",
+        groupusers_table="groupusers",
+        no_groups=True,
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_ids_follow_the_seed():
+    assert seeded_uuid(7, "user", 3) == seeded_uuid(7, "user", 3)
+    assert seeded_uuid(7, "user", 3).version == 4
+    assert seeded_uuid(7, "user", 3) != seeded_uuid(8, "user", 3)
+    assert seeded_uuid(7, "user", 3) != seeded_uuid(7, "groupuser", 3)
+
+    group_rows = groups(10, 0.5, seed=7)
+    assert group_rows == groups(10, 0.5, seed=7)
+    assert invitations(group_rows, 3, seed=7) == invitations(group_rows, 3, seed=7)
+    assert invitations(group_rows, 3, seed=7) != invitations(group_rows, 3, seed=8)
+
+
+def test_invitations_only_for_invitation_only_groups():
+    group_rows = groups(10, 0.5, seed=7)
+    invited = {row[0] for row in group_rows if '"invitation_only": true' in row[3]}
+
+    pending = invitations(group_rows, 3, seed=7)
+
+    assert len(pending) == 3 * len(invited)
+    assert {row[1] for row in pending} == invited
+    assert len({row[0] for row in pending}) == len(pending)
+
+
+def test_seed_file_rejects_users(tmp_path):
+    args = arguments(seed_file=str(tmp_path / "groups.json"))
+
+    with pytest.raises(ValueError):
+        run(generate(FakeLogger(), args))
+
+    assert not (tmp_path / "groups.json").exists()
+
+
+def test_seed_file_needs_no_database(tmp_path, monkeypatch):
+    # Nothing listens there, any connection would fail
+    monkeypatch.setenv("DSN", "postgresql://postgres@127.0.0.1:1/none")
+    monkeypatch.delenv("SHARDS", raising=False)
+    args = arguments(
+        users=0,
+        credentials=str(tmp_path / "credentials.csv"),
+        seed_file=str(tmp_path / "groups.json"),
+    )
+
+    assert run(generate(FakeLogger(), args)) == 0
+
+    seed = json.loads((tmp_path / "groups.json").read_text())
+    lines = (tmp_path / "credentials.csv").read_text().splitlines()
+    assert len(seed["groups"]) == args.groups
+    assert lines[0] == "group_id,email,password,registered"
+    assert lines[1:] == [
+        f"{row['group_id']},{row['email']},Password0000,0" for row in seed["groupusers"]
+    ]
+    assert seed["groupusers"]
+
+
+def test_same_seed_same_users_whatever_the_jobs(dsn, shard_dsn, tmp_path, monkeypatch):
+    async def user_ids(database_dsn, jobs) -> list:
+        database = Database(FakeLogger(), dsn=database_dsn)
+        await database.setup()
+        await migrate(FakeLogger(), database, partitions=2)
+        await database.close()
+
+        monkeypatch.setenv("DSN", database_dsn)
+        monkeypatch.delenv("SHARDS", raising=False)
+        args = arguments(jobs=jobs, credentials=str(tmp_path / f"{jobs}.csv"))
+        assert await generate(FakeLogger(), args) == args.users
+
+        connection = await asyncpg.connect(database_dsn)
+        try:
+            records = await connection.fetch("SELECT id, email FROM users")
+        finally:
+            await connection.close()
+        return sorted((record["email"], record["id"]) for record in records)
+
+    assert run(user_ids(dsn, 1)) == run(user_ids(shard_dsn, 3))
+    assert (tmp_path / "1.csv").read_text() == (tmp_path / "3.csv").read_text()
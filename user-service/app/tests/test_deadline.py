@@ -0,0 +1,60 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+import grpc
+import pytest
+
+import services.errors as errors
+from services.deadline import DeadlineInterceptor
+from tests.fakes import Aborted, FakeContext, run
+
+
+def intercept(handler):
+    async def continuation(handler_call_details):
+        return handler
+
+    return run(DeadlineInterceptor().intercept_service(continuation, None))
+
+
+def test_timeout_is_answered_deadline_exceeded():
+    async def behavior(request, context):
+        raise asyncio.TimeoutError()
+
+    handler = intercept(grpc.unary_unary_rpc_method_handler(behavior))
+
+    with pytest.raises(Aborted) as aborted:
+        run(handler.unary_unary(None, FakeContext()))
+    assert aborted.value.status is errors.DEADLINE_EXCEEDED
+    assert aborted.value.status.code is grpc.StatusCode.DEADLINE_EXCEEDED
+
+
+def test_responses_and_other_errors_pass_through():
+    async def behavior(request, context):
+        if request == "fail":
+            raise ValueError(request)
+        return request
+
+    handler = intercept(grpc.unary_unary_rpc_method_handler(behavior))
+
+    assert run(handler.unary_unary("ok", FakeContext())) == "ok"
+    with pytest.raises(ValueError):
+        run(handler.unary_unary("fail", FakeContext()))
+
+
+def test_stream_timeout_is_answered_deadline_exceeded():
+    async def behavior(request, context):
+        yield 1
+        raise asyncio.TimeoutError()
+
+    handler = intercept(grpc.unary_stream_rpc_method_handler(behavior))
+
+    async def consume():
+        responses = []
+        try:
+            async for response in handler.unary_stream(None, FakeContext()):
+                responses.append(response)
+        except Aborted as e:
+            return responses, e.status
+
+    assert run(consume()) == ([1], errors.DEADLINE_EXCEEDED)
@@ -0,0 +1,63 @@
+# 2024 amicroservice author.
+
+import collections
+
+import grpc
+from google.rpc import status_pb2
+
+import buf.user.user_pb2 as user_pb2
+import services.errors as errors
+
+
+def details(status) -> tuple:
+    """
+    Decoded (code, message, [ErrorField]) of the rich status metadata
+    """
+    ((key, value),) = status.trailing_metadata
+    assert key == errors.GRPC_DETAILS_METADATA_KEY
+
+    rich = status_pb2.Status.FromString(value)
+    fields = []
+    for detail in rich.details:
+        field = user_pb2.ErrorField()
+        assert detail.Unpack(field)
+        fields.append(field)
+    return rich.code, rich.message, fields
+
+
+def test_static_status_carries_its_error_field():
+    status = errors.GROUP_NOT_FOUND
+
+    assert isinstance(status, grpc.Status)
+    assert status.code is grpc.StatusCode.NOT_FOUND
+    assert details(status) == (
+        grpc.StatusCode.NOT_FOUND.value[0],
+        "Group is not found",
+        [user_pb2.ErrorField(name="group_id", code="not_found")],
+    )
+
+
+def test_parameterized_status_builds_only_the_message():
+    status = errors.email_not_found(email="ada@example.com", group_id="g1")
+
+    code, message, fields = details(status)
+    assert message == "Email ada@example.com in group g1 is not found"
+    assert fields == [user_pb2.ErrorField(name="email", code="not_found")]
+    assert errors.error_detail("email", "not_found") is errors.error_detail(
+        "email", "not_found"
+    )
+
+
+def test_validation_failed_has_one_field_per_violation():
+    Violation = collections.namedtuple("Violation", ("field_path", "constraint_id"))
+
+    status = errors.validation_failed(
+        [Violation("email", "string.email"), Violation("password", "string.min_len")]
+    )
+
+    code, message, fields = details(status)
+    assert status.code is grpc.StatusCode.INVALID_ARGUMENT
+    assert fields == [
+        user_pb2.ErrorField(name="email", code="string.email"),
+        user_pb2.ErrorField(name="password", code="string.min_len"),
+    ]
@@ -0,0 +1,173 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+import pytest
+
+import utils.idempotency as idempotency
+from tests.fakes import run
+from utils.idempotency import IdempotencyStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(idempotency.time, "monotonic", clock)
+    return clock
+
+
+class Counted:
+    """
+    Call returning its number of executions, after the release event
+    """
+
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return ("ok", self.calls)
+
+
+def test_replays_the_stored_outcome(clock):
+    async def scenario():
+        store = IdempotencyStore(ttl=60)
+        call = Counted()
+        first = await store.run("key", call)
+        second = await store.run("key", call)
+        other = await store.run("other", call)
+        return call.calls, first, second, other
+
+    calls, first, second, other = run(scenario())
+
+    assert calls == 2
+    assert first == second == ("ok", 1)
+    assert other == ("ok", 2)
+
+
+def test_concurrent_callers_join_the_execution(clock):
+    async def scenario():
+        store = IdempotencyStore()
+        call = Counted()
+        call.release = asyncio.Event()
+        tasks = [asyncio.create_task(store.run("key", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.release.set()
+        outcomes = await asyncio.gather(*tasks)
+        return call.calls, outcomes
+
+    calls, outcomes = run(scenario())
+
+    assert calls == 1
+    assert outcomes == [("ok", 1)] * 3
+
+
+def test_exceptions_are_not_stored(clock):
+    async def scenario():
+        store = IdempotencyStore()
+        call = Counted(error=ValueError("down"))
+        call.release = asyncio.Event()
+        tasks = [asyncio.create_task(store.run("key", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        call.error = None
+        call.release = None
+        return results, await store.run("key", call)
+
+    results, retried = run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == ("ok", 2)
+
+
+def test_a_cancelled_caller_leaves_the_execution_running(clock):
+    async def scenario():
+        store = IdempotencyStore()
+        call = Counted()
+        call.release = asyncio.Event()
+        first = asyncio.create_task(store.run("key", call))
+        await asyncio.sleep(0)
+        joiner = asyncio.create_task(store.run("key", call))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        return call.calls, await joiner, first.cancelled()
+
+    calls, outcome, cancelled = run(scenario())
+
+    assert cancelled
+    assert calls == 1
+    assert outcome == ("ok", 1)
+
+
+def test_the_retry_of_a_cancelled_caller_replays_its_outcome(clock):
+    async def scenario():
+        store = IdempotencyStore()
+        call = Counted()
+        call.release = asyncio.Event()
+        first = asyncio.create_task(store.run("key", call))
+        await asyncio.sleep(0)
+
+        # The client timed out, the execution still completes
+        first.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        for _ in range(100):
+            if store.get("key") is not None:
+                break
+            await asyncio.sleep(0)
+
+        return first.cancelled(), await store.run("key", call), call.calls
+
+    cancelled, retried, calls = run(scenario())
+
+    assert cancelled
+    assert retried == ("ok", 1)
+    assert calls == 1
+
+
+def test_executions_are_bounded_by_the_ttl():
+    async def scenario():
+        store = IdempotencyStore(ttl=0.01)
+        call = Counted()
+        call.release = asyncio.Event()
+        with pytest.raises(asyncio.TimeoutError):
+            await store.run("key", call)
+
+        call.release = None
+        return await store.run("key", call)
+
+    assert run(scenario()) == ("ok", 2)
+
+
+def test_outcomes_expire_and_are_bounded(clock):
+    async def scenario(store):
+        for key in ("a", "b", "c"):
+            await store.run(key, Counted())
+
+    store = IdempotencyStore(ttl=60, maxsize=2)
+    run(scenario(store))
+
+    assert store.get("a") is None
+    assert store.get("c") == ("ok", 1)
+
+    clock.now += 60
+    assert store.get("c") is None
@@ -0,0 +1,104 @@
+# 2024 amicroservice author.
+
+import asyncio
+import json
+import uuid
+
+import asyncpg
+
+from db.invalidation import InvalidationBus
+from tests.fakes import FakeLogger, run
+
+
+def event(kind: str, key, **data) -> str:
+    return json.dumps({"kind": kind, "key": key, **data})
+
+
+def test_events_reach_the_subscribers_of_their_kind():
+    bus = InvalidationBus(FakeLogger(), dsns=())
+    users, groups = [], []
+    bus.subscribe("user", lambda key, data: users.append((key, data)))
+    bus.subscribe("group", lambda key, data: groups.append((key, data)))
+
+    bus._notified(None, 1, bus.channel, event("user", ["group", "ada"], id="1"))
+
+    # JSON lists become tuples again, the keys of the caches
+    assert users == [(("group", "ada"), {"id": "1"})]
+    assert groups == []
+
+
+def test_events_bump_the_generation_of_their_key():
+    bus = InvalidationBus(FakeLogger(), dsns=())
+    before = bus.generation("user", ("group", "ada"))
+    other = bus.generation("user", ("group", "bob"))
+
+    bus._notified(None, 1, bus.channel, event("user", ["group", "ada"]))
+
+    assert bus.generation("user", ("group", "ada")) != before
+    assert bus.generation("user", ("group", "bob")) == other
+
+
+def test_a_failing_subscriber_does_not_stop_the_others():
+    logger = FakeLogger()
+    bus = InvalidationBus(logger, dsns=())
+    received = []
+
+    def failing(key, data):
+        raise RuntimeError("broken")
+
+    bus.subscribe("user", failing)
+    bus.subscribe("user", lambda key, data: received.append(key))
+
+    bus._notified(None, 1, bus.channel, event("user", "1"))
+
+    assert received == ["1"]
+    assert "broken" in logger.messages["error"][0]
+
+
+def test_invalid_events_are_logged():
+    logger = FakeLogger()
+    bus = InvalidationBus(logger, dsns=())
+
+    bus._notified(None, 1, bus.channel, "not json")
+    bus._notified(None, 1, bus.channel, json.dumps({"kind": "user"}))
+
+    assert len(logger.messages["error"]) == 2
+
+
+def test_reconnect_drops_everything():
+    bus = InvalidationBus(FakeLogger(), dsns=("postgresql://",))
+    received = []
+    bus.subscribe("user", lambda key, data: received.append((key, data)))
+    before = bus.generation("user", "1")
+
+    async def connect(dsn):
+        pass
+
+    bus._connect = connect
+    run(bus._reconnect("postgresql://"))
+
+    assert received == [(None, None)]
+    assert bus.generation("user", "1") != before
+
+
+def test_events_are_delivered_on_commit(dsn):
+    async def scenario():
+        bus = InvalidationBus(FakeLogger(), dsns=(dsn,), channel=uuid.uuid4().hex)
+        received = asyncio.Queue()
+        bus.subscribe("user", lambda key, data: received.put_nowait(key))
+        await bus.setup()
+
+        connection = await asyncpg.connect(dsn)
+        try:
+            async with connection.transaction():
+                await bus.publish(connection, "user", ["group", "ada"])
+                await bus.publish_many(connection, "user", ["1", "2"])
+                await asyncio.sleep(0.1)
+                assert received.empty()
+
+            return [await asyncio.wait_for(received.get(), timeout=5) for _ in range(3)]
+        finally:
+            await connection.close()
+            await bus.close()
+
+    assert run(scenario()) == [("group", "ada"), "1", "2"]
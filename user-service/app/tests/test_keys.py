@@ -0,0 +1,115 @@
+# 2024 amicroservice author.
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from services.keys import KeyRing, activate, generate, retire
+from tests.fakes import write_key
+
+
+@pytest.fixture
+def keys_dir(tmp_path):
+    write_key(tmp_path, "20240101000000", ed25519.Ed25519PrivateKey.generate())
+    return str(tmp_path)
+
+
+def test_signs_with_the_last_key(keys_dir):
+    write_key(keys_dir, "20240201000000", ec.generate_private_key(ec.SECP256R1()))
+    key_ring = KeyRing(keys_dir=keys_dir)
+
+    token = key_ring.encode({"user_id": "1"})
+
+    assert jwt.get_unverified_header(token)["kid"] == "20240201000000"
+    assert jwt.get_unverified_header(token)["alg"] == "ES256"
+    assert key_ring.decode(token) == {"user_id": "1"}
+    assert [key.kid for key in key_ring.key_set.keys] == [
+        "20240101000000",
+        "20240201000000",
+    ]
+
+
+def test_active_kid(keys_dir):
+    write_key(keys_dir, "20240201000000", ed25519.Ed25519PrivateKey.generate())
+    key_ring = KeyRing(keys_dir=keys_dir, active_kid="20240101000000")
+
+    token = key_ring.encode({"user_id": "1"})
+
+    assert jwt.get_unverified_header(token)["kid"] == "20240101000000"
+    with pytest.raises(ValueError):
+        KeyRing(keys_dir=keys_dir, active_kid="20230101000000")
+
+
+def test_retired_key_still_verifies(keys_dir):
+    key_ring = KeyRing(keys_dir=keys_dir)
+    token = key_ring.encode({"user_id": "1"})
+
+    write_key(keys_dir, "20240201000000", ed25519.Ed25519PrivateKey.generate())
+    retire(keys_dir, "20240101000000")
+    key_ring.load()
+
+    assert key_ring.active.kid == "20240201000000"
+    assert key_ring.keys["20240101000000"].private_key is None
+    assert key_ring.decode(token) == {"user_id": "1"}
+
+
+def test_rejects_unknown_kid_and_bad_signature(keys_dir):
+    key_ring = KeyRing(keys_dir=keys_dir)
+    other = ed25519.Ed25519PrivateKey.generate()
+
+    unknown = jwt.encode({}, other, algorithm="EdDSA", headers={"kid": "other"})
+    forged = jwt.encode({}, other, algorithm="EdDSA", headers={"kid": "20240101000000"})
+
+    with pytest.raises(jwt.InvalidTokenError):
+        key_ring.decode(unknown)
+    with pytest.raises(jwt.InvalidTokenError):
+        key_ring.decode(forged)
+
+
+def test_fails_on_a_directory_without_private_key(tmp_path):
+    with pytest.raises(ValueError):
+        KeyRing(secret="secret", keys_dir=str(tmp_path))
+
+
+def test_hs256_without_a_key_directory():
+    key_ring = KeyRing(secret="secret")
+
+    token = key_ring.encode({"user_id": "1"})
+
+    assert jwt.get_unverified_header(token)["alg"] == "HS256"
+    assert key_ring.decode(token) == {"user_id": "1"}
+
+
+def test_hs256_with_a_key_directory_only_when_accepted(keys_dir):
+    token = jwt.encode({"user_id": "1"}, "secret", algorithm="HS256")
+
+    with pytest.raises(jwt.InvalidTokenError):
+        KeyRing(secret="secret", keys_dir=keys_dir).decode(token)
+
+    key_ring = KeyRing(secret="secret", keys_dir=keys_dir, accept_hs256=True)
+    assert key_ring.decode(token) == {"user_id": "1"}
+    assert jwt.get_unverified_header(key_ring.encode({}))["alg"] == "EdDSA"
+
+
+def test_generated_key_verifies_before_it_signs(keys_dir):
+    kid = generate(keys_dir)
+    key_ring = KeyRing(keys_dir=keys_dir)
+
+    # Still signed by the old key, the new one is published
+    assert key_ring.active.kid == "20240101000000"
+    assert kid in [key.kid for key in key_ring.key_set.keys]
+
+    # A server that activated signs tokens the others already verify
+    activate(keys_dir, kid)
+    activated = KeyRing(keys_dir=keys_dir)
+    token = activated.encode({"user_id": "1"})
+
+    assert jwt.get_unverified_header(token)["kid"] == kid
+    assert key_ring.decode(token) == {"user_id": "1"}
+
+
+def test_fails_on_a_directory_with_only_a_generated_key(tmp_path):
+    generate(str(tmp_path))
+
+    with pytest.raises(ValueError):
+        KeyRing(keys_dir=str(tmp_path))
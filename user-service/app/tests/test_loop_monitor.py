@@ -0,0 +1,47 @@
+# 2024 amicroservice author.
+
+import asyncio
+import time
+
+from tests.fakes import FakeLogger, run
+from utils.loop_monitor import LoopMonitor
+
+
+def test_observe_fills_the_histogram():
+    monitor = LoopMonitor(FakeLogger())
+
+    monitor.observe(0.0005)
+    monitor.observe(0.02)
+    monitor.observe(-0.001)
+    monitor.observe(10.0)
+
+    histogram = monitor.histogram()
+    assert histogram["<=1ms"] == 2
+    assert histogram["<=25ms"] == 1
+    assert histogram[">5000ms"] == 1
+    assert monitor.samples == 4
+    assert monitor.max_lag == 10.0
+
+
+def blocking_call():
+    time.sleep(0.4)
+
+
+def test_blocked_loop_dumps_the_blocking_stack():
+    logger = FakeLogger()
+    monitor = LoopMonitor(logger, interval=0.01, threshold=0.1)
+
+    async def main():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_call()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    run(main())
+
+    warnings = logger.messages["warning"]
+    assert len(warnings) == 1
+    assert "Event loop blocked" in warnings[0]
+    assert "blocking_call" in warnings[0]
+    assert monitor.max_lag >= 0.3
@@ -0,0 +1,41 @@
+# 2024 amicroservice author.
+
+import tracemalloc
+
+from tests.fakes import FakeLogger
+from utils.memory import MemoryProfiler
+
+
+class Tracked:
+    pass
+
+
+def test_trigger_arms_then_reports_growth():
+    logger = FakeLogger()
+    profiler = MemoryProfiler(logger, types={"Tracked": Tracked})
+    try:
+        profiler.trigger()
+        assert tracemalloc.is_tracing()
+        assert "armed" in logger.messages["info"][0]
+
+        kept = [Tracked() for _ in range(1000)]
+        profiler.trigger()
+
+        report = logger.messages["info"][1]
+        assert "Top growth since the previous snapshot:" in report
+        assert "test_memory.py" in report
+        assert "Tracked: 1000" in report
+        assert len(kept) == 1000
+    finally:
+        tracemalloc.stop()
+
+
+def test_count_objects():
+    profiler = MemoryProfiler(FakeLogger(), types={"Tracked": Tracked, "str": str})
+
+    kept = [Tracked(), Tracked()]
+
+    counts = profiler.count_objects()
+    assert counts["Tracked"] == 2
+    assert counts["str"] > 0
+    assert len(kept) == 2
@@ -0,0 +1,28 @@
+# 2024 amicroservice author.
+
+import asyncio
+
+import pytest
+
+from db.pool import Database
+from tests.fakes import FakeContext, FakeLogger
+
+
+def test_timeout_is_unbounded_without_a_deadline():
+    database = Database(FakeLogger(), dsn="postgresql://")
+
+    assert database.timeout() is None
+    assert database.timeout(FakeContext(time_remaining=None)) is None
+
+
+def test_timeout_is_the_remaining_deadline():
+    database = Database(FakeLogger(), dsn="postgresql://")
+
+    assert database.timeout(FakeContext(time_remaining=1.5)) == 1.5
+
+
+def test_timeout_raises_once_the_deadline_has_passed():
+    database = Database(FakeLogger(), dsn="postgresql://")
+
+    with pytest.raises(asyncio.TimeoutError):
+        database.timeout(FakeContext(time_remaining=0))
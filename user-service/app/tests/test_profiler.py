@@ -0,0 +1,40 @@
+# 2024 amicroservice author.
+
+import sys
+import time
+
+from tests.fakes import FakeLogger
+from utils.profiler import SamplingProfiler
+
+
+class UserService:
+    def Get(self):
+        return sys._getframe()
+
+
+def test_collapse_tags_the_rpc_method():
+    profiler = SamplingProfiler(FakeLogger())
+
+    stack = profiler._collapse("MainThread", UserService().Get())
+
+    method, thread, *frames = stack.split(";")
+    assert method == "Get"
+    assert thread == "MainThread"
+    assert frames[-1].startswith("UserService.Get (test_profiler.py:")
+
+
+def test_profile_is_written_as_collapsed_stacks(tmp_path):
+    logger = FakeLogger()
+    profiler = SamplingProfiler(logger, output_dir=str(tmp_path), interval=0.005)
+
+    profiler.start(duration=0.1)
+    profiler.start(duration=0.1)
+    while profiler.running():
+        time.sleep(0.01)
+
+    assert logger.messages["warning"] == ["utils.profiler: Profile is already running"]
+    (path,) = tmp_path.glob("profile-*.collapsed")
+    lines = path.read_text().splitlines()
+    assert lines
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("test_profile_is_written_as_collapsed_stacks" in line for line in lines)
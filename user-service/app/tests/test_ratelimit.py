@@ -0,0 +1,77 @@
+# 2024 amicroservice author.
+
+import pytest
+
+import utils.ratelimit as ratelimit
+from utils.ratelimit import TokenBucketLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_allows_a_burst_then_the_rate(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=3)
+
+    assert [limiter.allow("key") for _ in range(4)] == [True, True, True, False]
+
+    clock.now += 1
+    assert limiter.allow("key")
+    assert not limiter.allow("key")
+
+
+def test_keys_have_their_own_bucket(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+
+    assert limiter.allow(("group", "ada@example.com"))
+    assert not limiter.allow(("group", "ada@example.com"))
+    assert limiter.allow(("group", "bob@example.com"))
+
+
+def test_full_buckets_are_dropped(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    limiter.allow("a")
+    limiter.allow("b")
+    limiter.allow("b")
+    assert len(limiter) == 2
+
+    # a is full again after 1s, b after 2s
+    clock.now += 1.5
+    limiter.allow("c")
+    assert len(limiter) == 2
+    clock.now += 2
+    limiter.allow("c")
+    assert len(limiter) == 1
+
+
+def test_long_pause_drops_every_key(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    for index in range(10):
+        limiter.allow(index)
+
+    clock.now += 3600
+    limiter.allow("new")
+    assert len(limiter) == 1
+
+
+def test_evicts_the_fullest_buckets_at_max_keys(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=5, max_keys=2)
+    limiter.allow("a")
+    for _ in range(5):
+        limiter.allow("b")
+
+    # a is the closest to a full bucket, b keeps its empty bucket
+    assert limiter.allow("c")
+    assert len(limiter) == 2
+    assert not limiter.allow("b")
@@ -0,0 +1,60 @@
+# 2024 amicroservice author.
+
+import datetime
+import uuid
+
+from services.revocation import RevocationList
+from tests.fakes import FakeLogger, FakeRevocationTable, run
+
+NOW = datetime.datetime.now(tz=datetime.timezone.utc)
+EXPIRES_AT = NOW + datetime.timedelta(hours=1)
+
+
+def test_revoke_token():
+    revocations = RevocationList(FakeLogger(), FakeRevocationTable())
+    jti = str(uuid.uuid4())
+
+    run(revocations.revoke_token(jti, "user", EXPIRES_AT))
+
+    assert revocations.is_revoked({"jti": jti, "user_id": "user"})
+    assert not revocations.is_revoked({"jti": str(uuid.uuid4()), "user_id": "user"})
+
+
+def test_revoke_user_keeps_later_tokens_of_the_same_second():
+    revocations = RevocationList(FakeLogger(), FakeRevocationTable())
+    not_before = NOW.replace(microsecond=500000)
+
+    run(revocations.revoke_user("user", not_before, EXPIRES_AT))
+
+    second = not_before.replace(microsecond=0).timestamp()
+    assert revocations.is_revoked({"user_id": "user", "iat": second})
+    assert revocations.is_revoked({"user_id": "user", "iat": second + 0.4})
+    assert not revocations.is_revoked({"user_id": "user", "iat": second + 0.6})
+    assert not revocations.is_revoked({"user_id": "other", "iat": second})
+
+
+def test_latest_cutoff_wins():
+    revocations = RevocationList(FakeLogger(), FakeRevocationTable())
+    later = NOW + datetime.timedelta(minutes=1)
+
+    run(revocations.revoke_user("user", later, EXPIRES_AT))
+    run(revocations.revoke_user("user", NOW, EXPIRES_AT))
+
+    assert revocations.is_revoked({"user_id": "user", "iat": NOW.timestamp() + 1})
+
+
+def test_refresh_applies_revocations_of_other_servers():
+    table = FakeRevocationTable()
+    here = RevocationList(FakeLogger(), table)
+    elsewhere = RevocationList(FakeLogger(), table)
+    jti = str(uuid.uuid4())
+
+    run(elsewhere.revoke_token(jti, "user", EXPIRES_AT))
+    run(elsewhere.revoke_user("other", NOW, EXPIRES_AT))
+    assert not here.is_revoked({"jti": jti})
+
+    run(here.refresh())
+
+    assert here.is_revoked({"jti": jti})
+    assert here.is_revoked({"user_id": "other", "iat": NOW.timestamp() - 1})
+    assert here._seq == 2
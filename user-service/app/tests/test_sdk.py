@@ -0,0 +1,140 @@
+# 2024 amicroservice author.
+
+import datetime
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+import sdk.user as sdk
+from sdk.user import TokenVerifier
+from services.keys import KeyRing
+from tests.fakes import run, write_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sdk.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def key_ring(tmp_path):
+    write_key(tmp_path, "20240101000000", ed25519.Ed25519PrivateKey.generate())
+    return KeyRing(keys_dir=str(tmp_path))
+
+
+class KeySetFetcher:
+    """
+    fetch_keys of a verifier, the key set of the ring as GetKeys returns it
+    """
+
+    def __init__(self, key_ring: KeyRing):
+        self.key_ring = key_ring
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.key_ring.key_set
+
+
+def claims(clock: Clock, **values) -> dict:
+    expiry = datetime.datetime.fromtimestamp(clock.now, tz=datetime.timezone.utc)
+    return {"exp": expiry + datetime.timedelta(hours=1), "user_id": "1", **values}
+
+
+def test_verifies_with_the_published_keys_once_fetched(clock, key_ring):
+    fetcher = KeySetFetcher(key_ring)
+    verifier = TokenVerifier(fetcher)
+    token = key_ring.encode(claims(clock))
+
+    async def scenario():
+        return [await verifier.verify(token) for _ in range(3)]
+
+    results = run(scenario())
+
+    assert [result["user_id"] for result in results] == ["1", "1", "1"]
+    assert fetcher.calls == 1
+
+
+def test_rejects_hs256_and_forged_tokens(clock, key_ring):
+    verifier = TokenVerifier(KeySetFetcher(key_ring))
+    hs256 = jwt.encode(claims(clock), "secret", algorithm="HS256")
+    forged = jwt.encode(
+        claims(clock),
+        ed25519.Ed25519PrivateKey.generate(),
+        algorithm="EdDSA",
+        headers={"kid": "20240101000000"},
+    )
+
+    for token in (hs256, forged):
+        with pytest.raises(jwt.InvalidTokenError):
+            run(verifier.verify(token))
+
+
+def test_a_rotated_key_is_fetched_at_most_every_min_refresh_interval(clock, key_ring):
+    fetcher = KeySetFetcher(key_ring)
+    verifier = TokenVerifier(fetcher, min_refresh_interval=5)
+    run(verifier.verify(key_ring.encode(claims(clock))))
+
+    write_key(
+        key_ring.keys_dir, "20240201000000", ec.generate_private_key(ec.SECP256R1())
+    )
+    key_ring.load()
+    rotated = key_ring.encode(claims(clock))
+    unknown = jwt.encode(
+        claims(clock),
+        ed25519.Ed25519PrivateKey.generate(),
+        algorithm="EdDSA",
+        headers={"kid": "other"},
+    )
+
+    clock.now += 1
+    with pytest.raises(jwt.InvalidTokenError):
+        run(verifier.verify(rotated))
+    assert fetcher.calls == 1
+
+    clock.now += 5
+    assert run(verifier.verify(rotated))["user_id"] == "1"
+    assert fetcher.calls == 2
+
+    with pytest.raises(jwt.InvalidTokenError):
+        run(verifier.verify(unknown))
+    assert fetcher.calls == 2
+
+
+def test_claims_are_cached_until_max_age_or_expiry(clock, key_ring):
+    verifier = TokenVerifier(KeySetFetcher(key_ring), max_age=60)
+    token = key_ring.encode(claims(clock))
+    expiring = key_ring.encode(
+        claims(
+            clock,
+            exp=datetime.datetime.fromtimestamp(clock.now + 10, datetime.timezone.utc),
+        )
+    )
+
+    run(verifier.verify(token))
+    run(verifier.verify(expiring))
+
+    assert verifier._cache.get(token)[0] == clock.now + 60
+    assert verifier._cache.get(expiring)[0] == int(clock.now + 10)
+
+
+def test_forget_drops_the_cached_claims(clock, key_ring):
+    verifier = TokenVerifier(KeySetFetcher(key_ring))
+    token = key_ring.encode(claims(clock))
+    run(verifier.verify(token))
+
+    verifier.forget(token)
+
+    assert verifier._cache.get(token) is None
@@ -0,0 +1,141 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import uuid
+
+from db.invalidation import InvalidationBus
+from db.models.user import UserModel
+from db.pool import Database
+from db.schema import migrate
+from db.shards import ShardRouter, move_group, parse_shards
+from tests.fakes import FakeLogger, run
+
+
+def test_parse_shards():
+    assert parse_shards(" a=postgresql://one , b=postgresql://two?x=1,") == {
+        "a": "postgresql://one",
+        "b": "postgresql://two?x=1",
+    }
+    assert parse_shards("") == {}
+
+
+def test_ring_spreads_groups_over_the_shards():
+    router = ShardRouter(FakeLogger(), None, {"a": None, "b": None, "c": None})
+    group_ids = [uuid.uuid4() for _ in range(3000)]
+
+    placed = [router.shard(group_id) for group_id in group_ids]
+
+    assert placed == [router.shard(str(group_id)) for group_id in group_ids]
+    for name in ("a", "b", "c"):
+        assert 600 < placed.count(name) < 1400
+
+
+def test_adding_a_shard_moves_only_its_share():
+    before = ShardRouter(FakeLogger(), None, {"a": None, "b": None})
+    after = ShardRouter(FakeLogger(), None, {"a": None, "b": None, "c": None})
+    group_ids = [uuid.uuid4() for _ in range(3000)]
+
+    moved = [g for g in group_ids if before.shard(g) != after.shard(g)]
+
+    assert all(after.shard(group_id) == "c" for group_id in moved)
+    assert len(moved) < 1500
+
+
+def test_directory_overrides_the_ring():
+    router = ShardRouter(FakeLogger(), None, {"a": None, "b": None})
+    group_id = str(uuid.uuid4())
+    other = "b" if router.shard(group_id) == "a" else "a"
+
+    router._directory[group_id] = (other, False)
+
+    assert router.shard(group_id) == other
+
+
+async def databases(*dsns) -> list:
+    connected = []
+    for dsn in dsns:
+        database = Database(FakeLogger(), dsn=dsn)
+        await database.setup()
+        await migrate(FakeLogger(), database, partitions=2)
+        connected.append(database)
+    return connected
+
+
+def test_directory_changes_are_reloaded(dsn):
+    async def scenario():
+        (database,) = await databases(dsn)
+        router = ShardRouter(FakeLogger(), database, {"a": database, "b": database})
+        try:
+            await router.setup()
+            group_id = str(uuid.uuid4())
+            other = "b" if router.shard(group_id) == "a" else "a"
+            async with database.acquire() as connection:
+                await connection.execute(
+                    "INSERT INTO group_shards (group_id, shard) VALUES ($1, $2)",
+                    group_id,
+                    other,
+                )
+
+            router._moved(group_id, {})
+            assert len(router._reloads) == 1
+            await asyncio.gather(*router._reloads)
+
+            return router.shard(group_id) == other, len(router._reloads)
+        finally:
+            await router.close()
+            await database.close()
+
+    assert run(scenario()) == (True, 0)
+
+
+def test_move_group_copies_every_column(dsn, shard_dsn):
+    group_id = uuid.uuid4()
+    login = datetime.datetime(2024, 5, 2, 8, 0)
+    seen = datetime.datetime(2024, 5, 2, 9, 30)
+
+    async def scenario():
+        main, other = await databases(dsn, shard_dsn)
+        router = ShardRouter(FakeLogger(), main, {"a": main, "b": other})
+        try:
+            await router.setup()
+            source = router.shard(group_id)
+            target = "b" if source == "a" else "a"
+            async with router.shards[source].acquire() as connection:
+                await connection.execute(
+                    """
+                    INSERT INTO users (group_id, email, password_hash, first_name,
+                        last_name, last_login_at, last_seen_at)
+                    VALUES ($1, 'ada@example.com', 'hash', 'Ada', 'Lovelace', $2, $3)
+                    """,
+                    group_id,
+                    login,
+                    seen,
+                )
+
+            bus = InvalidationBus(FakeLogger(), dsns=())
+            await move_group(router, bus, str(group_id), target, grace=0)
+            await router.load()
+
+            async with router.shards[source].acquire() as connection:
+                left = await connection.fetchval(
+                    "SELECT count(*) FROM users WHERE group_id = $1", group_id
+                )
+            async with router.shards[target].acquire() as connection:
+                record = await connection.fetchrow(
+                    f"SELECT {', '.join(UserModel.COLUMNS)} FROM users"
+                    " WHERE group_id = $1",
+                    group_id,
+                )
+            return router.shard(group_id) == target, left, record
+        finally:
+            await router.close()
+            await main.close()
+            await other.close()
+
+    moved, left, record = run(scenario())
+
+    assert moved and left == 0
+    assert record["email"] == "ada@example.com"
+    assert record["last_login_at"] == login
+    assert record["last_seen_at"] == seen
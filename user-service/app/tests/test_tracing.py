@@ -0,0 +1,108 @@
+# 2024 amicroservice author.
+
+import json
+
+import pytest
+
+from db.pool import TracedConnection
+from tests.fakes import FakeLogger, run
+from utils.tracing import (
+    FileSpanExporter,
+    OtlpSpanExporter,
+    SpanExporter,
+    Tracer,
+)
+
+
+class FakeConnection:
+    async def execute(self, query, *args, timeout=None):
+        return "UPDATE 3"
+
+    async def fetch(self, query, *args, timeout=None):
+        return [1, 2]
+
+
+def test_span_exporter_is_abstract():
+    with pytest.raises(TypeError):
+        SpanExporter(FakeLogger())
+
+
+def test_queries_are_exported_under_their_rpc(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FakeLogger(), exporter=FileSpanExporter(FakeLogger(), str(path)))
+
+    with tracer.rpc("/user.UserService/Get"):
+        tracer.query("SELECT users", "SELECT 1", (), 0, 1000, rows=1)
+    tracer.close()
+
+    (line,) = path.read_text().splitlines()
+    span = json.loads(line)
+    assert span["name"] == "/user.UserService/Get"
+    (child,) = span["children"]
+    assert child["name"] == "SELECT users"
+    assert child["parent_id"] == span["span_id"]
+    assert child["trace_id"] == span["trace_id"]
+    assert child["attributes"]["db.rows"] == 1
+
+
+def test_rpc_span_records_the_error():
+    tracer = Tracer(FakeLogger())
+
+    with pytest.raises(ValueError):
+        with tracer.rpc("/user.UserService/Get") as span:
+            raise ValueError()
+
+    assert span.attributes["error"] == "ValueError"
+    assert tracer.current() is None
+
+
+def test_slow_query_is_logged_without_parameter_values():
+    logger = FakeLogger()
+    tracer = Tracer(logger, slow_query_threshold=0.1)
+
+    tracer.query(
+        "SELECT users",
+        "SELECT *\n FROM users WHERE email = $1",
+        ("secret@example.com", None, 7),
+        0,
+        200_000_000,
+    )
+    tracer.query("SELECT users", "SELECT 1", (), 0, 1000)
+
+    (warning,) = logger.messages["warning"]
+    assert "Slow query SELECT users took 200.0 ms" in warning
+    assert "SELECT * FROM users WHERE email = $1" in warning
+    assert "$1=<str:18>, $2=NULL, $3=<int>" in warning
+    assert "secret" not in warning.split("[")[1]
+
+
+def test_traced_connection_names_statements_and_counts_rows():
+    spans = []
+
+    class RecordingTracer(Tracer):
+        def query(self, name, query, args, start_ns, end_ns, **kwargs):
+            spans.append((name, kwargs))
+
+    connection = TracedConnection(FakeConnection(), RecordingTracer(FakeLogger()), 0.5)
+
+    assert run(connection.execute("UPDATE users SET email = $1", "a")) == "UPDATE 3"
+    assert run(connection.fetch("select id from users where id = $1", 1)) == [1, 2]
+
+    assert spans[0] == ("UPDATE users", {"rows": 3, "pool_wait": 0.5})
+    assert spans[1] == ("SELECT users", {"rows": 2, "pool_wait": 0.0})
+
+
+def test_otlp_span_format():
+    tracer = Tracer(FakeLogger())
+    with tracer.rpc("/user.UserService/Get") as span:
+        tracer.query("SELECT users", "SELECT 1", (), 10, 20, rows=1)
+
+    exporter = OtlpSpanExporter.__new__(OtlpSpanExporter)
+    server = exporter._span(span)
+    client = exporter._span(span.children[0])
+
+    assert server["kind"] == 2
+    assert client["kind"] == 3
+    assert client["parentSpanId"] == server["spanId"]
+    assert client["startTimeUnixNano"] == "10"
+    assert {"key": "db.rows", "value": {"intValue": "1"}} in client["attributes"]
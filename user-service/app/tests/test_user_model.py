@@ -0,0 +1,62 @@
+# 2024 amicroservice author.
+
+import datetime
+import uuid
+
+import pytest
+
+from db.models.user import UserModel
+
+
+def record():
+    now = datetime.datetime(2024, 5, 1, 12, 30)
+    return (
+        uuid.uuid4(),
+        now,
+        now,
+        uuid.uuid4(),
+        "ada@example.com",
+        b"hash",
+        "Ada",
+        "Lovelace",
+        None,
+        None,
+    )
+
+
+def test_from_record_reads_columns_in_order():
+    row = record()
+
+    user_model = UserModel.from_record(row)
+
+    assert tuple(getattr(user_model, column) for column in UserModel.COLUMNS) == row
+
+
+def test_from_columns_leaves_the_rest_none():
+    user_model = UserModel.from_columns({"email": "ada@example.com"})
+
+    assert user_model.email == "ada@example.com"
+    assert user_model.id is None
+    assert user_model.updated_at is None
+
+
+def test_models_have_no_instance_dict():
+    user_model = UserModel.from_record(record())
+
+    assert not hasattr(user_model, "__dict__")
+    with pytest.raises(AttributeError):
+        user_model.nickname = "ada"
+
+
+def test_password_is_hashed_and_checked():
+    user_model = UserModel(
+        group_id=uuid.uuid4(),
+        email="ada@example.com",
+        first_name="Ada",
+        last_name="Lovelace",
+        password="Secret123",
+    )
+
+    assert user_model.password_hash != b"Secret123"
+    assert user_model.valid_password("Secret123")
+    assert not user_model.valid_password("Secret124")
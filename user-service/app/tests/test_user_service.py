@@ -0,0 +1,498 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import uuid
+
+import bcrypt
+import grpc
+import pytest
+from google.protobuf import duration_pb2, field_mask_pb2
+
+import buf.user.user_pb2 as user_pb2
+import buf.user.user_pb2_grpc as user_pb2_grpc
+import services.errors as errors
+from db.backends.memory import (
+    MemoryGroupTable,
+    MemoryGroupuserTable,
+    MemoryUserTable,
+)
+from db.invalidation import InvalidationBus
+from db.models.user import UserModel
+from services.keys import service_token
+from services.revocation import RevocationList
+from services.user import (
+    UserService,
+    add_user_service_to_server,
+    claims_user,
+    profile_claims,
+    serialize_user,
+    user_message,
+)
+from services.watch import WatchHub
+from tests.fakes import Aborted, FakeContext, FakeLogger, FakeRevocationTable
+from utils.cache import LRUCache
+from utils.idempotency import IdempotencyStore
+from utils.ratelimit import TokenBucketLimiter
+
+
+def stored_user(**columns) -> UserModel:
+    now = datetime.datetime(2024, 5, 1, 12, 30, 15, 250000)
+    values = {
+        "id": uuid.uuid4(),
+        "created_at": now,
+        "updated_at": now,
+        "group_id": uuid.uuid4(),
+        "email": "ada@example.com",
+        "password_hash": b"hash",
+        "first_name": "Ada",
+        "last_name": "Lovelace",
+        "last_login_at": None,
+        "last_seen_at": None,
+    }
+    values.update(columns)
+    return UserModel.from_record(tuple(values[column] for column in UserModel.COLUMNS))
+
+
+def make_service(**kwargs) -> UserService:
+    return UserService(
+        logger=FakeLogger(),
+        group_table=MemoryGroupTable(),
+        groupuser_table=MemoryGroupuserTable(),
+        user_table=MemoryUserTable(),
+        jwt_secret="secret",
+        **kwargs,
+    )
+
+
+def add_user(service: UserService, **columns) -> UserModel:
+    """
+    Store a user in the memory table of the service
+    """
+    user_model = stored_user(**columns)
+    service.user_table._by_id[str(user_model.id)] = user_model
+    service.user_table._by_email[(str(user_model.group_id), user_model.email)] = (
+        user_model
+    )
+    return user_model
+
+
+def user_token(service: UserService, user_model: UserModel, **claims) -> str:
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    payload = {
+        "exp": now + datetime.timedelta(hours=1),
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "user_id": str(user_model.id),
+        "group_id": str(user_model.group_id),
+    }
+    payload.update(claims)
+    return service.key_ring.encode(payload)
+
+
+def call(method, request, token: str = None, **kwargs):
+    """
+    Run a unary method, the response or the Aborted error
+    """
+    metadata = (("authorization", token),) if token else ()
+    try:
+        return asyncio.run(method(request, FakeContext(metadata, **kwargs)))
+    except Aborted as e:
+        return e
+
+
+def test_user_message_converts_every_field():
+    user_model = stored_user(last_login_at=datetime.datetime(2024, 5, 2))
+
+    message = user_message(user_model)
+
+    assert message.id == str(user_model.id)
+    assert message.group_id == str(user_model.group_id)
+    assert message.email == "ada@example.com"
+    assert message.created_at.ToDatetime() == user_model.created_at
+    assert message.last_login_at.ToDatetime() == datetime.datetime(2024, 5, 2)
+
+
+def test_user_message_skips_missing_times():
+    message = user_message(stored_user(created_at=None, updated_at=None))
+
+    assert not message.HasField("created_at")
+    assert not message.HasField("updated_at")
+    assert not message.HasField("last_login_at")
+
+
+def test_partial_user_message_sets_only_the_fields():
+    user_model = stored_user()
+
+    message = user_message(user_model, fields=("email", "updated_at"))
+
+    assert message == user_pb2.User(
+        email="ada@example.com", updated_at=user_message(user_model).updated_at
+    )
+
+
+def get_request(*paths) -> user_pb2.GetRequest:
+    return user_pb2.GetRequest(field_mask=field_mask_pb2.FieldMask(paths=paths))
+
+
+def test_get_returns_the_fields_of_the_mask():
+    service = make_service()
+    user_model = add_user(service)
+
+    response = call(
+        service.Get, get_request("email", "id"), user_token(service, user_model)
+    )
+
+    assert response == user_pb2.User(id=str(user_model.id), email="ada@example.com")
+
+
+@pytest.mark.parametrize(
+    "paths", [("nickname",), ("created_at.seconds",), ("email", "updated_at.nanos")]
+)
+def test_get_rejects_unknown_and_nested_paths(paths):
+    service = make_service()
+    user_model = add_user(service)
+
+    response = call(service.Get, get_request(*paths), user_token(service, user_model))
+
+    assert isinstance(response, Aborted)
+    assert response.status is errors.FIELD_MASK_INVALID
+    assert response.status.code is grpc.StatusCode.INVALID_ARGUMENT
+
+
+class FakeServer:
+    def __init__(self):
+        self.handlers = None
+
+    def add_generic_rpc_handlers(self, handlers):
+        pass
+
+    def add_registered_method_handlers(self, service, handlers):
+        self.service = service
+        self.handlers = handlers
+
+
+def test_handlers_match_the_generated_registration():
+    generated = FakeServer()
+    user_pb2_grpc.add_UserServiceServicer_to_server(make_service(), generated)
+    registered = FakeServer()
+    add_user_service_to_server(make_service(), registered)
+
+    assert registered.service == generated.service
+    assert registered.handlers.keys() == generated.handlers.keys()
+    for name, handler in registered.handlers.items():
+        expected = generated.handlers[name]
+        assert handler.response_streaming == expected.response_streaming
+        assert handler.request_deserializer == expected.request_deserializer
+
+    # User responses may be sent as pre-serialized bytes
+    assert registered.handlers["Get"].response_serializer is serialize_user
+    assert registered.handlers["Watch"].response_serializer is serialize_user
+
+
+def test_get_reuses_the_serialized_user_until_the_row_changes():
+    service = make_service(response_cache=LRUCache(maxsize=10))
+    user_model = add_user(service)
+    token = user_token(service, user_model)
+
+    first = call(service.Get, user_pb2.GetRequest(), token)
+    second = call(service.Get, user_pb2.GetRequest(), token)
+
+    assert first is second
+    assert user_pb2.User.FromString(first) == user_message(user_model)
+
+    user_model.updated_at += datetime.timedelta(seconds=1)
+    third = call(service.Get, user_pb2.GetRequest(), token)
+
+    assert third is not first
+    assert user_pb2.User.FromString(third).updated_at.ToDatetime() == (
+        user_model.updated_at
+    )
+
+
+def test_login_is_throttled_per_peer():
+    service = make_service(peer_limiter=TokenBucketLimiter(rate=1, burst=1))
+    request = user_pb2.LoginRequest(
+        group_id=str(uuid.uuid4()), email="ada@example.com", password="Password0000"
+    )
+
+    first = call(service.Login, request)
+    second = call(service.Login, request)
+    other_peer = call(service.Login, request, peer="ipv4:10.0.0.2:5000")
+
+    assert first.status.code is grpc.StatusCode.NOT_FOUND
+    assert second.status is errors.LOGIN_THROTTLED
+    assert other_peer.status.code is grpc.StatusCode.NOT_FOUND
+
+
+def test_register_replays_the_outcome_of_an_idempotency_key():
+    service = make_service(idempotency=IdempotencyStore())
+    group_id = str(uuid.uuid4())
+    asyncio.run(service.group_table.add(group_id, {"invitation_only": False}))
+    request = user_pb2.RegisterRequest(
+        group_id=group_id,
+        email="ada@example.com",
+        password="Password0000",
+        first_name="Ada",
+        last_name="Lovelace",
+    )
+
+    metadata = (("idempotency-key", "retry-1"),)
+    first = asyncio.run(service.Register(request, FakeContext(metadata)))
+    retried = asyncio.run(service.Register(request, FakeContext(metadata)))
+    duplicate = call(service.Register, request)
+
+    assert retried is first
+    assert user_pb2.User.FromString(first).email == "ada@example.com"
+    assert len(service.user_table._by_id) == 1
+    assert duplicate.status.code is grpc.StatusCode.ALREADY_EXISTS
+
+
+class BlockedUserTable(MemoryUserTable):
+    """
+    User table holding each create until released, recording the deadlines
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.remaining = []
+
+    async def create(self, user_model, context=None):
+        self.remaining.append(context.time_remaining())
+        await self.release.wait()
+        return await super().create(user_model, context)
+
+
+def test_register_completes_for_the_retry_after_a_client_timeout():
+    service = make_service(idempotency=IdempotencyStore(ttl=600))
+    service.user_table = BlockedUserTable()
+    group_id = str(uuid.uuid4())
+    asyncio.run(service.group_table.add(group_id, {"invitation_only": False}))
+    request = user_pb2.RegisterRequest(
+        group_id=group_id,
+        email="ada@example.com",
+        password="Password0000",
+        first_name="Ada",
+        last_name="Lovelace",
+    )
+    metadata = (("idempotency-key", "retry-1"),)
+
+    async def scenario():
+        # grpc cancels the handler once the deadline of the client is spent
+        first = asyncio.create_task(
+            service.Register(request, FakeContext(metadata, time_remaining=0.01))
+        )
+        for _ in range(100):
+            if service.user_table.remaining:
+                break
+            await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+
+        service.user_table.release.set()
+        retried = await service.Register(request, FakeContext(metadata))
+        return first.cancelled(), retried
+
+    cancelled, retried = asyncio.run(scenario())
+
+    assert cancelled
+    assert user_pb2.User.FromString(retried).email == "ada@example.com"
+    assert len(service.user_table.remaining) == 1
+    assert service.user_table.remaining[0] > 500
+    assert len(service.user_table._by_id) == 1
+
+
+def test_profile_claims_round_trip():
+    user_model = stored_user()
+
+    snapshot = claims_user(str(user_model.id), profile_claims(user_model))
+
+    assert user_message(snapshot) == user_message(user_model)
+
+
+def test_profile_claims_without_times():
+    user_model = stored_user(created_at=None, updated_at=None)
+
+    profile = profile_claims(user_model)
+    snapshot = claims_user(str(user_model.id), profile)
+
+    assert profile["v"] == 0
+    assert "created_at" not in profile and "updated_at" not in profile
+    assert snapshot.created_at is None and snapshot.updated_at is None
+
+
+class FakeActivity:
+    def __init__(self):
+        self.seen_users = []
+
+    def seen(self, user_id, group_id):
+        self.seen_users.append((user_id, group_id))
+
+
+class CountingKeyRing:
+    """
+    Key ring of a service counting its decodes
+    """
+
+    def __init__(self, key_ring):
+        self.key_ring = key_ring
+        self.decodes = 0
+
+    def encode(self, payload: dict) -> str:
+        return self.key_ring.encode(payload)
+
+    def decode(self, token: str) -> dict:
+        self.decodes += 1
+        return self.key_ring.decode(token)
+
+
+@pytest.mark.parametrize("embed", [True, False])
+def test_get_with_max_staleness_decodes_once_and_records_activity(embed):
+    service = make_service(activity=FakeActivity())
+    service.key_ring = CountingKeyRing(service.key_ring)
+    user_model = add_user(service)
+    claims = {"profile": profile_claims(user_model)} if embed else {}
+    token = user_token(service, user_model, **claims)
+
+    request = user_pb2.GetRequest(max_staleness=duration_pb2.Duration(seconds=60))
+    response = call(service.Get, request, token)
+
+    assert response == user_message(user_model)
+    assert service.key_ring.decodes == 1
+    assert service.activity.seen_users == [
+        (str(user_model.id), str(user_model.group_id))
+    ]
+
+
+def test_logout_of_all_sessions_keeps_a_login_in_the_same_second():
+    revocations = RevocationList(FakeLogger(), FakeRevocationTable())
+    service = make_service(revocations=revocations)
+    password_hash = bcrypt.hashpw(b"Password0000", bcrypt.gensalt(4))
+    user_model = add_user(service, password_hash=password_hash)
+    login = user_pb2.LoginRequest(
+        group_id=str(user_model.group_id),
+        email=user_model.email,
+        password="Password0000",
+    )
+
+    before = call(service.Login, login).token
+    call(service.Logout, user_pb2.LogoutRequest(all_sessions=True), before)
+    after = call(service.Login, login).token
+
+    assert call(service.Get, user_pb2.GetRequest(), before).status is (
+        errors.TOKEN_INVALID
+    )
+    assert call(service.Get, user_pb2.GetRequest(), after) == user_message(user_model)
+
+
+def test_logout_without_revocations_is_unimplemented():
+    service = make_service()
+    user_model = add_user(service)
+
+    response = call(
+        service.Logout, user_pb2.LogoutRequest(), user_token(service, user_model)
+    )
+
+    assert response.status is errors.LOGOUT_UNAVAILABLE
+    assert response.status.code is grpc.StatusCode.UNIMPLEMENTED
+
+
+def watch_first(service: UserService, request, token: str):
+    """
+    First message of a Watch call, or the Aborted error
+    """
+
+    async def first():
+        stream = service.Watch(request, FakeContext((("authorization", token),)))
+        try:
+            return await stream.__anext__()
+        finally:
+            await stream.aclose()
+
+    try:
+        return asyncio.run(first())
+    except Aborted as e:
+        return e
+
+
+def make_watch_service() -> UserService:
+    service = make_service()
+    service.watch_hub = WatchHub(
+        FakeLogger(),
+        user_table=service.user_table,
+        bus=InvalidationBus(FakeLogger(), dsns=()),
+    )
+    return service
+
+
+def test_watch_with_a_service_token_needs_ids():
+    service = make_watch_service()
+    user_model = add_user(service)
+    token = service_token(service.key_ring, "billing")
+
+    missing = watch_first(service, user_pb2.WatchRequest(), token)
+    watched = watch_first(
+        service, user_pb2.WatchRequest(ids=[str(user_model.id)]), token
+    )
+
+    assert missing.status is errors.WATCH_IDS_REQUIRED
+    assert missing.status.code is grpc.StatusCode.INVALID_ARGUMENT
+    assert watched == user_message(user_model)
+    assert len(service.watch_hub) == 0
+
+
+def test_watch_with_a_user_token_only_its_user():
+    service = make_watch_service()
+    user_model = add_user(service)
+    other = add_user(service, email="bob@example.com")
+    token = user_token(service, user_model)
+
+    own = watch_first(service, user_pb2.WatchRequest(), token)
+    forbidden = watch_first(service, user_pb2.WatchRequest(ids=[str(other.id)]), token)
+
+    assert own == user_message(user_model)
+    assert forbidden.status is errors.WATCH_FORBIDDEN
+
+
+@pytest.mark.parametrize(
+    "method, request_message",
+    [
+        ("Get", user_pb2.GetRequest()),
+        ("Update", user_pb2.UpdateRequest(first_name="Ada")),
+        ("Logout", user_pb2.LogoutRequest(all_sessions=True)),
+    ],
+)
+def test_service_tokens_are_refused_on_user_calls(method, request_message):
+    service = make_service(
+        revocations=RevocationList(FakeLogger(), FakeRevocationTable())
+    )
+    token = service_token(service.key_ring, "billing")
+
+    response = call(getattr(service, method), request_message, token)
+
+    assert response.status is errors.USER_TOKEN_REQUIRED
+    assert service.revocations.revocation_table.rows == []
+
+
+class FakeAuditLog:
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, outcome="ok", **fields):
+        self.events.append((event, outcome, fields))
+
+
+def test_failed_calls_are_audited_with_their_status():
+    service = make_service(audit_log=FakeAuditLog())
+    request = user_pb2.LoginRequest(
+        group_id=str(uuid.uuid4()), email="ada@example.com", password="Password0000"
+    )
+
+    response = call(service.Login, request)
+
+    assert response.status.code is grpc.StatusCode.NOT_FOUND
+    ((event, outcome, fields),) = service.audit_log.events
+    assert (event, outcome) == ("login", "not_found")
+    assert fields["email"] == "ada@example.com"
+    assert fields["peer"] == "ipv4:10.0.0.1"
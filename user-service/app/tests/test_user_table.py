@@ -0,0 +1,176 @@
+# 2024 amicroservice author.
+
+import asyncio
+import datetime
+import uuid
+
+import asyncpg
+
+from db.models.user import UserModel
+from db.pool import Database
+from db.schema import migrate
+from db.tables.user import UserTable
+from tests.fakes import FakeContext, FakeLogger, run
+
+
+async def user_table(dsn: str, **kwargs) -> UserTable:
+    database = Database(FakeLogger(), dsn=dsn)
+    await database.setup()
+    await migrate(FakeLogger(), database, partitions=2)
+    return UserTable(FakeLogger(), database, **kwargs)
+
+
+def new_user(group_id, email: str = "ada@example.com") -> UserModel:
+    return UserModel.from_columns(
+        {
+            "group_id": group_id,
+            "email": email,
+            "password_hash": b"hash",
+            "first_name": "Ada",
+            "last_name": "Lovelace",
+        }
+    )
+
+
+def test_update_changes_only_the_row_of_the_group(dsn):
+    id = uuid.uuid4()
+    group_id, other_group_id = uuid.uuid4(), uuid.uuid4()
+
+    async def scenario():
+        table = await user_table(dsn)
+        try:
+            # The key is (group_id, id), the same id may be in two groups
+            async with table.database.acquire() as connection:
+                for group in (group_id, other_group_id):
+                    await connection.execute(
+                        """
+                        INSERT INTO users (id, group_id, email, password_hash,
+                            first_name, last_name)
+                        VALUES ($1, $2, 'ada@example.com', 'hash', 'Ada', 'Lovelace')
+                        """,
+                        id,
+                        group,
+                    )
+
+            user_model = await table.get(id=id, group_id=group_id)
+            user_model.first_name = "Augusta"
+            user_model.updated_at = datetime.datetime.now()
+            await table.update(user_model)
+
+            return (
+                await table.get(id=id, group_id=group_id),
+                await table.get(id=id, group_id=other_group_id),
+            )
+        finally:
+            await table.database.close()
+
+    updated, other = run(scenario())
+
+    assert updated.first_name == "Augusta"
+    assert other.first_name == "Ada"
+
+
+def test_batch_runs_within_the_earliest_deadline():
+    table = UserTable(FakeLogger(), Database(FakeLogger(), dsn="postgresql://"))
+    used = []
+
+    async def insert_rows(database, rows, context):
+        used.append(context)
+        return []
+
+    table._insert_rows = insert_rows
+    late, early = FakeContext(time_remaining=5), FakeContext(time_remaining=0.5)
+    group_id = uuid.uuid4()
+
+    results = run(
+        table._insert_batch(
+            table.database,
+            [
+                (new_user(group_id, "ada@example.com"), late),
+                (new_user(group_id, "bob@example.com"), early),
+                (new_user(group_id, "eve@example.com"), None),
+                (new_user(group_id, "out@example.com"), FakeContext(time_remaining=0)),
+            ],
+        )
+    )
+
+    assert used == [early]
+    assert isinstance(results[3], asyncio.TimeoutError)
+
+
+def test_batched_creates(dsn):
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        table = await user_table(dsn, batch_window=0.05)
+        try:
+            return await asyncio.gather(
+                table.create(new_user(group_id, "ada@example.com")),
+                table.create(new_user(group_id, "bob@example.com")),
+                table.create(new_user(group_id, "ada@example.com")),
+                table.create(
+                    new_user(group_id, "out@example.com"),
+                    FakeContext(time_remaining=0),
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            await table.database.close()
+
+    ada, bob, duplicate, out = run(scenario())
+
+    assert ada.email == "ada@example.com" and ada.id is not None
+    assert bob.email == "bob@example.com"
+    assert isinstance(duplicate, asyncpg.UniqueViolationError)
+    assert isinstance(out, asyncio.TimeoutError)
+
+
+def test_a_failed_batch_is_inserted_row_by_row(dsn):
+    group_id = uuid.uuid4()
+
+    async def scenario():
+        table = await user_table(dsn, batch_window=0.05)
+        try:
+            results = await asyncio.gather(
+                table.create(new_user(group_id, "ada@example.com")),
+                # Text cannot hold a NUL byte, this row fails the statement
+                table.create(new_user(group_id, "bad\x00@example.com")),
+                table.create(new_user(group_id, "bob@example.com")),
+                return_exceptions=True,
+            )
+            async with table.database.acquire() as connection:
+                count = await connection.fetchval("SELECT count(*) FROM users")
+            return results, count
+        finally:
+            await table.database.close()
+
+    (ada, bad, bob), count = run(scenario())
+
+    assert ada.email == "ada@example.com"
+    assert bob.email == "bob@example.com"
+    assert isinstance(bad, Exception) and not isinstance(bad, asyncio.TimeoutError)
+    assert count == 2
+
+
+def test_record_activity_only_moves_times_forward(dsn):
+    group_id = uuid.uuid4()
+    login = datetime.datetime(2024, 5, 1, 8, 0)
+    seen = datetime.datetime(2024, 5, 2, 9, 30)
+
+    async def scenario():
+        table = await user_table(dsn)
+        try:
+            user_model = await table.create(new_user(group_id))
+            await table.record_activity({user_model.id: (group_id, login, seen)})
+            await table.record_activity(
+                {user_model.id: (group_id, None, seen - datetime.timedelta(days=1))}
+            )
+            return user_model, await table.get(id=user_model.id, group_id=group_id)
+        finally:
+            await table.database.close()
+
+    created, user_model = run(scenario())
+
+    assert user_model.last_login_at == login
+    assert user_model.last_seen_at == seen
+    assert user_model.updated_at == created.updated_at
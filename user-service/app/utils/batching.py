@@ -0,0 +1,77 @@
+# 2024 amicroservice author.
+
+import asyncio
+import copy
+
+
+class WriteBatcher:
+    """
+    Group concurrent calls by key into one flush, each caller gets its own result
+
+    A batch is flushed once its window has passed since the first call, or
+    when it reaches max_size. flush(key, items) returns one result per item,
+    an exception in place of a result is raised to that caller only. If the
+    flush raises, every caller gets its own copy of the exception.
+    """
+
+    def __init__(self, flush, window: float = 0.002, max_size: int = 100):
+        # Initialize
+        self.flush = flush
+        self.window = window  # Seconds the first call of a batch waits
+        self.max_size = max_size
+
+        # Key to the waiting (item, future) pairs and to the timer of the batch
+        self._pending = dict()
+        self._timers = dict()
+        self._tasks = set()
+
+    async def submit(self, key, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_size:
+            self._start(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window, self._start, key)
+
+        return await future
+
+    def _start(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        batch = self._pending.pop(key, None)
+        if batch:
+            # Keep a reference, the loop only holds tasks weakly
+            task = asyncio.get_running_loop().create_task(self._run(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key, batch):
+        try:
+            results = await self.flush(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(_own(e))
+            return
+
+        # A cancelled caller has already gone, its result is dropped
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def _own(e: Exception) -> Exception:
+    # One instance raised in several tasks would pile up their tracebacks
+    try:
+        return copy.copy(e)
+    except Exception:
+        return e
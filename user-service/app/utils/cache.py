@@ -0,0 +1,185 @@
+# 2024 amicroservice author.
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded cache evicting the least recently used entry
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        # Initialize
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class NegativeCache:
+    """
+    Bounded set of keys known to be missing, each remembered for ttl seconds
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 30.0):
+        # Initialize
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # Key to expiry, in insertion order which is also expiry order
+        self._data = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def contains(self, key) -> bool:
+        expiry = self._data.get(key)
+        if expiry is None:
+            return False
+        if expiry <= time.monotonic():
+            del self._data[key]
+            return False
+        return True
+
+    def add(self, key):
+        self._data.pop(key, None)
+        self._data[key] = time.monotonic() + self.ttl
+        self._expire()
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._data:
+            key, expiry = next(iter(self._data.items()))
+            if expiry > now and len(self._data) <= self.maxsize:
+                return
+            del self._data[key]
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over string keys
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        # Size the bit array and the number of hashes for the error rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing over two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class BloomNegativeCache:
+    """
+    NegativeCache for large key spaces, kept in two rotating Bloom filters
+
+    A key is remembered for ttl to 2 * ttl seconds. Bloom filters cannot
+    delete, so invalidated keys are kept for 2 * ttl in an exact set that
+    overrides the filters. Past capacity invalidations within that time,
+    both filters are cleared rather than an override dropped.
+
+    A false positive reports a key that was never added as missing, so a
+    real user is denied until the filter holding its bits rotates out. Both
+    generations are checked, with full filters a key is a false positive
+    with a probability of about 2 * error_rate: 1 in 500 at 0.001, 1 in
+    500000 at the default 1e-6. Each filter takes about 3.6 bytes per key
+    of capacity at 1e-6, 1.8 at 0.001.
+    """
+
+    def __init__(self, capacity: int = 1000000, ttl: float = 30.0, error_rate=1e-6):
+        # Initialize
+        self.capacity = capacity
+        self.ttl = ttl
+        self.error_rate = error_rate
+
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._count = 0
+        self._rotated_at = time.monotonic()
+
+        # Invalidated keys outlive both generations of the filters, one over
+        # capacity so invalidate sees the set full before anything is evicted
+        self._cleared = NegativeCache(maxsize=capacity + 1, ttl=2 * ttl)
+
+    def contains(self, key) -> bool:
+        self._rotate()
+        if self._cleared.contains(key):
+            return False
+        key = str(key)
+        return key in self._current or key in self._previous
+
+    def add(self, key):
+        self._rotate()
+        self._cleared.invalidate(key)
+        self._current.add(str(key))
+        self._count += 1
+
+    def invalidate(self, key):
+        self._cleared.add(key)
+
+        # A dropped override would bring its key back as missing, forget
+        # every key instead, lookups only go to the database again
+        if len(self._cleared) > self.capacity:
+            self.clear()
+
+    def clear(self):
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._previous = BloomFilter(self.capacity, self.error_rate)
+        self._count = 0
+        self._rotated_at = time.monotonic()
+        self._cleared.clear()
+
+    def _rotate(self):
+        # Start a new generation every ttl, or earlier once the filter is full
+        now = time.monotonic()
+        if now - self._rotated_at < self.ttl and self._count < self.capacity:
+            return
+
+        self._previous = self._current
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._count = 0
+        self._rotated_at = now
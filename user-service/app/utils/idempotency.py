@@ -0,0 +1,81 @@
+# 2024 amicroservice author.
+
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class IdempotencyStore:
+    """
+    Run a call once per key, join concurrent callers and replay the outcome for ttl
+    """
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 100000):
+        # Initialize
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        # Key to (expiry, outcome), in insertion order which is also expiry order
+        self._outcomes = OrderedDict()
+
+        # Key to the task of the execution in flight
+        self._inflight = dict()
+
+    def get(self, key):
+        """
+        Stored outcome of the key, None if unknown or expired
+        """
+        entry = self._outcomes.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._outcomes[key]
+            return None
+        return entry[1]
+
+    async def run(self, key, call):
+        """
+        Outcome of call() for the key, executed at most once while it is stored
+
+        call() runs as its own task bounded by ttl. A cancelled caller, as on
+        a client timeout, leaves it running, so the retry joins it or replays
+        its outcome. Exceptions are not stored, the next caller executes again.
+        """
+        outcome = self.get(key)
+        if outcome is not None:
+            return outcome
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._execute(key, call))
+            task.add_done_callback(_retrieve)
+            self._inflight[key] = task
+
+        return await asyncio.shield(task)
+
+    async def _execute(self, key, call):
+        try:
+            outcome = await asyncio.wait_for(call(), self.ttl)
+        finally:
+            del self._inflight[key]
+
+        self._store(key, outcome)
+        return outcome
+
+    def _store(self, key, outcome):
+        now = time.monotonic()
+        self._outcomes.pop(key, None)
+        self._outcomes[key] = (now + self.ttl, outcome)
+
+        # Drop expired entries from the front, and the oldest when full
+        while self._outcomes:
+            first, (expiry, _) = next(iter(self._outcomes.items()))
+            if expiry > now and len(self._outcomes) <= self.maxsize:
+                return
+            del self._outcomes[first]
+
+
+def _retrieve(task: asyncio.Task):
+    # Every caller may have gone, the exception is not an unhandled one
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,155 @@
+# 2024 amicroservice author.
+
+import asyncio
+import bisect
+import sys
+import threading
+import time
+import traceback
+
+from utils.logger import Logger
+
+
+class LoopMonitor:
+    """
+    Measure scheduling lag of the asyncio loop and dump the stack of blocking code
+    """
+
+    # Upper bounds of the lag histogram buckets in seconds
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(
+        self,
+        logger: Logger,
+        interval: float = 0.05,
+        threshold: float = 0.1,
+        report_interval: float = 60.0,
+    ):
+        # Initialize
+        self.logger = logger
+        self.interval = interval  # Sleep between two measurements
+        self.threshold = threshold  # Lag that triggers a stack dump
+        self.report_interval = report_interval  # Period of the histogram log
+
+        # Histogram of the lag, the last bucket collects everything above
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.samples = 0
+        self.total = 0.0
+        self.max_lag = 0.0
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task: asyncio.Task = None
+        self._watchdog: threading.Thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Start measuring on the running loop and start the watchdog thread
+        """
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+
+        self.logger.info(
+            f"{__name__}: Loop monitor started, threshold {self.threshold * 1000:.0f} ms"
+        )
+
+    async def stop(self):
+        """
+        Stop the measurement and the watchdog, and log the final histogram
+        """
+        self._stopped.set()
+
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._watchdog:
+            self._watchdog.join()
+            self._watchdog = None
+
+        self.report()
+
+    def observe(self, lag: float):
+        """
+        Record one lag sample in seconds
+        """
+        lag = max(lag, 0.0)
+        self.counts[bisect.bisect_left(self.BUCKETS, lag)] += 1
+        self.samples += 1
+        self.total += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def histogram(self) -> dict:
+        """
+        Lag histogram keyed by the bucket upper bound in milliseconds
+        """
+        labels = [f"<={bound * 1000:g}ms" for bound in self.BUCKETS]
+        labels.append(f">{self.BUCKETS[-1] * 1000:g}ms")
+        return dict(zip(labels, self.counts))
+
+    def report(self):
+        """
+        Log the lag histogram
+        """
+        if not self.samples:
+            return
+
+        buckets = ", ".join(
+            f"{label}: {count}" for label, count in self.histogram().items() if count
+        )
+        self.logger.info(
+            f"{__name__}: Loop lag samples {self.samples}, "
+            f"mean {self.total / self.samples * 1000:.2f} ms, "
+            f"max {self.max_lag * 1000:.2f} ms - {buckets}"
+        )
+
+    async def _measure(self):
+        """
+        Sleep for the interval and record how late the loop wakes up
+        """
+        last_report = time.monotonic()
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+
+            self._heartbeat = now
+            self.observe(now - start - self.interval)
+
+            if now - last_report >= self.report_interval:
+                self.report()
+                last_report = now
+
+    def _watch(self):
+        """
+        Dump the stack of the loop thread once per stall above the threshold
+        """
+        dumped = False
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled <= self.threshold:
+                dumped = False
+                continue
+
+            if dumped:
+                continue
+
+            # The loop thread is still inside the blocking call, capture it
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.logger.warning(
+                f"{__name__}: Event loop blocked for {stalled * 1000:.0f} ms\n{stack}"
+            )
+            dumped = True
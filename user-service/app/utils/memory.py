@@ -0,0 +1,93 @@
+# 2024 amicroservice author.
+
+import gc
+import tracemalloc
+
+from utils.logger import Logger
+
+
+class MemoryProfiler:
+    """
+    Take tracemalloc snapshots and report allocation growth between them
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        types: dict = None,
+        frames: int = 1,
+        limit: int = 15,
+    ):
+        # Initialize
+        self.logger = logger
+        self.types = types or dict()  # Label and class of the live objects to count
+        self.frames = frames  # Frames kept per allocation, 1 keeps tracing cheap
+        self.limit = limit  # Number of allocation sites to report
+
+        self.baseline: tracemalloc.Snapshot = None
+        self.previous: tracemalloc.Snapshot = None
+
+    def arm(self):
+        """
+        Start tracing allocations and take the baseline snapshot
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+        self.baseline = self._snapshot()
+        self.previous = self.baseline
+
+        self.logger.info(
+            f"{__name__}: Memory tracing armed with {self.frames} frame(s)"
+        )
+
+    def trigger(self):
+        """
+        Arm on the first call, afterwards report the growth since the last call
+        """
+        if self.baseline is None or not tracemalloc.is_tracing():
+            self.arm()
+            return
+
+        snapshot = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [
+            f"{__name__}: Traced memory {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB"
+        ]
+
+        lines.append("Top growth since the previous snapshot:")
+        lines.extend(self._top(snapshot, self.previous))
+
+        lines.append("Top growth since the baseline:")
+        lines.extend(self._top(snapshot, self.baseline))
+
+        if self.types:
+            counts = ", ".join(
+                f"{label}: {count}" for label, count in self.count_objects().items()
+            )
+            lines.append(f"Live objects - {counts}")
+
+        self.logger.info("\n".join(lines))
+        self.previous = snapshot
+
+    def count_objects(self) -> dict:
+        """
+        Count live objects of the configured types
+        """
+        counts = dict.fromkeys(self.types, 0)
+        for obj in gc.get_objects():
+            for label, cls in self.types.items():
+                if isinstance(obj, cls):
+                    counts[label] += 1
+        return counts
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        # Leave out the bookkeeping of tracemalloc itself
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    def _top(self, snapshot, other) -> list:
+        stats = snapshot.compare_to(other, "lineno")
+        return [f"  {stat}" for stat in stats[: self.limit] if stat.size_diff > 0]
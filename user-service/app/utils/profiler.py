@@ -0,0 +1,92 @@
+# 2024 amicroservice author.
+
+import collections
+import os
+import sys
+import threading
+import time
+
+from utils.logger import Logger
+
+
+class SamplingProfiler:
+    """
+    Time-bounded statistical profiler of all threads, written as collapsed stacks
+    """
+
+    # Prefix of the servicer frames used to tag samples by RPC method
+    RPC_PREFIX = "UserService."
+
+    def __init__(self, logger: Logger, output_dir: str = ".", interval: float = 0.01):
+        # Initialize
+        self.logger = logger
+        self.output_dir = output_dir
+        self.interval = interval  # Seconds between two samples
+
+        self._thread: threading.Thread = None
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = 30.0):
+        """
+        Start a profile in the background, ignored if one is already running
+        """
+        if self.running():
+            self.logger.warning(f"{__name__}: Profile is already running")
+            return
+
+        self._thread = threading.Thread(
+            target=self._run, args=(duration,), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+        self.logger.info(f"{__name__}: Profile started for {duration} seconds")
+
+    def _run(self, duration: float):
+        """
+        Sample every thread until the duration ends and write the result
+        """
+        own_id = threading.get_ident()
+        stacks = collections.Counter()
+        samples = 0
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    stacks[self._collapse(names.get(thread_id, thread_id), frame)] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        path = os.path.join(
+            self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+        )
+        try:
+            with open(path, "w") as file:
+                for stack, count in stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+        except OSError as e:
+            self.logger.error(f"{__name__}: Error writing profile {path} - {e}")
+            return
+
+        self.logger.info(f"{__name__}: Profile of {samples} samples written to {path}")
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        """
+        Fold a stack into "method;thread;outer;...;inner"
+        """
+        method = "-"
+        names = list()
+        while frame is not None:
+            code = frame.f_code
+            if code.co_qualname.startswith(self.RPC_PREFIX):
+                method = code.co_qualname[len(self.RPC_PREFIX) :]
+            names.append(
+                f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+
+        names.reverse()
+        return ";".join([method, str(thread_name)] + names)
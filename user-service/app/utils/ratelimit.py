@@ -0,0 +1,110 @@
+# 2024 amicroservice author.
+
+import math
+import time
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets per key, stored as one float and expired by a time wheel
+
+    Each bucket is kept as its theoretical arrival time (GCRA): the moment the
+    bucket will be full again. A key past that moment holds no state, so the
+    wheel drops it, and memory follows the keys active in the last burst window.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_keys: int = 1000000,
+        resolution: float = 1.0,
+    ):
+        # Initialize
+        self.interval = 1.0 / rate  # Seconds to earn one token
+        self.tolerance = burst * self.interval  # Full bucket in seconds
+        self.max_keys = max_keys
+        self.resolution = resolution  # Seconds covered by one wheel slot
+
+        # Theoretical arrival time by key hash
+        self._tat = dict()
+
+        # Wheel of key hashes by the slot in which their bucket is full again
+        self._slots = [set() for _ in range(math.ceil(self.tolerance / resolution) + 2)]
+        self._swept = self._tick(time.monotonic())
+
+    def allow(self, key) -> bool:
+        """
+        Take a token for the key, False if its bucket is empty
+        """
+        now = time.monotonic()
+        self._sweep(now)
+
+        key = hash(key)
+        tat = self._tat.get(key)
+        if tat is None or tat < now:
+            tat = now
+
+        tat += self.interval
+        if tat - now > self.tolerance:
+            return False
+
+        if key not in self._tat and len(self._tat) >= self.max_keys:
+            self._evict()
+
+        self._tat[key] = tat
+        self._slots[self._tick(tat) % len(self._slots)].add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def _tick(self, moment: float) -> int:
+        return int(moment / self.resolution)
+
+    def _sweep(self, now: float):
+        """
+        Drop the keys of every slot the clock has passed
+        """
+        current = self._tick(now)
+        if current == self._swept:
+            return
+
+        # After a long pause every slot is due once
+        for tick in range(
+            max(self._swept, current - len(self._slots)) + 1, current + 1
+        ):
+            self._expire(self._slots[tick % len(self._slots)], now)
+        self._swept = current
+
+    def _expire(self, slot: set, now: float):
+        for key in list(slot):
+            tat = self._tat.get(key)
+            if tat is not None and tat > now:
+                # Pushed later since it was filed, move it to its new slot
+                target = self._slots[self._tick(tat) % len(self._slots)]
+                if target is not slot:
+                    slot.discard(key)
+                    target.add(key)
+                continue
+
+            slot.discard(key)
+            self._tat.pop(key, None)
+
+    def _evict(self):
+        """
+        Make room by dropping the keys closest to a full bucket
+        """
+        for offset in range(1, len(self._slots) + 1):
+            index = (self._swept + offset) % len(self._slots)
+            slot = self._slots[index]
+            while slot and len(self._tat) >= self.max_keys:
+                key = slot.pop()
+
+                # Pushed later since it was filed, still held by its new slot
+                tat = self._tat.get(key)
+                if tat is not None and self._tick(tat) % len(self._slots) != index:
+                    continue
+                self._tat.pop(key, None)
+            if len(self._tat) < self.max_keys:
+                return
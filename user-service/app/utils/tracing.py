@@ -0,0 +1,344 @@
+# 2024 amicroservice author.
+
+import abc
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+
+import grpc
+
+from utils.logger import Logger
+
+
+class Span:
+    """
+    Timed operation, either an RPC or one query inside of it
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "children",
+    )
+
+    def __init__(self, name: str, parent=None, start_ns: int = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = dict()
+        self.children = list()
+
+    def finish(self, end_ns: int = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+
+    def duration(self) -> float:
+        """
+        Duration in seconds
+        """
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class SpanExporter(abc.ABC):
+    """
+    Export finished spans from a background thread, never from the event loop
+    """
+
+    def __init__(self, logger: Logger, max_queue: int = 10000, batch: int = 512):
+        # Initialize
+        self.logger = logger
+        self.batch = batch
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(
+            target=self._run, name=type(self).__name__, daemon=True
+        )
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """
+        Flush the queued spans and stop the thread
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+        if self.dropped:
+            self.logger.warning(f"{__name__}: Dropped {self.dropped} spans")
+
+    def _run(self):
+        while True:
+            spans = [self._queue.get()]
+            while len(spans) < self.batch and not self._queue.empty():
+                spans.append(self._queue.get_nowait())
+
+            stop = None in spans
+            spans = [span for span in spans if span is not None]
+            if spans:
+                try:
+                    self._write(spans)
+                except Exception as e:
+                    self.logger.error(f"{__name__}: Error exporting spans - {e}")
+
+            if stop:
+                return
+
+    @abc.abstractmethod
+    def _write(self, spans: list):
+        """
+        Send a batch of spans, called from the export thread only
+        """
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Append spans as JSON lines to a local file
+    """
+
+    def __init__(self, logger: Logger, path: str):
+        self.path = path
+        super().__init__(logger)
+
+    def _write(self, spans: list):
+        with open(self.path, "a") as file:
+            for span in spans:
+                file.write(json.dumps(span.to_dict()) + "\n")
+
+
+class OtlpSpanExporter(SpanExporter):
+    """
+    Post spans as OTLP/HTTP JSON to a collector endpoint
+    """
+
+    def __init__(self, logger: Logger, endpoint: str, service_name: str = None):
+        self.endpoint = endpoint
+        self.service_name = service_name or "userservice"
+        super().__init__(logger)
+
+    def _write(self, spans: list):
+        flat = list()
+        for span in spans:
+            flat.append(span)
+            flat.extend(span.children)
+
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            self._attribute("service.name", self.service_name)
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [self._span(span) for span in flat],
+                        }
+                    ],
+                }
+            ]
+        }
+
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+
+    def _span(self, span: Span) -> dict:
+        return {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id,
+            "name": span.name,
+            "kind": 2 if not span.parent_id else 3,  # SERVER or CLIENT
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                self._attribute(key, value) for key, value in span.attributes.items()
+            ],
+        }
+
+    def _attribute(self, key: str, value) -> dict:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """
+    Collect query spans under the span of the enclosing RPC and log slow queries
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        exporter: SpanExporter = None,
+        slow_query_threshold: float = 0.2,
+    ):
+        # Initialize
+        self.logger = logger
+        self.exporter = exporter
+        self.slow_query_threshold = slow_query_threshold  # In seconds
+
+        # Span of the RPC handled by the current task
+        self._current = contextvars.ContextVar("rpc_span", default=None)
+
+    def current(self) -> Span:
+        return self._current.get()
+
+    @contextlib.contextmanager
+    def rpc(self, method: str):
+        """
+        Open the span of an RPC for the duration of the block
+        """
+        span = Span(method)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self._current.reset(token)
+            span.finish()
+            if self.exporter:
+                self.exporter.export(span)
+
+    def query(
+        self,
+        name: str,
+        query: str,
+        args: tuple,
+        start_ns: int,
+        end_ns: int,
+        rows: int = None,
+        pool_wait: float = 0.0,
+        error: str = None,
+    ):
+        """
+        Record a query, attached to the enclosing RPC span if there is one
+        """
+        parent = self._current.get()
+        span = Span(name, parent=parent, start_ns=start_ns)
+        span.finish(end_ns)
+        span.attributes["db.statement"] = name
+        span.attributes["db.pool_wait_ms"] = round(pool_wait * 1000, 3)
+        if rows is not None:
+            span.attributes["db.rows"] = rows
+        if error:
+            span.attributes["error"] = error
+
+        if parent:
+            parent.children.append(span)
+        elif self.exporter:
+            self.exporter.export(span)
+
+        duration = span.duration()
+        if duration >= self.slow_query_threshold:
+            params = ", ".join(
+                f"${index}={self.redact(arg)}" for index, arg in enumerate(args, 1)
+            )
+            self.logger.warning(
+                f"{__name__}: Slow query {name} took {duration * 1000:.1f} ms, "
+                f"pool wait {pool_wait * 1000:.1f} ms, rows {rows}: "
+                f"{' '.join(query.split())} [{params}]"
+            )
+
+    def redact(self, value) -> str:
+        """
+        Describe a parameter without revealing its value
+        """
+        if value is None:
+            return "NULL"
+        if isinstance(value, (str, bytes, list, tuple)):
+            return f"<{type(value).__name__}:{len(value)}>"
+        return f"<{type(value).__name__}>"
+
+    def close(self):
+        if self.exporter:
+            self.exporter.close()
+
+
+class TracingInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Open a tracer span around every unary RPC and server stream
+    """
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return handler
+
+        method = handler_call_details.method
+        if handler.unary_stream is not None:
+            return self._traced_stream(method, handler)
+        if handler.unary_unary is None:
+            return handler
+
+        behavior = handler.unary_unary
+
+        async def traced(request, context):
+            with self.tracer.rpc(method):
+                return await behavior(request, context)
+
+        return grpc.unary_unary_rpc_method_handler(
+            traced,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+    def _traced_stream(self, method: str, handler):
+        behavior = handler.unary_stream
+
+        async def traced(request, context):
+            # The span lasts as long as the stream
+            with self.tracer.rpc(method):
+                async for response in behavior(request, context):
+                    yield response
+
+        return grpc.unary_stream_rpc_method_handler(
+            traced,
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )